@@ -0,0 +1,219 @@
+"""Offline batch runner: pre-compute step results for a file of queries.
+
+    python -m app.batch queries.txt --workers 4
+    python -m app.batch requests.jsonl --field title
+
+Search and media preparation (download, frame extraction, UI cropping) run in a
+process pool. OS-Atlas inference runs on a single thread in this process, fed
+with each video as soon as its media is ready, so the model is loaded once and
+the pool keeps searching and preparing media while it runs. Completed queries are appended to a checkpoint so an interrupted run
+resumes where it stopped, and results land in output/video_cache like the API.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from app.utils.cache import extract_video_id, is_video_cached, get_cached_video_result, cache_video_result
+
+BATCH_DIR = "output/batch"
+
+def load_queries(path, field="query"):
+    queries = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                value = record.get(field)
+                if value:
+                    queries.append(value.strip())
+            else:
+                queries.append(line)
+    return list(dict.fromkeys(queries))
+
+def load_checkpoint(checkpoint_file, retry_failed=False):
+    completed = {}
+    if not os.path.exists(checkpoint_file):
+        return completed
+    with open(checkpoint_file, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if retry_failed and record.get("status") == "failed":
+                completed.pop(record["query"], None)
+            else:
+                completed[record["query"]] = record
+    return completed
+
+def append_checkpoint(checkpoint_file, record):
+    record = dict(record, completed_at=datetime.now().isoformat())
+    with open(checkpoint_file, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def search_stage(query):
+    from app.utils.youtube_search import get_best_video
+    start = time.time()
+    candidates = get_best_video(query, return_shortlist=True) or []
+    return {
+        "query": query,
+        "candidates": [{"url": c["url"], "title": c.get("title", "")} for c in candidates],
+        "search_seconds": round(time.time() - start, 2)
+    }
+
+def media_stage(query, candidates):
+    from app.utils.video_download import setup_folders, download_video
+    from app.utils.frame_extraction import extract_relevant_frames
+    from app.utils.ui_crop import extract_ui_screenshots
+
+    timings = {}
+    for candidate in candidates:
+        video_id = extract_video_id(candidate["url"])
+        start = time.time()
+        setup_folders(video_id, "output")
+        video_path, _ = download_video(candidate["url"], output_folder="output/videos", video_id=video_id)
+        timings["download_seconds"] = round(time.time() - start, 2)
+        if not video_path:
+            continue
+
+        start = time.time()
+        frame_count, _ = extract_relevant_frames(video_path, output_folder="output/videos", video_id=video_id)
+        timings["frame_extraction_seconds"] = round(time.time() - start, 2)
+        if frame_count == 0:
+            continue
+
+        start = time.time()
+        extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=video_id)
+        timings["ui_screens_seconds"] = round(time.time() - start, 2)
+        return {"query": query, "video_id": video_id, "status": "ready", "frame_count": frame_count, "timings": timings}
+
+    return {"query": query, "video_id": None, "status": "failed", "error": "no candidate could be downloaded and extracted", "timings": timings}
+
+def inference_stage(query, video_id):
+    from app.utils.osatlas import run_osatlas_optimized
+    start = time.time()
+    result, metrics = run_osatlas_optimized(query, video_id)
+    cache_video_result(video_id, result)
+    return result, round(time.time() - start, 2)
+
+def run_batch(queries, checkpoint_file, workers=4, retry_failed=False):
+    os.makedirs(os.path.dirname(checkpoint_file) or ".", exist_ok=True)
+    completed = load_checkpoint(checkpoint_file, retry_failed)
+    pending = [q for q in queries if q not in completed]
+    print(f"Batch: {len(queries)} queries, {len(queries) - len(pending)} already done, {len(pending)} to run with {workers} workers")
+
+    start = time.time()
+    finished = 0
+    # Queries waiting on each video, from its media stage until its inference finishes
+    in_flight_videos = {}
+    media_outcomes = {}
+
+    def finish(record):
+        nonlocal finished
+        append_checkpoint(checkpoint_file, record)
+        finished += 1
+        elapsed = time.time() - start
+        rate = finished / elapsed * 3600 if elapsed > 0 else 0
+        print(f"[{finished}/{len(pending)}] {record['status']}: {record['query']} ({rate:.1f} queries/hour)")
+
+    # Spawned workers never inherit CUDA state from the inference process
+    context = multiprocessing.get_context("spawn")
+    # One inference thread: its work queue holds the videos whose media is ready
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-inference") as inference:
+        futures = {pool.submit(search_stage, query): ("search", query) for query in pending}
+
+        while futures:
+            done = next(as_completed(futures))
+            stage, key = futures.pop(done)
+            try:
+                outcome = done.result()
+            except Exception as e:
+                print(f"Batch {stage} stage failed: {e}")
+                waiting = [key] if stage == "search" else in_flight_videos.pop(key, [])
+                media = media_outcomes.pop(key, None)
+                for waiting_query in waiting:
+                    record = {"query": waiting_query, "status": "failed", "error": str(e)}
+                    if media is not None:
+                        record["video_id"] = media["video_id"]
+                    finish(record)
+                continue
+
+            if stage == "inference":
+                result, inference_seconds = outcome
+                media = media_outcomes.pop(key)
+                for waiting_query in in_flight_videos.pop(key, []):
+                    finish({
+                        "query": waiting_query,
+                        "status": "done",
+                        "video_id": media["video_id"],
+                        "steps": len(result),
+                        "timings": dict(media["timings"], inference_seconds=inference_seconds)
+                    })
+                continue
+
+            query = outcome["query"]
+            if stage == "search":
+                candidates = outcome["candidates"]
+                if not candidates:
+                    finish({"query": query, "status": "failed", "error": "no suitable video found"})
+                    continue
+
+                video_id = extract_video_id(candidates[0]["url"])
+                if is_video_cached(video_id):
+                    steps = len(get_cached_video_result(video_id) or [])
+                    finish({"query": query, "status": "cached", "video_id": video_id, "steps": steps})
+                elif video_id in in_flight_videos:
+                    # Another query already prepares this video, reuse its result
+                    in_flight_videos[video_id].append(query)
+                else:
+                    in_flight_videos[video_id] = [query]
+                    futures[pool.submit(media_stage, query, candidates)] = ("media", video_id)
+                continue
+
+            if outcome["status"] != "ready":
+                for waiting_query in in_flight_videos.pop(key, [query]):
+                    finish({"query": waiting_query, "status": "failed", "error": outcome.get("error")})
+                continue
+
+            # Queued behind any video already in inference; the loop goes back to dispatching media work
+            media_outcomes[key] = outcome
+            futures[inference.submit(inference_stage, query, outcome["video_id"])] = ("inference", key)
+
+    elapsed = time.time() - start
+    summary = {
+        "queries_total": len(queries),
+        "queries_run": finished,
+        "elapsed_seconds": round(elapsed, 2),
+        "queries_per_hour": round(finished / elapsed * 3600, 2) if elapsed > 0 else 0
+    }
+    print(json.dumps(summary, indent=2))
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-compute step results for a file of queries")
+    parser.add_argument("queries", help="Text file with one query per line, or a .jsonl file")
+    parser.add_argument("--field", default="query", help="JSONL field holding the query text")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to output/batch/<queries name>.checkpoint.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true", help="Run queries again that failed in a previous run")
+    args = parser.parse_args()
+
+    checkpoint_file = args.checkpoint or os.path.join(
+        BATCH_DIR, f"{os.path.splitext(os.path.basename(args.queries))[0]}.checkpoint.jsonl"
+    )
+    queries = load_queries(args.queries, args.field)
+    run_batch(queries, checkpoint_file, workers=args.workers, retry_failed=args.retry_failed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,29 @@
 from fastapi import FastAPI, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional
 from datetime import datetime
 from app.utils.youtube_search import clean_query, get_best_video
 from app.utils.video_download import setup_folders, download_video
 from app.utils.frame_extraction import extract_relevant_frames
 from app.utils.ui_crop import extract_ui_screenshots
 from app.utils.osatlas import run_osatlas, run_osatlas_with_progress
-from app.utils.cache import extract_video_id, get_cached_video_result, cache_video_result, is_video_cached
+from app.utils.cache import extract_video_id, get_cached_video_result, cache_video_result, is_video_cached, video_claims
+from app.utils.prefetch import get_prefetcher
+from app.utils.cpu_pool import get_cpu_pool, CpuPoolBusy
+from app.utils.api_cache import get_api_cache_stats
+from app.utils.output_memo import output_memo
+from app.utils.step_assembly import reprocess_videos
+from app.utils.request_log import log_request, cache_hit_rate_over_time
+from app.utils.cache_warmer import cache_warmer, CACHE_WARMER_ENABLED
+from app.utils.metrics_store import RequestMetrics, metrics_store, aggregate_records
+from app.utils.resource_usage import ResourceMeter
+from app.utils.tracing import start_trace, end_trace, record_span, propagate_context, TRACE_DIR
+from app.utils.metrics_registry import (
+    registry, observe_stage_timings, FRAMES_PER_REQUEST, VIDEO_CACHE_REQUESTS,
+    ACTIVE_REQUESTS, PREFETCH_QUEUE_DEPTH, CPU_POOL_QUEUE_DEPTH, GPU_MEMORY_ALLOCATED, GPU_UTILIZATION
+)
 import os
 import json
 import asyncio
@@ -25,55 +39,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def save_performance_metrics(video_id: str, query: str, step: str, duration: float, additional_data: Dict[str, Any] = None):
-    test_dir = f"test/{video_id}"
-    os.makedirs(test_dir, exist_ok=True)
-    
-    metrics_file = os.path.join(test_dir, "performance_metrics.json")
-    
-    if os.path.exists(metrics_file):
-        with open(metrics_file, 'r') as f:
-            metrics = json.load(f)
-    else:
-        metrics = {
-            "video_id": video_id,
-            "query": query,
-            "created_at": datetime.now().isoformat(),
-            "timing": {},
-            "video_metadata": {},
-            "frame_extraction": {},
-            "osatlas_processing": {},
-            "system_efficiency": {},
-            "step_count": 0,
-            "frame_count": 0,
-            "total_steps_generated": 0
-        }
-    
-    metrics["timing"][step] = {"duration": duration}
-    metrics["last_updated"] = datetime.now().isoformat()
-    
-    if additional_data:
-        if "video_metadata" in additional_data:
-            metrics["video_metadata"].update(additional_data["video_metadata"])
-        if "frame_extraction" in additional_data:
-            metrics["frame_extraction"].update(additional_data["frame_extraction"])
-        if "osatlas_processing" in additional_data:
-            metrics["osatlas_processing"].update(additional_data["osatlas_processing"])
-        if "system_efficiency" in additional_data:
-            metrics["system_efficiency"].update(additional_data["system_efficiency"])
-        if "frame_count" in additional_data:
-            metrics["frame_count"] = additional_data["frame_count"]
-        if "step_count" in additional_data:
-            metrics["total_steps_generated"] = additional_data["step_count"]
-    
-    with open(metrics_file, 'w') as f:
-        json.dump(metrics, f, indent=2)
+@app.on_event("startup")
+async def start_cache_warmer():
+    if CACHE_WARMER_ENABLED:
+        cache_warmer.start()
+
+@app.on_event("startup")
+async def start_cpu_pool():
+    # Spawn and warm the workers before the first request needs them
+    await asyncio.get_running_loop().run_in_executor(None, get_cpu_pool().start)
+
+@app.on_event("shutdown")
+async def stop_cpu_pool():
+    get_cpu_pool().shutdown()
+
+@app.on_event("shutdown")
+async def stop_cache_warmer():
+    cache_warmer.stop()
+
+@app.on_event("shutdown")
+async def flush_metrics_store():
+    metrics_store.flush()
 
 @app.options("/process-query-stream")
 async def options_handler():
     return {"message": "OK"}
 
-async def process_query_with_progress(query: str):
+async def process_query_with_progress(query: str, trace: bool = False):
+    # Metrics are collected in memory and handed to the store once, however the stream ends
+    run_metrics = RequestMetrics(query)
+    request_trace = start_trace(query, sample_rate=1.0 if trace else None)
+    request_start = time.time()
+    try:
+        async for chunk in stream_query_progress(query, run_metrics):
+            yield chunk
+    finally:
+        if request_trace is not None:
+            request_trace.add("request", "pipeline", request_start, time.time(), {"query": query})
+            run_metrics.data["trace_id"] = request_trace.trace_id
+            try:
+                request_trace.save()
+            except Exception as e:
+                print(f"Failed to save trace: {e}")
+        end_trace()
+        metrics_store.submit(run_metrics)
+
+async def stream_query_progress(query: str, run_metrics: RequestMetrics):
     print(f"\n{'='*80}\nPROCESSING QUERY: {query}\n{'='*80}")
     
     timing_metrics = {}
@@ -92,16 +103,23 @@ async def process_query_with_progress(query: str):
     
     time.sleep(0.1)
     
+    # Process-wide CPU, RSS and I/O per stage, reported under system_efficiency.stage_resources
+    stage_resources = {}
+    
     search_start = time.time()
     yield send_progress("video-search", "active", "Searching for relevant video...")
-    best_video = get_best_video(query)
+    with ResourceMeter() as search_meter:
+        candidates = get_best_video(query, return_shortlist=True)
+    stage_resources["video-search"] = search_meter.usage
     search_end = time.time()
+    record_span("video-search", search_start, search_end)
     search_duration = round(search_end - search_start, 2)
     
-    if not best_video:
+    if not candidates:
         yield send_progress("video-search", "error", "No suitable video found.")
         return
     
+    best_video = candidates[0]
     video_id = extract_video_id(best_video['url'])
     timing_metrics["video-search"] = {"duration": search_duration}
     
@@ -113,31 +131,40 @@ async def process_query_with_progress(query: str):
         "views": best_video.get('views', 0)
     })
     
-    video_metadata = {
-        "duration_seconds": best_video.get("duration_seconds", 0),
-        "views": best_video.get("views", 0),
-        "resolution": best_video.get("definition", "unknown"),
-        "relevance_score": best_video.get("relevance_score", 0),
-        "title": best_video.get("title", ""),
-        "url": best_video.get("url", "")
-    }
-    
-    save_performance_metrics(video_id, query, "video-search", search_duration, {
-        "video_metadata": video_metadata
-    })
-    
-    cache_hit = is_video_cached(video_id)
+    prefetcher = get_prefetcher()
+    prefetcher.prefetch(candidates[1:])
+    cpu_pool = get_cpu_pool()
+    # The video whose folders this request owns, see VideoClaims
+    claimed_video = None
     
-    if cache_hit:
-        print(f"Cache hit - using cached results for video: {video_id}")
-        cached_result = get_cached_video_result(video_id)
-        if cached_result:
-            timing_metrics["video-download"] = {"duration": 0.01}
-            timing_metrics["frame-extraction"] = {"duration": 0.01}
-            timing_metrics["ui-screens"] = {"duration": 0.01}
-            timing_metrics["osatlas-processing"] = {"duration": 0.01}
-            overall_end = time.time()
-            timing_metrics["total"] = {"duration": round(overall_end - overall_start, 2)}
+    try:
+        import threading
+        from queue import Queue
+        
+        for candidate_index, best_video in enumerate(candidates):
+            video_id = extract_video_id(best_video['url'])
+            has_next_candidate = candidate_index < len(candidates) - 1
+            
+            if candidate_index > 0:
+                print(f"Falling back to runner-up candidate {candidate_index + 1}: {video_id}")
+                run_metrics.start_candidate(video_id)
+                for stage in ("video-download", "frame-extraction"):
+                    timing_metrics.pop(stage, None)
+                    stage_resources.pop(stage, None)
+                yield send_progress("video-download", "active", f"Trying next video: {best_video['title']}", {
+                    "video_id": video_id,
+                    "title": best_video.get('title', ''),
+                    "url": best_video.get('url', '')
+                })
+            
+            if claimed_video:
+                video_claims.release(claimed_video)
+                claimed_video = None
+            if not video_claims.try_acquire(video_id):
+                yield send_progress("video-download", "active", "Waiting for another job on this video to finish...")
+                while not video_claims.try_acquire(video_id):
+                    await asyncio.sleep(0.2)
+            claimed_video = video_id
             
             video_metadata = {
                 "duration_seconds": best_video.get("duration_seconds", 0),
@@ -145,98 +172,143 @@ async def process_query_with_progress(query: str):
                 "resolution": best_video.get("definition", "unknown"),
                 "relevance_score": best_video.get("relevance_score", 0),
                 "title": best_video.get("title", ""),
-                "url": best_video.get("url", "")
+                "url": best_video.get("url", ""),
+                "candidate_rank": candidate_index + 1
             }
             
-            save_performance_metrics(video_id, query, "video-search", search_duration, {
+            run_metrics.record(video_id, "video-search", search_duration, {
                 "video_metadata": video_metadata,
-                "system_efficiency": {"cache_hit": True}
+                "system_efficiency": {"stage_resources": stage_resources}
             })
-            save_performance_metrics(video_id, query, "video-download", 0.01)
-            save_performance_metrics(video_id, query, "frame-extraction", 0.01)
-            save_performance_metrics(video_id, query, "ui-screens", 0.01)
-            save_performance_metrics(video_id, query, "osatlas-processing", 0.01, {"step_count": len(cached_result)})
-            save_performance_metrics(video_id, query, "total", timing_metrics["total"]["duration"])
-            
-            yield send_progress("video-download", "completed", "Using cached video")
-            yield send_progress("frame-extraction", "completed", "Using cached frames")
-            yield send_progress("ui-screens", "completed", "Using cached UI screens")
-            yield send_progress("osatlas-processing", "completed", f"Loaded {len(cached_result)} cached steps")
-            yield send_progress("complete", "success", f"Analysis complete with {len(cached_result)} cached steps", {"results": cached_result, "timing": timing_metrics, "video_id": video_id, "query": query})
-            return
-    
-    try:
-        download_start = time.time()
-        yield send_progress("video-download", "active", f"Downloading video: {best_video['title']}")
-        setup_folders(video_id, "output")
-        video_path = download_video(best_video["url"], output_folder="output/videos", video_id=video_id)
-        download_end = time.time()
-        download_duration = round(download_end - download_start, 2)
-        timing_metrics["video-download"] = {"duration": download_duration}
-        
-        if not video_path:
-            yield send_progress("video-download", "error", "Failed to download video.")
-            return
-        
-        save_performance_metrics(video_id, query, "video-download", download_duration)
-        yield send_progress("video-download", "completed", f"Video downloaded successfully")
-        
-        frame_start = time.time()
-        yield send_progress("frame-extraction", "active", "Extracting relevant frames...")
-        try:
-            import threading
-            from queue import Queue
-            
-            result_queue = Queue()
-            error_queue = Queue()
-            
-            def extract_frames_thread():
-                try:
-                    result = extract_relevant_frames(video_path, output_folder="output/videos", video_id=video_id)
-                    result_queue.put(result)
-                except Exception as e:
-                    error_queue.put(e)
             
-            extraction_thread = threading.Thread(target=extract_frames_thread)
-            extraction_thread.start()
+            cache_hit = is_video_cached(video_id)
             
-            while extraction_thread.is_alive():
-                yield send_progress("frame-extraction", "active", "Processing frames...")
-                await asyncio.sleep(10)
+            if cache_hit:
+                print(f"Cache hit - using cached results for video: {video_id}")
+                cached_result = get_cached_video_result(video_id)
+                if cached_result:
+                    log_request(query, video_id, cache_hit=True)
+                    timing_metrics["video-download"] = {"duration": 0.01}
+                    timing_metrics["frame-extraction"] = {"duration": 0.01}
+                    timing_metrics["ui-screens"] = {"duration": 0.01}
+                    timing_metrics["osatlas-processing"] = {"duration": 0.01}
+                    overall_end = time.time()
+                    timing_metrics["total"] = {"duration": round(overall_end - overall_start, 2)}
+                    VIDEO_CACHE_REQUESTS.inc(result="hit")
+                    observe_stage_timings(timing_metrics, cache_hit=True)
+                    
+                    run_metrics.record(video_id, "video-search", search_duration, {
+                        "video_metadata": video_metadata,
+                        "system_efficiency": {"cache_hit": True}
+                    })
+                    run_metrics.record(video_id, "video-download", 0.01)
+                    run_metrics.record(video_id, "frame-extraction", 0.01)
+                    run_metrics.record(video_id, "ui-screens", 0.01)
+                    run_metrics.record(video_id, "osatlas-processing", 0.01, {"step_count": len(cached_result)})
+                    run_metrics.record(video_id, "total", timing_metrics["total"]["duration"])
+                    
+                    yield send_progress("video-download", "completed", "Using cached video")
+                    yield send_progress("frame-extraction", "completed", "Using cached frames")
+                    yield send_progress("ui-screens", "completed", "Using cached UI screens")
+                    yield send_progress("osatlas-processing", "completed", f"Loaded {len(cached_result)} cached steps")
+                    yield send_progress("complete", "success", f"Analysis complete with {len(cached_result)} cached steps", {"results": cached_result, "timing": timing_metrics, "video_id": video_id, "query": query})
+                    return
             
-            if not error_queue.empty():
-                error = error_queue.get()
-                raise error
+            download_start = time.time()
+            yield send_progress("video-download", "active", f"Downloading video: {best_video['title']}")
+            setup_folders(video_id, "output")
             
-            frame_result = result_queue.get()
-            frame_end = time.time()
-            frame_duration = round(frame_end - frame_start, 2)
-            timing_metrics["frame-extraction"] = {"duration": frame_duration}
+            with ResourceMeter() as download_meter:
+                prefetched = prefetcher.get(video_id) if candidate_index > 0 else None
+                if prefetched and prefetched[0]:
+                    video_path, download_metrics = prefetched
+                    download_metrics = dict(download_metrics, prefetched=True)
+                else:
+                    video_path, download_metrics = download_video(best_video["url"], output_folder="output/videos", video_id=video_id)
+            stage_resources["video-download"] = download_meter.usage
+            download_end = time.time()
+            record_span("video-download", download_start, download_end, video_id=video_id)
+            download_duration = round(download_end - download_start, 2)
+            timing_metrics["video-download"] = {"duration": download_duration}
             
-            if isinstance(frame_result, tuple):
-                frame_count, frame_metrics = frame_result
-            else:
-                frame_count = frame_result
-                frame_metrics = {}
+            if not video_path:
+                if has_next_candidate:
+                    continue
+                yield send_progress("video-download", "error", "Failed to download video.")
+                return
             
-            save_performance_metrics(video_id, query, "frame-extraction", frame_duration, {
-                "frame_count": frame_count,
-                "frame_extraction": frame_metrics
+            run_metrics.record(video_id, "video-download", download_duration, {
+                "video_download": dict(download_metrics, fallback_candidates_used=candidate_index)
             })
-            yield send_progress("frame-extraction", "completed", f"Extracted {frame_count} frames")
+            yield send_progress("video-download", "completed", f"Video downloaded successfully")
             
-        except Exception as e:
-            yield send_progress("frame-extraction", "error", f"Frame extraction failed: {str(e)}")
-            return
+            frame_start = time.time()
+            yield send_progress("frame-extraction", "active", "Extracting relevant frames...")
+            try:
+                frame_meter = ResourceMeter().start()
+                try:
+                    extraction = asyncio.wrap_future(cpu_pool.submit(extract_relevant_frames, video_path, output_folder="output/videos", video_id=video_id))
+                    while not extraction.done():
+                        yield send_progress("frame-extraction", "active", "Processing frames...")
+                        await asyncio.wait({extraction}, timeout=10)
+                finally:
+                    stage_resources["frame-extraction"] = frame_meter.stop()
+                
+                frame_result, worker_usage = extraction.result()
+                stage_resources["frame-extraction"].update(worker_usage)
+                frame_end = time.time()
+                record_span("frame-extraction", frame_start, frame_end, video_id=video_id)
+                frame_duration = round(frame_end - frame_start, 2)
+                timing_metrics["frame-extraction"] = {"duration": frame_duration}
+                
+                if isinstance(frame_result, tuple):
+                    frame_count, frame_metrics = frame_result
+                else:
+                    frame_count = frame_result
+                    frame_metrics = {}
+                FRAMES_PER_REQUEST.observe(frame_count)
+                
+                run_metrics.record(video_id, "frame-extraction", frame_duration, {
+                    "frame_count": frame_count,
+                    "frame_extraction": frame_metrics
+                })
+                
+                if frame_count == 0 and has_next_candidate:
+                    print(f"No frames extracted from {video_id}, trying next candidate")
+                    continue
+                
+                yield send_progress("frame-extraction", "completed", f"Extracted {frame_count} frames")
+                
+            except CpuPoolBusy as e:
+                yield send_progress("frame-extraction", "error", f"Server busy: {str(e)}")
+                return
+            except Exception as e:
+                if has_next_candidate:
+                    print(f"Frame extraction failed for {video_id}: {e}, trying next candidate")
+                    continue
+                yield send_progress("frame-extraction", "error", f"Frame extraction failed: {str(e)}")
+                return
+            
+            break
+        
+        prefetcher.release(candidates)
         
         ui_start = time.time()
         yield send_progress("ui-screens", "active", "Extracting UI screens...")
-        extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=video_id)
+        try:
+            with ResourceMeter() as ui_meter:
+                ui_metrics, worker_usage = await asyncio.wrap_future(
+                    cpu_pool.submit(extract_ui_screenshots, input_folder="output/videos", output_folder="output/videos", video_id=video_id))
+        except CpuPoolBusy as e:
+            yield send_progress("ui-screens", "error", f"Server busy: {str(e)}")
+            return
+        stage_resources["ui-screens"] = dict(ui_meter.usage, **worker_usage)
         ui_end = time.time()
+        record_span("ui-screens", ui_start, ui_end)
         ui_duration = round(ui_end - ui_start, 2)
         timing_metrics["ui-screens"] = {"duration": ui_duration}
         
-        save_performance_metrics(video_id, query, "ui-screens", ui_duration)
+        run_metrics.record(video_id, "ui-screens", ui_duration, {"ui_screens": ui_metrics or {}})
         yield send_progress("ui-screens", "completed", "UI screens extracted successfully")
         
         osatlas_start = time.time()
@@ -260,7 +332,8 @@ async def process_query_with_progress(query: str):
                 except Exception as e:
                     error_queue.put(e)
             
-            osatlas_thread_obj = threading.Thread(target=osatlas_thread)
+            osatlas_thread_obj = threading.Thread(target=propagate_context(osatlas_thread), name="osatlas")
+            osatlas_meter = ResourceMeter().start()
             osatlas_thread_obj.start()
             
             while osatlas_thread_obj.is_alive() or not progress_queue.empty():
@@ -271,6 +344,7 @@ async def process_query_with_progress(query: str):
                 await asyncio.sleep(0.1)
             
             osatlas_thread_obj.join()
+            stage_resources["osatlas-processing"] = osatlas_meter.stop()
             
             if not error_queue.empty():
                 error = error_queue.get()
@@ -278,6 +352,7 @@ async def process_query_with_progress(query: str):
             
             osatlas_result = result_queue.get()
             osatlas_end = time.time()
+            record_span("osatlas-processing", osatlas_start, osatlas_end)
             osatlas_duration = round(osatlas_end - osatlas_start, 2)
             timing_metrics["osatlas-processing"] = {"duration": osatlas_duration}
             
@@ -297,17 +372,19 @@ async def process_query_with_progress(query: str):
             except:
                 gpu_memory = {}
             
-            save_performance_metrics(video_id, query, "osatlas-processing", osatlas_duration, {
+            run_metrics.record(video_id, "osatlas-processing", osatlas_duration, {
                 "step_count": len(result),
                 "osatlas_processing": osatlas_metrics,
                 "system_efficiency": {
                     "cache_hit": False,
-                    "gpu_memory": gpu_memory
+                    "gpu_memory": gpu_memory,
+                    "stage_resources": stage_resources
                 }
             })
             yield send_progress("osatlas-processing", "completed", f"Generated {len(result)} steps")
             
             cache_video_result(video_id, result)
+            log_request(query, video_id, cache_hit=False)
             
         except Exception as e:
             yield send_progress("osatlas-processing", "error", f"OS-Atlas processing failed: {str(e)}")
@@ -316,8 +393,10 @@ async def process_query_with_progress(query: str):
         overall_end = time.time()
         total_duration = round(overall_end - overall_start, 2)
         timing_metrics["total"] = {"duration": total_duration}
+        VIDEO_CACHE_REQUESTS.inc(result="miss")
+        observe_stage_timings(timing_metrics)
         
-        save_performance_metrics(video_id, query, "total", total_duration)
+        run_metrics.record(video_id, "total", total_duration)
         print(f"Analysis complete: {len(result)} steps generated in {total_duration}s")
         yield send_progress("complete", "success", f"Analysis complete with {len(result)} steps", {"results": result, "timing": timing_metrics, "video_id": video_id, "query": query})
         yield "data: {\"step\": \"stream-end\", \"status\": \"closed\"}\n\n"
@@ -325,29 +404,78 @@ async def process_query_with_progress(query: str):
     except Exception as e:
         yield send_progress("error", "error", f"Analysis failed: {str(e)}")
         yield "data: {\"step\": \"stream-end\", \"status\": \"error\"}\n\n"
+    finally:
+        # Every exit, including a busy CPU pool, hands unused runner-up downloads back to the prefetcher
+        prefetcher.release(candidates)
+        if claimed_video:
+            video_claims.release(claimed_video)
+
+async def track_active_request(stream):
+    # The cache warmer only runs while no user request is in flight
+    cache_warmer.request_started()
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        cache_warmer.request_finished()
 
 @app.post("/process-query")
 async def process_query(query: str = Form(...)):
-    best_video = get_best_video(query)
-    if not best_video:
+    cache_warmer.request_started()
+    try:
+        # Off the event loop, so streaming requests holding a video claim this one waits for keep running
+        return await asyncio.get_running_loop().run_in_executor(None, propagate_context(run_process_query), query)
+    finally:
+        cache_warmer.request_finished()
+
+def run_process_query(query: str):
+    candidates = get_best_video(query, return_shortlist=True)
+    if not candidates:
         return {"error": "No suitable video found."}
     
-    video_id = extract_video_id(best_video["url"])
-    setup_folders(video_id, "output")
+    prefetcher = get_prefetcher()
+    prefetcher.prefetch(candidates[1:])
     
-    video_path = download_video(best_video["url"], output_folder="output/videos", video_id=video_id)
+    video_path = None
+    try:
+        for candidate_index, best_video in enumerate(candidates):
+            video_id = extract_video_id(best_video["url"])
+            video_claims.acquire(video_id)
+            setup_folders(video_id, "output")
+            
+            try:
+                prefetched = prefetcher.get(video_id) if candidate_index > 0 else None
+                if prefetched and prefetched[0]:
+                    video_path = prefetched[0]
+                else:
+                    video_path, _ = download_video(best_video["url"], output_folder="output/videos", video_id=video_id)
+            finally:
+                if not video_path:
+                    video_claims.release(video_id)
+            if video_path:
+                break
+    finally:
+        prefetcher.release(candidates)
     if not video_path:
         return {"error": "Video download failed."}
+    
+    try:
+        return process_downloaded_video(query, video_id, video_path)
+    finally:
+        video_claims.release(video_id)
 
-    extract_relevant_frames(video_path, output_folder="output/videos", video_id=video_id)
-    extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=video_id)
+def process_downloaded_video(query, video_id, video_path):
+    cpu_pool = get_cpu_pool()
+    cpu_pool.run(extract_relevant_frames, video_path, output_folder="output/videos", video_id=video_id)
+    cpu_pool.run(extract_ui_screenshots, input_folder="output/videos", output_folder="output/videos", video_id=video_id)
     result = run_osatlas(query, video_id)
+    log_request(query, video_id, cache_hit=False)
     return result
 
 @app.get("/process-query-stream")
-async def process_query_stream(query: str):
+async def process_query_stream(query: str, trace: bool = False):
     return StreamingResponse(
-        process_query_with_progress(query),
+        track_active_request(process_query_with_progress(query, trace)),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -365,6 +493,46 @@ async def process_query_stream(query: str):
 async def health_check():
     return {"status": "healthy"}
 
+def gpu_memory_allocated():
+    import torch
+    return torch.cuda.memory_allocated(0) if torch.cuda.is_available() else None
+
+def gpu_utilization():
+    import torch
+    return torch.cuda.utilization(0) if torch.cuda.is_available() else None
+
+ACTIVE_REQUESTS.set_function(lambda: cache_warmer.active_requests)
+PREFETCH_QUEUE_DEPTH.set_function(lambda: get_prefetcher().pending_count())
+CPU_POOL_QUEUE_DEPTH.set_function(lambda: get_cpu_pool().queue_depth())
+GPU_MEMORY_ALLOCATED.set_function(gpu_memory_allocated)
+GPU_UTILIZATION.set_function(gpu_utilization)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def list_traces(limit: int = 20):
+    if not os.path.exists(TRACE_DIR):
+        return {"traces": []}
+    trace_files = sorted((f for f in os.listdir(TRACE_DIR) if f.endswith(".json")), reverse=True)[:limit]
+    return {"traces": [os.path.splitext(f)[0] for f in trace_files]}
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    trace_path = os.path.join(TRACE_DIR, f"{os.path.basename(trace_id)}.json")
+    if not os.path.exists(trace_path):
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FileResponse(trace_path, media_type="application/json")
+
+@app.get("/performance/summary")
+async def performance_summary(hours: Optional[int] = None, query: Optional[str] = None):
+    since = time.time() - hours * 3600 if hours else None
+    records = metrics_store.load_records(since=since)
+    if query:
+        records = [r for r in records if query.lower() in r.get("query", "").lower()]
+    return aggregate_records(records)
+
 @app.get("/memory")
 async def memory_check():
     try:
@@ -394,9 +562,20 @@ async def get_cache_stats():
         cache_files = [f for f in os.listdir(cache_dir) if f.endswith('.json')]
         return {
             "cached_videos": len(cache_files),
-            "cache_directory": cache_dir
+            "cache_directory": cache_dir,
+            "api_cache": get_api_cache_stats(),
+            "osatlas_memo": output_memo.get_stats()
         }
-    return {"cached_videos": 0, "cache_directory": cache_dir}
+    return {"cached_videos": 0, "cache_directory": cache_dir, "api_cache": get_api_cache_stats(), "osatlas_memo": output_memo.get_stats()}
+
+@app.get("/cache/hit-rate")
+async def get_cache_hit_rate(bucket_minutes: int = 60, hours: Optional[int] = None):
+    since = time.time() - hours * 3600 if hours else None
+    return {
+        "bucket_minutes": bucket_minutes,
+        "buckets": cache_hit_rate_over_time(bucket_seconds=max(1, bucket_minutes) * 60, since=since),
+        "warmer": cache_warmer.status()
+    }
 
 @app.post("/cache/clear")
 async def clear_cache():
@@ -407,6 +586,12 @@ async def clear_cache():
         os.makedirs(cache_dir, exist_ok=True)
     return {"message": "Cache cleared successfully"}
 
+@app.post("/cache/reprocess")
+async def reprocess_cache(video_id: Optional[str] = None):
+    # Replays stored model outputs through the current filtering rules, no GPU involved
+    video_ids = [video_id] if video_id else None
+    return await asyncio.get_running_loop().run_in_executor(None, reprocess_videos, video_ids)
+
 @app.get("/")
 async def root():
     return {"message": "API is running", "root_path": "/api-vnava22"}
@@ -0,0 +1,47 @@
+"""Rebuild step results from stored OS-Atlas outputs without loading the model.
+
+    python -m app.reprocess VIDEO_ID [VIDEO_ID ...]
+    python -m app.reprocess --all
+
+Each OS-Atlas run writes the raw output of every frame it sent to the model to
+output/videos/<video_id>/os_atlas_steps/raw_outputs.json. Reprocessing replays
+those outputs through the current filtering rules, rewrites the step folders
+and images and updates output/video_cache, so a rule change reaches every
+cached video in seconds. Videos processed before raw outputs were stored are
+listed and left untouched, as are videos whose rebuild fails.
+"""
+import argparse
+import json
+import sys
+import time
+from app.utils.step_assembly import reprocess_videos
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild cached step results from stored model outputs")
+    parser.add_argument("video_ids", nargs="*", help="Videos to reprocess")
+    parser.add_argument("--all", action="store_true", help="Reprocess every cached video")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if not args.video_ids and not args.all:
+        parser.error("pass video ids or --all")
+
+    start = time.time()
+    report = reprocess_videos(None if args.all else args.video_ids)
+
+    print(f"{'video_id':<16} {'steps':>6} {'frames':>7} {'seconds':>8}")
+    for video_id, metrics in report["reprocessed"].items():
+        print(f"{video_id:<16} {metrics['total_steps']:>6} {metrics['frames_processed']:>7} {metrics['reprocess_seconds']:>8.2f}")
+    if report["missing_outputs"]:
+        print(f"No stored outputs for {len(report['missing_outputs'])} videos: {', '.join(report['missing_outputs'])}")
+    for video_id, error in report["errors"].items():
+        print(f"Failed to reprocess {video_id}, previous result kept: {error}")
+    print(f"Reprocessed {len(report['reprocessed'])} videos in {time.time() - start:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import torch
+from transformers import LogitsProcessor
+
+MAX_THOUGHT_CHARS = 300
+MAX_TEXT_CHARS = 80
+
+DIGITS = frozenset("0123456789")
+LETTERS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+def lit(text):
+    return ("lit", text)
+
+def run(chars, min_len, max_len, negate=False):
+    return ("run", frozenset(chars), min_len, max_len, negate)
+
+POINT = [lit("<point>["), run(DIGITS, 1, 4), lit(","), run(" ", 0, 1), run(DIGITS, 1, 4), lit("]</point>")]
+
+THOUGHT = [lit("Thought: "), run("\n<", 1, MAX_THOUGHT_CHARS, negate=True), lit("\nAction: ")]
+
+# Mirrors the "Action Formats" section of sys_prompt
+ACTIONS = [
+    [lit("CLICK "), *POINT],
+    [lit("TYPE ["), run("\n[]<", 1, MAX_TEXT_CHARS, negate=True), lit("] "), *POINT],
+    [lit("TYPE "), run("\n[]<", 1, MAX_TEXT_CHARS, negate=True), *POINT],
+    [lit("SLIDE [LEFT] "), *POINT],
+    [lit("SLIDE [RIGHT] "), *POINT],
+    [lit("SCROLL")],
+    [lit("SCROLL ["), run(LETTERS, 2, 5), lit("]")],
+    [lit("SCROLL ["), run(LETTERS, 2, 5), lit("] "), *POINT],
+    [lit("OPEN_APP ["), run("\n]<", 1, 40, negate=True), lit("]")],
+    [lit("WAIT")],
+    [lit("COMPLETE")],
+    [lit("PRESS_BACK")],
+    [lit("PRESS_HOME")],
+    [lit("SKIP")],
+]
+
+SEQUENCES = [THOUGHT + action for action in ACTIONS]
+
+def closure(states):
+    result = set()
+    pending = list(states)
+    while pending:
+        state = pending.pop()
+        if state in result:
+            continue
+        result.add(state)
+        seq_index, seg_index, count = state
+        sequence = SEQUENCES[seq_index]
+        if seg_index >= len(sequence):
+            continue
+        segment = sequence[seg_index]
+        if segment[0] == "lit":
+            if count == len(segment[1]):
+                pending.append((seq_index, seg_index + 1, 0))
+        elif count >= segment[2]:
+            pending.append((seq_index, seg_index + 1, 0))
+    return frozenset(result)
+
+def advance(states, text):
+    for ch in text:
+        next_states = set()
+        for seq_index, seg_index, count in states:
+            sequence = SEQUENCES[seq_index]
+            if seg_index >= len(sequence):
+                continue
+            segment = sequence[seg_index]
+            if segment[0] == "lit":
+                if count < len(segment[1]) and segment[1][count] == ch:
+                    next_states.add((seq_index, seg_index, count + 1))
+            else:
+                _, chars, _, max_len, negate = segment
+                if count < max_len and (ch in chars) != negate:
+                    next_states.add((seq_index, seg_index, count + 1))
+        if not next_states:
+            return frozenset()
+        states = closure(next_states)
+    return states
+
+def is_complete(states):
+    return any(seg_index >= len(SEQUENCES[seq_index]) for seq_index, seg_index, _ in states)
+
+INITIAL_STATES = closure((i, 0, 0) for i in range(len(SEQUENCES)))
+
+def matches_grammar(text):
+    return is_complete(advance(INITIAL_STATES, text))
+
+_token_text_cache = {}
+
+def token_text(tokenizer, token_id):
+    key = (id(tokenizer), token_id)
+    text = _token_text_cache.get(key)
+    if text is None:
+        text = tokenizer.decode([token_id], skip_special_tokens=False, clean_up_tokenization_spaces=False)
+        _token_text_cache[key] = text
+    return text
+
+class ActionGrammarLogitsProcessor(LogitsProcessor):
+    def __init__(self, tokenizer, prompt_length, eos_token_ids, top_k=40, max_widen=3):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.eos_token_ids = set(eos_token_ids)
+        self.top_k = top_k
+        self.max_widen = max_widen
+        # Per row: the generated ids seen on the last call and the grammar states after each of them
+        self.row_tokens = {}
+        self.row_history = {}
+        self.fallback_steps = 0
+
+    def row_state(self, row, token_ids):
+        # input_ids do not only grow: assisted decoding rolls back rejected draft tokens and runs
+        # this processor inside the draft model's generate too, so resume from the shared prefix
+        previous = self.row_tokens.get(row, [])
+        history = self.row_history.get(row, [INITIAL_STATES])
+        shared = 0
+        limit = min(len(previous), len(token_ids))
+        while shared < limit and previous[shared] == token_ids[shared]:
+            shared += 1
+        history = history[:shared + 1]
+        states = history[-1]
+        for token_id in token_ids[shared:]:
+            if token_id not in self.eos_token_ids:
+                states = advance(states, token_text(self.tokenizer, token_id))
+            history.append(states)
+        self.row_tokens[row] = list(token_ids)
+        self.row_history[row] = history
+        return states
+
+    def allowed_tokens(self, states, row_scores):
+        complete = is_complete(states)
+        k = self.top_k
+        for _ in range(self.max_widen):
+            k = min(k, row_scores.shape[-1])
+            candidates = torch.topk(row_scores, k).indices.tolist()
+            allowed = []
+            for token_id in candidates:
+                if token_id in self.eos_token_ids:
+                    if complete:
+                        allowed.append(token_id)
+                elif advance(states, token_text(self.tokenizer, token_id)):
+                    allowed.append(token_id)
+            if allowed:
+                return allowed
+            if k == row_scores.shape[-1]:
+                break
+            k *= 10
+        return None
+
+    def __call__(self, input_ids, scores):
+        for row in range(input_ids.shape[0]):
+            generated = input_ids[row, self.prompt_length:].tolist()
+            states = self.row_state(row, generated)
+            allowed = self.allowed_tokens(states, scores[row]) if states else None
+            if not allowed:
+                # Nothing in the widened candidate set continues the grammar - end the generation
+                self.fallback_steps += 1
+                allowed = sorted(self.eos_token_ids)
+            mask = torch.full_like(scores[row], float("-inf"))
+            mask[allowed] = 0
+            scores[row] = scores[row] + mask
+        return scores
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from datetime import date
+from app.utils.metrics_registry import YOUTUBE_API_CALLS, YOUTUBE_API_CACHE
+
+API_CACHE_DIR = "output/api_cache"
+
+# endpoint -> (fresh ttl seconds, max stale age seconds, quota units per call)
+ENDPOINT_POLICIES = {
+    "search": (6 * 3600, 7 * 24 * 3600, 100),
+    "videos": (15 * 60, 24 * 3600, 1),
+}
+DEFAULT_POLICY = (15 * 60, 3600, 1)
+
+# YouTube Data API default daily allocation; the API resets at midnight Pacific time,
+# the ledger uses the local date as an approximation
+DAILY_QUOTA_UNITS = int(os.environ.get("YOUTUBE_DAILY_QUOTA", "10000"))
+QUOTA_LEDGER_FILE = os.path.join(API_CACHE_DIR, "quota_ledger.json")
+
+# Request parameters that do not change the response
+IGNORED_PARAMS = {"key"}
+
+stats_lock = threading.Lock()
+quota_lock = threading.Lock()
+refresh_lock = threading.Lock()
+refreshing = set()
+
+api_cache_stats = {
+    "hits": 0,
+    "stale_hits": 0,
+    "misses": 0,
+    "background_refreshes": 0,
+    "quota_units_spent": 0,
+    "quota_units_saved": 0,
+    "cache_only_lookups": 0,
+}
+
+def record_stat(name, amount=1):
+    with stats_lock:
+        api_cache_stats[name] += amount
+
+def get_api_cache_stats():
+    with stats_lock:
+        stats = dict(api_cache_stats)
+    lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+    stats["lookups"] = lookups
+    stats["hit_rate_percent"] = round((stats["hits"] + stats["stale_hits"]) / lookups * 100, 2) if lookups else 0
+    stats["daily_quota_remaining"] = quota_remaining()
+    return stats
+
+def load_quota_ledger():
+    today = date.today().isoformat()
+    ledger = read_cache_entry(QUOTA_LEDGER_FILE)
+    if not ledger or ledger.get("date") != today:
+        ledger = {"date": today, "units_spent": 0}
+    return ledger
+
+def record_quota(units):
+    with quota_lock:
+        ledger = load_quota_ledger()
+        ledger["units_spent"] += units
+        os.makedirs(API_CACHE_DIR, exist_ok=True)
+        with open(QUOTA_LEDGER_FILE, 'w') as f:
+            json.dump(ledger, f)
+
+def quota_remaining():
+    with quota_lock:
+        ledger = load_quota_ledger()
+    return max(0, DAILY_QUOTA_UNITS - ledger["units_spent"])
+
+def normalize_params(params):
+    normalized = {}
+    for name, value in params.items():
+        if name in IGNORED_PARAMS:
+            continue
+        if name == "q":
+            value = " ".join(str(value).lower().split())
+        elif name == "id":
+            value = ",".join(sorted(str(value).split(",")))
+        normalized[name] = str(value)
+    return normalized
+
+def cache_path(endpoint, params):
+    key = json.dumps(normalize_params(params), sort_keys=True)
+    digest = hashlib.sha256(f"{endpoint}:{key}".encode()).hexdigest()[:32]
+    return os.path.join(API_CACHE_DIR, endpoint, f"{digest}.json")
+
+def read_cache_entry(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def write_cache_entry(path, response):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({"fetched_at": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Failed to write API cache entry: {e}")
+
+def fetch_and_store(url, params, path, quota_cost):
+    YOUTUBE_API_CALLS.inc(endpoint=url.rstrip("/").rsplit("/", 1)[-1])
+    response = requests.get(url, params=params).json()
+    record_stat("quota_units_spent", quota_cost)
+    record_quota(quota_cost)
+    if "error" not in response:
+        write_cache_entry(path, response)
+    return response
+
+def refresh_in_background(url, params, path, quota_cost):
+    with refresh_lock:
+        if path in refreshing:
+            return
+        refreshing.add(path)
+
+    def refresh():
+        try:
+            fetch_and_store(url, params, path, quota_cost)
+            record_stat("background_refreshes")
+        except Exception as e:
+            print(f"Background refresh of {url} failed: {e}")
+        finally:
+            with refresh_lock:
+                refreshing.discard(path)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+def cached_api_get(url, params, cache_only=False):
+    endpoint = url.rstrip("/").rsplit("/", 1)[-1]
+    ttl, max_stale, quota_cost = ENDPOINT_POLICIES.get(endpoint, DEFAULT_POLICY)
+    path = cache_path(endpoint, params)
+
+    entry = read_cache_entry(path)
+    if cache_only:
+        # Quota is exhausted - any cached copy is better than no answer
+        record_stat("cache_only_lookups")
+        YOUTUBE_API_CACHE.inc(endpoint=endpoint, result="hit" if entry is not None else "miss")
+        if entry is None:
+            return None
+        record_stat("quota_units_saved", quota_cost)
+        return entry["response"]
+
+    if entry is not None:
+        age = time.time() - entry.get("fetched_at", 0)
+        if age <= ttl:
+            record_stat("hits")
+            YOUTUBE_API_CACHE.inc(endpoint=endpoint, result="hit")
+            record_stat("quota_units_saved", quota_cost)
+            return entry["response"]
+        if age <= max_stale:
+            # Serve the stale copy now and refresh it for the next caller
+            record_stat("stale_hits")
+            YOUTUBE_API_CACHE.inc(endpoint=endpoint, result="stale")
+            record_stat("quota_units_saved", quota_cost)
+            refresh_in_background(url, params, path, quota_cost)
+            return entry["response"]
+
+    record_stat("misses")
+    YOUTUBE_API_CACHE.inc(endpoint=endpoint, result="miss")
+    return fetch_and_store(url, params, path, quota_cost)
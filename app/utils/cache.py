@@ -2,6 +2,7 @@ import os
 import json
 import hashlib
 import re
+import threading
 from urllib.parse import urlparse, parse_qs
 
 def extract_video_id(video_url):
@@ -40,4 +41,36 @@ def cache_video_result(video_id, result):
 
 def is_video_cached(video_id):
     cache_file = f"output/video_cache/{video_id}.json"
-    return os.path.exists(cache_file)
\ No newline at end of file
+    return os.path.exists(cache_file)
+
+class VideoClaims:
+    """Video ids whose output/videos/<id> folder a request or the cache warmer is writing.
+
+    setup_folders wipes a video's stage folders, so only the claim holder may prepare or
+    process that video; everyone else waits for the claim or skips the video.
+    """
+
+    def __init__(self):
+        self.claimed = set()
+        self.condition = threading.Condition()
+
+    def acquire(self, video_id, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: video_id not in self.claimed, timeout):
+                return False
+            self.claimed.add(video_id)
+            return True
+
+    def try_acquire(self, video_id):
+        return self.acquire(video_id, timeout=0)
+
+    def release(self, video_id):
+        with self.condition:
+            self.claimed.discard(video_id)
+            self.condition.notify_all()
+
+    def is_claimed(self, video_id):
+        with self.condition:
+            return video_id in self.claimed
+
+video_claims = VideoClaims()
@@ -0,0 +1,198 @@
+import os
+import glob
+import json
+import time
+import threading
+from app.utils.cache import extract_video_id, is_video_cached, cache_video_result, video_claims
+from app.utils.request_log import read_request_log, normalize_query, log_request
+
+CACHE_WARMER_ENABLED = os.environ.get("CACHE_WARMER_ENABLED", "0") == "1"
+# No user request for this long counts as an idle window
+IDLE_SECONDS = int(os.environ.get("CACHE_WARMER_IDLE_SECONDS", "120"))
+POLL_SECONDS = 5
+# Request log entries lose half their weight every day, so trending queries outrank old favourites
+HALF_LIFE_SECONDS = 24 * 3600
+HISTORICAL_METRICS_WEIGHT = 0.5
+MIN_QUERY_SCORE = 0.5
+RETRY_AFTER_SECONDS = 6 * 3600
+
+class WarmingInterrupted(Exception):
+    pass
+
+class CacheWarmer:
+    def __init__(self, idle_seconds=IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.active_requests = 0
+        self.last_request_at = time.time()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.attempted = {}
+        self.stats = {"warmed": 0, "already_cached": 0, "video_busy": 0, "interrupted": 0, "failed": 0}
+        self.current_query = None
+
+    def request_started(self):
+        with self.lock:
+            self.active_requests += 1
+            self.last_request_at = time.time()
+
+    def request_finished(self):
+        with self.lock:
+            self.active_requests = max(0, self.active_requests - 1)
+            self.last_request_at = time.time()
+
+    def is_idle(self):
+        with self.lock:
+            return self.active_requests == 0 and time.time() - self.last_request_at >= self.idle_seconds
+
+    def should_yield(self):
+        with self.lock:
+            return self.active_requests > 0 or self.stop_event.is_set()
+
+    def checkpoint(self):
+        if self.should_yield():
+            raise WarmingInterrupted()
+
+    def mine_queries(self):
+        now = time.time()
+        scores = {}
+        originals = {}
+
+        for entry in read_request_log(since=now - 14 * HALF_LIFE_SECONDS):
+            if entry.get("source") != "user" or not entry.get("query"):
+                continue
+            key = normalize_query(entry["query"])
+            weight = 0.5 ** ((now - entry["timestamp"]) / HALF_LIFE_SECONDS)
+            scores[key] = scores.get(key, 0.0) + weight
+            originals[key] = entry["query"]
+
+        for metrics_file in glob.glob("test/*/performance_metrics.json"):
+            try:
+                with open(metrics_file, 'r') as f:
+                    query = json.load(f).get("query")
+            except Exception:
+                continue
+            if query:
+                key = normalize_query(query)
+                scores[key] = scores.get(key, 0.0) + HISTORICAL_METRICS_WEIGHT
+                originals.setdefault(key, query)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [(originals[key], score) for key, score in ranked if score >= MIN_QUERY_SCORE]
+
+    def next_query(self):
+        now = time.time()
+        for query, score in self.mine_queries():
+            key = normalize_query(query)
+            if now - self.attempted.get(key, 0) >= RETRY_AFTER_SECONDS:
+                return query
+        return None
+
+    def warm(self, query):
+        from app.utils.youtube_search import get_best_video
+
+        self.attempted[normalize_query(query)] = time.time()
+        candidates = get_best_video(query, return_shortlist=True)
+        if not candidates:
+            return "failed"
+
+        video_id = extract_video_id(candidates[0]["url"])
+        if is_video_cached(video_id):
+            return "already_cached"
+
+        # A request may be writing this video's folders, leave it to the request
+        if not video_claims.try_acquire(video_id):
+            return "video_busy"
+        try:
+            return self.warm_video(query, candidates[0], video_id)
+        finally:
+            video_claims.release(video_id)
+
+    def warm_video(self, query, candidate, video_id):
+        from app.utils.video_download import setup_folders, download_video
+        from app.utils.frame_extraction import extract_relevant_frames
+        from app.utils.ui_crop import extract_ui_screenshots
+        from app.utils.cpu_pool import get_cpu_pool, CpuPoolBusy
+        from app.utils.osatlas import run_osatlas_optimized
+
+        # Another warm-up or request may have finished it while the claim was free
+        if is_video_cached(video_id):
+            return "already_cached"
+
+        self.checkpoint()
+        setup_folders(video_id, "output")
+        video_path, _ = download_video(candidate["url"], output_folder="output/videos", video_id=video_id)
+        if not video_path:
+            return "failed"
+
+        # Same worker processes as requests, so warming cannot oversubscribe the CPU next to them
+        cpu_pool = get_cpu_pool()
+        try:
+            self.checkpoint()
+            (frame_count, _), _ = cpu_pool.run(extract_relevant_frames, video_path, output_folder="output/videos", video_id=video_id)
+            if frame_count == 0:
+                return "failed"
+
+            self.checkpoint()
+            cpu_pool.run(extract_ui_screenshots, input_folder="output/videos", output_folder="output/videos", video_id=video_id)
+        except CpuPoolBusy:
+            # Requests have the pool saturated, retry in a later idle window
+            raise WarmingInterrupted()
+
+        self.checkpoint()
+        result, metrics = run_osatlas_optimized(query, video_id, should_stop=self.should_yield)
+        if metrics.get("interrupted"):
+            raise WarmingInterrupted()
+
+        cache_video_result(video_id, result)
+        log_request(query, video_id, cache_hit=False, source="warmer")
+        return "warmed"
+
+    def run(self):
+        print(f"Cache warmer started (idle window {self.idle_seconds}s)")
+        while not self.stop_event.wait(POLL_SECONDS):
+            if not self.is_idle():
+                continue
+
+            query = self.next_query()
+            if not query:
+                continue
+
+            self.current_query = query
+            print(f"Cache warmer: warming '{query}'")
+            try:
+                outcome = self.warm(query)
+            except WarmingInterrupted:
+                # A real request arrived - give the attempt back so it is retried in a later idle window
+                self.attempted.pop(normalize_query(query), None)
+                outcome = "interrupted"
+                print(f"Cache warmer: yielded '{query}' to an incoming request")
+            except Exception as e:
+                outcome = "failed"
+                print(f"Cache warmer: failed to warm '{query}': {e}")
+            finally:
+                self.current_query = None
+            self.stats[outcome] += 1
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name="cache-warmer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        with self.lock:
+            active_requests = self.active_requests
+        return {
+            "enabled": self.thread is not None and self.thread.is_alive(),
+            "idle": self.is_idle(),
+            "active_requests": active_requests,
+            "current_query": self.current_query,
+            "stats": dict(self.stats),
+            "top_queries": [{"query": q, "score": round(s, 3)} for q, s in self.mine_queries()[:10]]
+        }
+
+cache_warmer = CacheWarmer()
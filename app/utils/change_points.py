@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+from app.utils.tracing import span
+
+# Thumbnails are compared a few times per second, enough to catch a screen that stays up for half a second
+ANALYSIS_FPS = 5
+THUMBNAIL_WIDTH = 96
+# A change must clear the noise floor by this many robust standard deviations and this absolute level
+# (mean absolute grey difference), so small animations such as tap indicators do not split a screen
+CHANGE_MAD_FACTOR = 10
+MIN_CHANGE_LEVEL = 0.3
+# Shorter stable runs are animations or transient overlays, not screens the viewer acts on
+MIN_SEGMENT_SECONDS = 0.6
+SETTLE_SECONDS = 0.4
+MAX_SEGMENTS = 60
+
+# 8-bit 4:2:0 layouts whose first plane is the full-resolution luma
+LUMA_PIXEL_FORMATS = {"I420", "IYUV", "YV12", "NV12"}
+
+def thumbnail(gray):
+    height = max(1, int(gray.shape[0] * THUMBNAIL_WIDTH / gray.shape[1]))
+    small = cv2.resize(gray, (THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (3, 3), 0).astype(np.float32)
+
+def open_luma_capture(video_path):
+    """Returns (capture, reads_luma); with reads_luma, retrieve() gives the decoder's Y plane.
+
+    Skipping the BGR conversion saves a full-resolution colour conversion per analysed frame.
+    The backend cannot switch back to BGR afterwards, so this capture is only used for the signal.
+    """
+    cap = cv2.VideoCapture(video_path)
+    pixel_format = int(cap.get(cv2.CAP_PROP_CODEC_PIXEL_FORMAT)).to_bytes(4, "little").decode("ascii", "replace")
+    if pixel_format in LUMA_PIXEL_FORMATS and cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+        return cap, True
+    return cap, False
+
+def change_signal(video_path, fps, total_frames):
+    # Sequential grab() decodes every frame, but it still beats a keyframe seek per sample
+    # (4x slower on a 12-frame GOP). Only sampled frames are retrieved and converted.
+    step = max(1, int(round(fps / ANALYSIS_FPS)))
+    frame_numbers, thumbnails = [], []
+    grabbed = 0
+    with span("change_signal", frames=total_frames):
+        cap, reads_luma = open_luma_capture(video_path)
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        try:
+            for frame_number in range(total_frames):
+                if not cap.grab():
+                    break
+                grabbed += 1
+                if frame_number % step:
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                if reads_luma:
+                    # Limited-range luma, stretched to the 0-255 scale the change levels assume
+                    small = (thumbnail(frame[:height]) - 16) * (255 / 219)
+                else:
+                    small = thumbnail(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+                frame_numbers.append(frame_number)
+                thumbnails.append(small)
+        finally:
+            cap.release()
+    if len(thumbnails) < 2:
+        return frame_numbers, thumbnails, np.zeros(len(thumbnails)), grabbed
+    diffs = np.array([0.0] + [float(np.mean(np.abs(b - a))) for a, b in zip(thumbnails, thumbnails[1:])])
+    return frame_numbers, thumbnails, diffs, grabbed
+
+def change_threshold(diffs):
+    median = np.median(diffs)
+    mad = np.median(np.abs(diffs - median)) * 1.4826
+    return max(MIN_CHANGE_LEVEL, median + CHANGE_MAD_FACTOR * mad)
+
+def stable_segments(frame_numbers, thumbnails, diffs, fps):
+    threshold = change_threshold(diffs)
+    min_samples = max(1, int(np.ceil(MIN_SEGMENT_SECONDS * ANALYSIS_FPS)))
+    settle_samples = int(round(SETTLE_SECONDS * ANALYSIS_FPS))
+
+    runs = []
+    start = 0
+    for index in range(1, len(diffs) + 1):
+        if index == len(diffs) or diffs[index] >= threshold:
+            if index - start >= min_samples:
+                runs.append((start, index - 1))
+            start = index
+
+    # Runs separated by a transient (notification, keyboard flicker) that return to the same screen are one segment
+    segments = []
+    for first, last in runs:
+        if segments and np.mean(np.abs(thumbnails[first] - thumbnails[segments[-1]["last"]])) < threshold:
+            segments[-1]["last"] = last
+            continue
+        segments.append({"first": first, "last": last})
+
+    for segment in segments:
+        first, last = segment["first"], segment["last"]
+        representative = first + min(settle_samples, (last - first) // 2)
+        segment.update({
+            "start_frame": frame_numbers[first],
+            "end_frame": frame_numbers[last],
+            "frame": frame_numbers[representative],
+            "seconds": round((frame_numbers[last] - frame_numbers[first]) / fps, 2)
+        })
+    return segments, threshold
+
+def detect_stable_segments(video_path, fps, total_frames):
+    frame_numbers, thumbnails, diffs, grabbed = change_signal(video_path, fps, total_frames)
+    if not frame_numbers or fps <= 0:
+        return [], 0, grabbed
+    segments, threshold = stable_segments(frame_numbers, thumbnails, diffs, fps)
+    if len(segments) > MAX_SEGMENTS:
+        # Beyond the budget, drop the shortest screens first
+        keep = sorted(sorted(segments, key=lambda s: s["seconds"], reverse=True)[:MAX_SEGMENTS], key=lambda s: s["frame"])
+        segments = keep
+    return segments, threshold, grabbed
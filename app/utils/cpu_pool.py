@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.utils.resource_usage import ResourceMeter
+from app.utils.tracing import current_trace, start_trace, end_trace, span, propagate_context
+
+# Worker processes shared by every request for frame extraction and UI cropping, 0 runs them on threads in-process
+CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", max(1, min(4, os.cpu_count() or 1))))
+# Tasks allowed to wait for a worker before new submissions are refused
+CPU_POOL_MAX_QUEUED = int(os.environ.get("CPU_POOL_MAX_QUEUED", "8"))
+
+class CpuPoolBusy(Exception):
+    pass
+
+def warm_worker(workers):
+    # Pay the cv2/skimage import cost once per worker, not on the first request it serves
+    import cv2
+    import skimage.metrics
+    import app.utils.frame_extraction
+    import app.utils.ui_crop as ui_crop
+    # Split the cores between workers so their crop thread pools do not oversubscribe
+    ui_crop.UI_CROP_WORKERS = max(1, (os.cpu_count() or 1) // workers)
+    cv2.setNumThreads(ui_crop.UI_CROP_CV_THREADS)
+
+def ping():
+    return os.getpid()
+
+def run_task(function, args, kwargs, traced=False):
+    # Neither the request's trace nor the parent's counters see inside a worker, so both travel back with the result
+    trace = start_trace(function.__name__, sample_rate=1.0) if traced else None
+    meter = ResourceMeter().start()
+    try:
+        with span(function.__name__, category="cpu_pool"):
+            result = function(*args, **kwargs)
+    finally:
+        usage = meter.stop()
+        if traced:
+            end_trace()
+    worker_usage = {
+        "worker_pid": os.getpid(),
+        "worker_seconds": round(time.time() - meter.start_time, 3),
+        **{f"worker_{name}": value for name, value in usage.items()}
+    }
+    return result, worker_usage, trace.export() if trace is not None else None
+
+def fold_worker_trace(trace, future, outer):
+    # Moves worker spans into the request's trace and hands callers the usual (result, usage) pair
+    if future.cancelled():
+        outer.cancel()
+        return
+    if not outer.set_running_or_notify_cancel():
+        return
+    error = future.exception()
+    if error is not None:
+        outer.set_exception(error)
+        return
+    result, usage, worker_spans = future.result()
+    if trace is not None and worker_spans is not None:
+        trace.merge(*worker_spans)
+    outer.set_result((result, usage))
+
+class CpuPool:
+    """Bounded pool for CPU-bound pipeline stages.
+
+    Functions must be importable module-level callables. Arguments and results cross the
+    process boundary, so they are paths and metrics dicts, never frames.
+    """
+
+    def __init__(self, workers=CPU_POOL_WORKERS, max_queued=CPU_POOL_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.executor = None
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        if self.executor is None:
+            if self.workers > 0:
+                # forkserver children start from a clean process, not a fork of the threaded server holding the model
+                method = "forkserver" if sys.platform.startswith("linux") else "spawn"
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=warm_worker,
+                    initargs=(self.workers,)
+                )
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=max(1, os.cpu_count() or 1), thread_name_prefix="cpu-pool")
+        return self.executor
+
+    def start(self):
+        executor = self.get_executor_locked()
+        if self.workers > 0:
+            # Each submission spawns a worker while none is idle, so this brings the whole pool up warm
+            for future in [executor.submit(ping) for _ in range(self.workers)]:
+                future.result()
+
+    def submit(self, function, *args, **kwargs):
+        with self.lock:
+            if self.in_flight >= self.workers + self.max_queued:
+                raise CpuPoolBusy(f"{self.in_flight} CPU tasks in flight, try again shortly")
+            self.in_flight += 1
+        trace = current_trace.get()
+        try:
+            if self.workers > 0:
+                future = self.submit_to_workers(run_task, function, args, kwargs, trace is not None)
+            else:
+                # In-process threads add their spans to the request's trace directly
+                future = self.get_executor_locked().submit(propagate_context(run_task), function, args, kwargs)
+        except Exception:
+            self.task_done(None)
+            raise
+        future.add_done_callback(self.task_done)
+        outer = Future()
+        future.add_done_callback(lambda done: fold_worker_trace(trace, done, outer))
+        return outer
+
+    def submit_to_workers(self, *task):
+        executor = self.get_executor_locked()
+        try:
+            future = executor.submit(*task)
+        except BrokenProcessPool:
+            # A worker died since the last task; start a fresh pool instead of failing every request from now on
+            self.replace_broken(executor)
+            return self.get_executor_locked().submit(*task)
+        future.add_done_callback(lambda done: self.check_broken(executor, done))
+        return future
+
+    def check_broken(self, executor, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self.replace_broken(executor)
+
+    def replace_broken(self, executor):
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = None
+        print("CPU pool worker died, starting a new process pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_executor_locked(self):
+        with self.lock:
+            return self.get_executor()
+
+    def run(self, function, *args, **kwargs):
+        return self.submit(function, *args, **kwargs).result()
+
+    def task_done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    def queue_depth(self):
+        with self.lock:
+            return max(0, self.in_flight - self.workers)
+
+    def status(self):
+        with self.lock:
+            return {"workers": self.workers, "in_flight": self.in_flight, "max_queued": self.max_queued}
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+cpu_pool = None
+
+def get_cpu_pool():
+    global cpu_pool
+    if cpu_pool is None:
+        cpu_pool = CpuPool()
+    return cpu_pool
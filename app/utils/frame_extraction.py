@@ -6,6 +6,17 @@ import time
 import warnings
 import sys
 from contextlib import contextmanager
+from app.utils.tracing import span, record_span
+from app.utils.scene_changes import read_packet_index, detect_transitions, candidate_frames
+from app.utils.change_points import detect_stable_segments
+from app.utils.frame_index import FrameIndex
+from app.utils.ui_crop import locate_phone_screen, detect_phone_screen
+
+# "uniform" samples at a fixed interval, "scene" decodes only frames after transitions found in packet metadata,
+# "changepoint" keeps one settled frame per stable screen so the frame count follows the number of screens
+FRAME_SAMPLER = os.environ.get("FRAME_SAMPLER", "uniform")
+# Hamming radius (of 256 bits) within which a frame counts as an earlier screen seen again, 0 disables the check
+FRAME_DEDUP_RADIUS = int(os.environ.get("FRAME_DEDUP_RADIUS", "8"))
 
 @contextmanager
 def suppress_stderr():
@@ -42,19 +53,97 @@ def is_good_frame(frame, last_frame=None, ssim_threshold=0.98):
     if last_frame is None:
         return True, "first_frame"
     
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    last_gray = cv2.cvtColor(last_frame, cv2.COLOR_BGR2GRAY)
-    
-    if gray.shape != last_gray.shape:
-        last_gray = cv2.resize(last_gray, (gray.shape[1], gray.shape[0]))
+    with span("grayscale"):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        last_gray = cv2.cvtColor(last_frame, cv2.COLOR_BGR2GRAY)
+        
+        if gray.shape != last_gray.shape:
+            last_gray = cv2.resize(last_gray, (gray.shape[1], gray.shape[0]))
     
-    similarity = ssim(gray, last_gray, data_range=255)
+    with span("ssim"):
+        similarity = ssim(gray, last_gray, data_range=255)
     
     if similarity > ssim_threshold:
         return False, f"too_similar_{similarity:.3f}"
     
     return True, "good"
 
+def calculate_adaptive_threshold(cap, frames_to_examine, duration, target_frames):
+    print("Calculating adaptive SSIM threshold")
+    sample_ssim_scores = []
+    prev_frame = None
+
+    sample_indices = []
+    if len(frames_to_examine) > 1:
+        sample_count = min(25, len(frames_to_examine))
+        step = max(1, len(frames_to_examine) // sample_count)
+        sample_indices = list(range(0, len(frames_to_examine), step))[:sample_count]
+    else:
+        sample_indices = [0]
+
+    sampling_start = time.time()
+    for idx in sample_indices:
+        if idx >= len(frames_to_examine):
+            break
+        frame_number = frames_to_examine[idx]
+        with span("seek", frame=frame_number):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        with span("decode", frame=frame_number):
+            ret, frame = cap.read()
+        if not ret:
+            break
+    
+        if prev_frame is not None:
+            with span("grayscale"):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
+                if gray.shape != prev_gray.shape:
+                    prev_gray = cv2.resize(prev_gray, (gray.shape[1], gray.shape[0]))
+            with span("ssim"):
+                similarity = ssim(gray, prev_gray, data_range=255)
+            sample_ssim_scores.append(similarity)
+    
+        prev_frame = frame
+
+    record_span("threshold_sampling", sampling_start, time.time(), samples=len(sample_indices))
+
+    # The threshold is unused when falling back to time-based extraction
+    adaptive_threshold = None
+    force_time_based = False
+    time_based_interval = 1.0
+
+    if sample_ssim_scores:
+        avg_ssim = sum(sample_ssim_scores) / len(sample_ssim_scores)
+        min_ssim = min(sample_ssim_scores)
+        max_ssim = max(sample_ssim_scores)
+    
+        if avg_ssim >= 0.98:
+            force_time_based = True
+            time_based_interval = max(0.5, min(2.0, duration / target_frames))
+            print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f} - Using time-based extraction with {time_based_interval:.2f}s interval")
+        elif avg_ssim >= 0.97:
+            force_time_based = True
+            time_based_interval = max(0.5, min(2.5, duration / target_frames))
+            print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f} - Using time-based extraction with {time_based_interval:.2f}s interval")
+        elif avg_ssim >= 0.995:
+            adaptive_threshold = 0.985
+            print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
+        elif avg_ssim >= 0.99:
+            adaptive_threshold = 0.975
+            print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
+        elif avg_ssim >= 0.93:
+            adaptive_threshold = min(0.982, max(0.97, avg_ssim + 0.03))
+            print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
+            print(f"Note: Threshold accounts for higher similarity during extraction (compared to sampled frames)")
+        else:
+            adaptive_threshold = min(0.985, max(0.93, avg_ssim + 0.02))
+            print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
+    else:
+        adaptive_threshold = 0.985
+        print(f"Could not calculate average SSIM, using default threshold: {adaptive_threshold:.3f}")
+
+    return adaptive_threshold, force_time_based, time_based_interval, len(sample_indices)
+
 def extract_relevant_frames(video_path, output_folder="output/videos", video_id=None):
     if video_id is None:
         video_id = os.path.basename(os.path.dirname(video_path))
@@ -66,13 +155,15 @@ def extract_relevant_frames(video_path, output_folder="output/videos", video_id=
     examined_count = 0
     duplicate_count = 0
     ssim_scores = []
+    saved_frame_numbers = []
     
     start_time = time.time()
     
     with suppress_stderr():
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        with span("open_video"):
+            cap = cv2.VideoCapture(video_path)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         duration = total_frames / fps if fps > 0 else 0
         
         target_frames = 15
@@ -91,78 +182,62 @@ def extract_relevant_frames(video_path, output_folder="output/videos", video_id=
         print(f"Frame extraction started: {duration:.1f}s video ({total_frames} total frames at {fps:.1f} fps)")
         print(f"Using frame interval: {frame_interval} (sampling every {frame_interval/fps:.1f}s)")
 
-        print("Calculating adaptive SSIM threshold")
-        sample_ssim_scores = []
-        prev_frame = None
-        
-        sample_indices = []
-        if len(frames_to_examine) > 1:
-            sample_count = min(25, len(frames_to_examine))
-            step = max(1, len(frames_to_examine) // sample_count)
-            sample_indices = list(range(0, len(frames_to_examine), step))[:sample_count]
-        else:
-            sample_indices = [0]
-        
-        for idx in sample_indices:
-            if idx >= len(frames_to_examine):
-                break
-            frame_number = frames_to_examine[idx]
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if prev_frame is not None:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-                if gray.shape != prev_gray.shape:
-                    prev_gray = cv2.resize(prev_gray, (gray.shape[1], gray.shape[0]))
-                similarity = ssim(gray, prev_gray, data_range=255)
-                sample_ssim_scores.append(similarity)
-            
-            prev_frame = frame
-        
-        force_time_based = False
-        time_based_interval = 1.0
-        
-        if sample_ssim_scores:
-            avg_ssim = sum(sample_ssim_scores) / len(sample_ssim_scores)
-            min_ssim = min(sample_ssim_scores)
-            max_ssim = max(sample_ssim_scores)
-            
-            if avg_ssim >= 0.98:
-                force_time_based = True
-                time_based_interval = max(0.5, min(2.0, duration / target_frames))
-                print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f} - Using time-based extraction with {time_based_interval:.2f}s interval")
-            elif avg_ssim >= 0.97:
-                force_time_based = True
-                time_based_interval = max(0.5, min(2.5, duration / target_frames))
-                print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f} - Using time-based extraction with {time_based_interval:.2f}s interval")
-            elif avg_ssim >= 0.995:
-                adaptive_threshold = 0.985
-                print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
-            elif avg_ssim >= 0.99:
-                adaptive_threshold = 0.975
-                print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
-            elif avg_ssim >= 0.93:
-                adaptive_threshold = min(0.982, max(0.97, avg_ssim + 0.03))
-                print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
-                print(f"Note: Threshold accounts for higher similarity during extraction (compared to sampled frames)")
+        sampler = FRAME_SAMPLER
+        scene_metrics = {}
+        if sampler == "scene":
+            packet_start = time.time()
+            with span("packet_scan"):
+                packets, packet_source = read_packet_index(video_path)
+            if packets and fps > 0:
+                transitions = detect_transitions(packets, fps)
+                frames_to_examine = candidate_frames(transitions, fps, total_frames, target_frames * 2, duration / target_frames)
+                scene_metrics = {
+                    "packet_source": packet_source,
+                    "transitions_detected": len(transitions),
+                    "packet_scan_seconds": round(time.time() - packet_start, 3)
+                }
+                print(f"Scene sampler: {len(transitions)} transitions from {packet_source} packets, {len(frames_to_examine)} candidate frames")
             else:
-                adaptive_threshold = min(0.985, max(0.93, avg_ssim + 0.02))
-                print(f"SSIM stats: min={min_ssim:.3f}, max={max_ssim:.3f}, avg={avg_ssim:.3f}, adaptive threshold: {adaptive_threshold:.3f}")
+                print("Packet metadata unavailable, falling back to uniform sampling")
+                sampler = "uniform"
+        elif sampler == "changepoint":
+            analysis_start = time.time()
+            segments, change_level, analyzed_count = detect_stable_segments(video_path, fps, total_frames)
+            if segments:
+                frames_to_examine = [segment["frame"] for segment in segments]
+                scene_metrics = {
+                    "segments_detected": len(segments),
+                    "change_threshold": round(float(change_level), 2),
+                    "frames_analyzed": analyzed_count,
+                    "analysis_seconds": round(time.time() - analysis_start, 3)
+                }
+                print(f"Change-point sampler: {len(segments)} stable screens, threshold {change_level:.2f}")
+            else:
+                print("No stable screens found, falling back to uniform sampling")
+                sampler = "uniform"
+        
+        if sampler in ("scene", "changepoint"):
+            # Candidates are transitions, gap fill at the uniform interval or one frame per screen, keep them all
+            adaptive_threshold, force_time_based, time_based_interval = None, True, 0
+            # The change-point signal decodes every frame once, sequentially
+            decoded_count = scene_metrics.get("frames_analyzed", 0)
         else:
-            adaptive_threshold = 0.985
-            print(f"Could not calculate average SSIM, using default threshold: {adaptive_threshold:.3f}")
+            adaptive_threshold, force_time_based, time_based_interval, decoded_count = calculate_adaptive_threshold(
+                cap, frames_to_examine, duration, target_frames)
         
         cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
         
         last_saved_frame = None
         last_saved_time = -1
+        frame_index = FrameIndex(FRAME_DEDUP_RADIUS) if FRAME_DEDUP_RADIUS > 0 else None
+        revisit_links = []
+        scan_start = time.time()
         
         for frame_number in frames_to_examine:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-            ret, frame = cap.read()
+            with span("seek", frame=frame_number):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            with span("decode", frame=frame_number):
+                ret, frame = cap.read()
             if not ret:
                 break
             
@@ -171,31 +246,41 @@ def extract_relevant_frames(video_path, output_folder="output/videos", video_id=
             
             if force_time_based:
                 time_since_last = current_time - last_saved_time
-                if last_saved_frame is None or time_since_last >= time_based_interval:
-                    frame_filename = f"frame_{saved_count:03d}.jpg"
-                    frame_path = os.path.join(output_path, frame_filename)
-                    cv2.imwrite(frame_path, frame)
-                    saved_count += 1
-                    last_saved_frame = frame
-                    last_saved_time = current_time
-                else:
+                keep = last_saved_frame is None or time_since_last >= time_based_interval
+                if not keep:
                     duplicate_count += 1
             else:
-                is_good, reason = is_good_frame(frame, last_saved_frame, adaptive_threshold)
+                keep, reason = is_good_frame(frame, last_saved_frame, adaptive_threshold)
                 
                 if "too_similar" in reason:
                     duplicate_count += 1
                     ssim_score = float(reason.split("_")[-1])
                     ssim_scores.append(ssim_score)
-                
-                if is_good:
-                    frame_filename = f"frame_{saved_count:03d}.jpg"
-                    frame_path = os.path.join(output_path, frame_filename)
+            
+            # A screen revisited later in the video (Settings -> Display -> Settings) would cost another model call
+            if keep and frame_index is not None:
+                if frame_index.region is None:
+                    frame_index.region = locate_phone_screen(frame) or detect_phone_screen(frame)
+                with span("perceptual_hash"):
+                    frame_hash = frame_index.hash_frame(frame)
+                    revisit = frame_index.match(frame_hash)
+                if revisit is not None:
+                    keep = False
+                    revisit_links.append((frame_number, revisit[1], revisit[1] == f"frame_{saved_count - 1:03d}.jpg"))
+            
+            if keep:
+                frame_filename = f"frame_{saved_count:03d}.jpg"
+                frame_path = os.path.join(output_path, frame_filename)
+                with span("imwrite"):
                     cv2.imwrite(frame_path, frame)
-                    saved_count += 1
-                    last_saved_frame = frame
-                    last_saved_time = current_time
+                if frame_index is not None:
+                    frame_index.add(frame_hash, frame_filename)
+                saved_count += 1
+                saved_frame_numbers.append(frame_number)
+                last_saved_frame = frame
+                last_saved_time = current_time
         
+        record_span("frame_scan", scan_start, time.time(), frames=len(frames_to_examine))
         cap.release()
     
     processing_time = time.time() - start_time
@@ -204,7 +289,9 @@ def extract_relevant_frames(video_path, output_folder="output/videos", video_id=
     duplicate_rate = (duplicate_count / examined_count * 100) if examined_count > 0 else 0
     
     print(f"Frame extraction completed: {saved_count} frames in {processing_time:.1f}s")
-    print(f"Statistics: {examined_count} frames examined (out of {total_frames} total), {duplicate_count} duplicates filtered ({duplicate_rate:.1f}%), avg SSIM: {avg_ssim:.3f}")
+    if revisit_links:
+        print(f"Dropped {len(revisit_links)} frames matching an earlier screen")
+    print(f"Statistics: {decoded_count + examined_count} frames decoded, {examined_count} examined (out of {total_frames} total), {duplicate_count} duplicates filtered ({duplicate_rate:.1f}%), avg SSIM: {avg_ssim:.3f}")
     
     metrics = {
         "frame_count": saved_count,
@@ -213,7 +300,16 @@ def extract_relevant_frames(video_path, output_folder="output/videos", video_id=
         "duplicate_rate_percent": round(duplicate_rate, 2),
         "average_ssim_score": round(avg_ssim, 3),
         "frames_per_minute": round(frames_per_minute, 2),
-        "video_duration_seconds": round(duration, 2)
+        "video_duration_seconds": round(duration, 2),
+        "sampler": sampler,
+        "frames_decoded": decoded_count + examined_count,
+        "saved_frame_numbers": saved_frame_numbers,
+        # Every dropped match is one model.generate call that never happens
+        "hash_duplicates_dropped": len(revisit_links),
+        "non_adjacent_duplicates_dropped": sum(1 for _, kept_file, adjacent in revisit_links if not adjacent),
+        "gpu_calls_avoided": len(revisit_links),
+        "revisit_links": [[frame_number, kept_file] for frame_number, kept_file, _ in revisit_links],
+        **scene_metrics
     }
     
     return saved_count, metrics
@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+# 16x16 low-frequency DCT coefficients, a 256-bit hash; 64 bits cannot tell apart screens sharing a layout
+HASH_SIZE = 16
+
+def perceptual_hash(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (HASH_SIZE * 4, HASH_SIZE * 4), interpolation=cv2.INTER_AREA).astype(np.float32)
+    coefficients = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only carries overall brightness
+    bits = coefficients > np.median(coefficients[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Metric tree over Hamming distance, finds every hash within a radius without a linear scan."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        node = (value, item, {})
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def nearest(self, value, radius):
+        best = None
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius and (best is None or distance < best[0]):
+                best = (distance, item)
+            # Triangle inequality: only subtrees at distance d +/- radius can hold a match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return best
+
+class FrameIndex:
+    """Hashes of the frames kept for one video, looked up before a new frame is saved."""
+
+    def __init__(self, radius, region=None):
+        self.radius = radius
+        self.region = region
+        self.tree = BKTree()
+
+    def hash_frame(self, frame):
+        if self.region is not None:
+            x, y, w, h = self.region
+            frame = frame[y:y+h, x:x+w]
+        return perceptual_hash(frame)
+
+    def match(self, frame_hash):
+        return self.tree.nearest(frame_hash, self.radius)
+
+    def add(self, frame_hash, frame_file):
+        self.tree.add(frame_hash, frame_file)
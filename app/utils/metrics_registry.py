@@ -0,0 +1,151 @@
+import threading
+
+STAGE_NAMES = ["video-search", "video-download", "frame-extraction", "ui-screens", "osatlas-processing", "total"]
+STAGE_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300, 600]
+FRAME_COUNT_BUCKETS = [5, 10, 15, 20, 25, 30, 40, 60]
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        if not values and not self.labelnames:
+            values = {(): 0}
+        return [(f"{self.name}_total", format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+        if value is None:
+            return []
+        return [(self.name, "", value)]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = sorted(buckets) + [float("inf")]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.series[key] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        samples = []
+        for key, (counts, total) in sorted(series.items()):
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", format_labels(self.labelnames, key, [("le", format_value(float(bound)))]), count))
+            samples.append((f"{self.name}_sum", format_labels(self.labelnames, key), round(total, 6)))
+            samples.append((f"{self.name}_count", format_labels(self.labelnames, key), counts[-1]))
+        return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.register(Histogram(
+    "vnava_stage_duration_seconds", "Wall time of each query pipeline stage", ["stage", "cache_hit"]))
+FRAMES_PER_REQUEST = registry.register(Histogram(
+    "vnava_frames_per_request", "Frames extracted per processed video", buckets=FRAME_COUNT_BUCKETS))
+VIDEO_CACHE_REQUESTS = registry.register(Counter(
+    "vnava_video_cache_requests", "Query results served from or missing in the video result cache", ["result"]))
+PARSE_FAILURES = registry.register(Counter(
+    "vnava_osatlas_parse_failures", "Model responses without a parseable Thought and Action"))
+SKIPPED_FRAMES = registry.register(Counter(
+    "vnava_osatlas_skipped_frames", "Frames that did not produce a step", ["reason"]))
+OSATLAS_MEMO_LOOKUPS = registry.register(Counter(
+    "vnava_osatlas_memo_lookups", "Cross-video model output memo lookups", ["result"]))
+OSATLAS_GPU_SECONDS_SAVED = registry.register(Counter(
+    "vnava_osatlas_gpu_seconds_saved", "Generation seconds skipped by model output memo hits"))
+YOUTUBE_API_CALLS = registry.register(Counter(
+    "vnava_youtube_api_calls", "YouTube Data API requests sent over the network", ["endpoint"]))
+YOUTUBE_API_CACHE = registry.register(Counter(
+    "vnava_youtube_api_cache_lookups", "YouTube Data API cache lookups", ["endpoint", "result"]))
+ACTIVE_REQUESTS = registry.register(Gauge(
+    "vnava_active_requests", "Query requests currently in flight"))
+PREFETCH_QUEUE_DEPTH = registry.register(Gauge(
+    "vnava_prefetch_queue_depth", "Runner-up video downloads queued or running"))
+CPU_POOL_QUEUE_DEPTH = registry.register(Gauge(
+    "vnava_cpu_pool_queue_depth", "CPU stage tasks waiting for a worker process"))
+GPU_MEMORY_ALLOCATED = registry.register(Gauge(
+    "vnava_gpu_memory_allocated_bytes", "GPU memory allocated by PyTorch"))
+GPU_UTILIZATION = registry.register(Gauge(
+    "vnava_gpu_utilization_percent", "GPU utilization reported by the driver"))
+
+def observe_stage_timings(timing_metrics, cache_hit=False):
+    # Cached requests only run the search, their other stage entries are placeholders
+    stages = ["video-search", "total"] if cache_hit else STAGE_NAMES
+    for stage in stages:
+        if stage in timing_metrics:
+            STAGE_DURATION.observe(timing_metrics[stage]["duration"], stage=stage, cache_hit=str(cache_hit).lower())
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import queue
+import threading
+import numpy as np
+from datetime import datetime
+
+METRICS_STORE_FILE = "output/metrics/performance.jsonl"
+SNAPSHOT_DIR = "test"
+STAGE_NAMES = ["video-search", "video-download", "frame-extraction", "ui-screens", "osatlas-processing", "total"]
+SECTIONS = ["video_metadata", "video_download", "frame_extraction", "ui_screens", "osatlas_processing", "system_efficiency"]
+# Stages and sections that describe one candidate video rather than the whole request
+CANDIDATE_STAGES = ["video-download", "frame-extraction", "ui-screens", "osatlas-processing"]
+CANDIDATE_SECTIONS = ["video_metadata", "video_download", "frame_extraction", "ui_screens", "osatlas_processing"]
+
+class RequestMetrics:
+    """Performance metrics of one query, accumulated in memory and written once when the request ends."""
+
+    def __init__(self, query):
+        self.query = query
+        self.video_id = None
+        self.data = {
+            "video_id": None,
+            "query": query,
+            "created_at": datetime.now().isoformat(),
+            "timing": {},
+            **{section: {} for section in SECTIONS},
+            "step_count": 0,
+            "frame_count": 0,
+            "total_steps_generated": 0
+        }
+
+    def start_candidate(self, video_id):
+        """Switches to a fallback candidate; what the previous one recorded moves to failed_candidates."""
+        if self.video_id is None or self.video_id == video_id:
+            return
+        failed = {"video_id": self.video_id, "timing": {}}
+        for stage in CANDIDATE_STAGES:
+            if stage in self.data["timing"]:
+                failed["timing"][stage] = self.data["timing"].pop(stage)
+        for section in CANDIDATE_SECTIONS:
+            failed[section] = self.data[section]
+            self.data[section] = {}
+        stage_resources = self.data["system_efficiency"].get("stage_resources", {})
+        failed["stage_resources"] = {stage: stage_resources.pop(stage) for stage in CANDIDATE_STAGES if stage in stage_resources}
+        failed["frame_count"] = self.data["frame_count"]
+        self.data["frame_count"] = 0
+        self.data.setdefault("failed_candidates", []).append(failed)
+
+    def record(self, video_id, step, duration, additional_data=None):
+        self.video_id = video_id
+        self.data["video_id"] = video_id
+        self.data["timing"][step] = {"duration": duration}
+        self.data["last_updated"] = datetime.now().isoformat()
+
+        if additional_data:
+            for section in SECTIONS:
+                if section in additional_data:
+                    self.data[section].update(additional_data[section])
+            if "frame_count" in additional_data:
+                self.data["frame_count"] = additional_data["frame_count"]
+            if "step_count" in additional_data:
+                self.data["total_steps_generated"] = additional_data["step_count"]
+
+    def is_empty(self):
+        return self.video_id is None
+
+class MetricsStore:
+    def __init__(self, path=METRICS_STORE_FILE, snapshot_dir=SNAPSHOT_DIR):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.pending = queue.Queue()
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def submit(self, request_metrics):
+        if request_metrics.is_empty():
+            return
+        self.pending.put(dict(request_metrics.data, recorded_at=time.time()))
+        with self.thread_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="metrics-store", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.pending.get()
+            batch = [record]
+            # Drain whatever else queued up so one append covers several requests
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f"Failed to write performance metrics: {e}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+
+    def write(self, batch):
+        with self.write_lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a') as f:
+                for record in batch:
+                    f.write(json.dumps(record) + "\n")
+            for record in batch:
+                self.write_snapshot(record)
+
+    def write_snapshot(self, record):
+        # Per-video performance_metrics.json keeps the layout of Metrics/Performance, merged like before
+        snapshot_dir = os.path.join(self.snapshot_dir, record["video_id"])
+        os.makedirs(snapshot_dir, exist_ok=True)
+        snapshot_file = os.path.join(snapshot_dir, "performance_metrics.json")
+
+        snapshot = None
+        if os.path.exists(snapshot_file):
+            try:
+                with open(snapshot_file, 'r') as f:
+                    snapshot = json.load(f)
+            except Exception:
+                snapshot = None
+
+        if snapshot is None:
+            snapshot = {key: value for key, value in record.items() if key != "recorded_at"}
+        else:
+            snapshot["timing"].update(record["timing"])
+            for section in SECTIONS:
+                snapshot.setdefault(section, {}).update(record[section])
+            for key in ("frame_count", "total_steps_generated", "last_updated"):
+                if record.get(key):
+                    snapshot[key] = record[key]
+
+        with open(snapshot_file, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+
+    def flush(self):
+        self.pending.join()
+
+    def load_records(self, since=None):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with self.write_lock:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or record.get("recorded_at", 0) >= since:
+                records.append(record)
+        return records
+
+def distribution(values):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values, dtype=float)
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2)
+    }
+
+def aggregate_records(records):
+    computed = [r for r in records if not r.get("system_efficiency", {}).get("cache_hit")]
+    cache_hits = len(records) - len(computed)
+
+    stages = {}
+    for stage in STAGE_NAMES:
+        # Cached runs only searched - their other stage timings are placeholders
+        source = records if stage == "video-search" else computed
+        stages[stage] = distribution([r["timing"][stage]["duration"] for r in source if stage in r.get("timing", {})])
+    stages["total-cache-hit"] = distribution([
+        r["timing"]["total"]["duration"] for r in records
+        if r.get("system_efficiency", {}).get("cache_hit") and "total" in r.get("timing", {})
+    ])
+
+    stage_resources = {}
+    for stage in STAGE_NAMES:
+        usages = [r["system_efficiency"]["stage_resources"][stage] for r in computed
+                  if stage in r.get("system_efficiency", {}).get("stage_resources", {})]
+        if usages:
+            stage_resources[stage] = {
+                name: distribution([usage[name] for usage in usages])
+                for name in ("cpu_seconds", "peak_rss_delta_mb", "bytes_read", "bytes_written")
+            }
+
+    def field(section, name):
+        return [r[section][name] for r in computed if name in r.get(section, {})]
+
+    return {
+        "runs": len(records),
+        "cache_hits": cache_hits,
+        "cache_hit_rate_percent": round(cache_hits / len(records) * 100, 2) if records else 0,
+        "stages": stages,
+        "stage_resources": stage_resources,
+        "frames_per_minute": distribution(field("frame_extraction", "frames_per_minute")),
+        "frame_count": distribution(field("frame_extraction", "frame_count")),
+        "duplicate_rate_percent": distribution(field("frame_extraction", "duplicate_rate_percent")),
+        "steps_per_video": distribution(field("osatlas_processing", "total_steps")),
+        "parse_failure_rate_percent": distribution(field("osatlas_processing", "parse_failure_rate_percent")),
+        "download_throughput_mbps": distribution(field("video_download", "throughput_mbps")),
+        "ui_crop_area_reduction_percent": distribution(field("ui_screens", "area_reduction_percent"))
+    }
+
+metrics_store = MetricsStore()
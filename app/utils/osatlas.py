@@ -3,16 +3,32 @@ import cv2
 import torch
 import json
 import gc
-import re
+import time
+import hashlib
 import numpy as np
 from PIL import Image
 import torchvision.transforms as T
 from torchvision.transforms.functional import InterpolationMode
-from transformers import Qwen2VLForConditionalGeneration, AutoProcessor
+from transformers import Qwen2VLForConditionalGeneration, AutoProcessor, LogitsProcessorList
 from qwen_vl_utils import process_vision_info
+from app.utils.action_grammar import ActionGrammarLogitsProcessor
+from app.utils.metrics_registry import PARSE_FAILURES, SKIPPED_FRAMES
+from app.utils.tracing import span
+from app.utils.frame_index import perceptual_hash
+from app.utils.output_memo import output_memo, OUTPUT_MEMO_ENABLED
+from app.utils.step_assembly import StepAssembler, write_step, save_raw_outputs
 
 model = None
 processor = None
+draft_model = None
+
+MODEL_ID = os.environ.get("OSATLAS_MODEL_ID", "OS-Copilot/OS-Atlas-Pro-7B")
+# Draft model for assisted (speculative) decoding - must share the target model's tokenizer
+DRAFT_MODEL_ID = os.environ.get("OSATLAS_DRAFT_MODEL_ID", "Qwen/Qwen2-VL-2B-Instruct")
+USE_ASSISTED_DECODING = os.environ.get("OSATLAS_ASSISTED_DECODING", "0") == "1"
+# Constrain generation to the Thought/Action grammar documented in sys_prompt
+USE_CONSTRAINED_DECODING = os.environ.get("OSATLAS_CONSTRAINED_DECODING", "1") == "1"
+CONSTRAINED_MAX_NEW_TOKENS = 384
 
 IMAGENET_MEAN = (0.485, 0.456, 0.406)
 IMAGENET_STD = (0.229, 0.224, 0.225)
@@ -126,6 +142,11 @@ IMPORTANT:
 - Use COMPLETE for final steps, not PRESS_HOME
 """
 
+task_prompt = "Task: {query}\n\nLook at the image carefully and describe EXACTLY what you see. Be accurate and factual - don't make up elements that aren't there. Use correct spelling and grammar.{context_text}\n\nFormat: Thought: [accurate description of what you see] Action: CLICK <point>[x,y]</point>"
+
+# Memoized outputs are only reused while the prompts they were generated with are unchanged
+PROMPT_VERSION = hashlib.sha1((sys_prompt + task_prompt).encode()).hexdigest()[:12]
+
 def build_transform(input_size):
     MEAN, STD = IMAGENET_MEAN, IMAGENET_STD
     transform = T.Compose([
@@ -216,22 +237,22 @@ def load_model():
     os.environ['PYTORCH_CUDA_ALLOC_CONF'] = 'expandable_segments:True'
     
     try:
-        print("Loading OS-Atlas Pro 7B model...")
+        print(f"Loading OS-Atlas model {MODEL_ID}...")
         
         model = Qwen2VLForConditionalGeneration.from_pretrained(
-            "OS-Copilot/OS-Atlas-Pro-7B", 
+            MODEL_ID, 
             torch_dtype=torch.bfloat16,
             low_cpu_mem_usage=True,
             trust_remote_code=True
         ).eval().cuda()
 
         processor = AutoProcessor.from_pretrained(
-            "OS-Copilot/OS-Atlas-Pro-7B",
+            MODEL_ID,
             trust_remote_code=True,
             use_fast=False
         )
         
-        print("OS-Atlas Pro 7B model loaded successfully")
+        print("OS-Atlas model loaded successfully")
         
     except Exception as e:
         print(f"Failed to load model: {e}")
@@ -239,8 +260,32 @@ def load_model():
     
     return model, processor
 
+def load_draft_model():
+    global draft_model
+    
+    if draft_model is not None:
+        return draft_model
+    
+    try:
+        print(f"Loading draft model {DRAFT_MODEL_ID} for assisted decoding...")
+        
+        draft_model = Qwen2VLForConditionalGeneration.from_pretrained(
+            DRAFT_MODEL_ID,
+            torch_dtype=torch.bfloat16,
+            low_cpu_mem_usage=True,
+            trust_remote_code=True
+        ).eval().cuda()
+        
+        print("Draft model loaded successfully")
+        
+    except Exception as e:
+        print(f"Failed to load draft model, falling back to standard decoding: {e}")
+        draft_model = None
+    
+    return draft_model
+
 def unload_model():
-    global model, processor
+    global model, processor, draft_model
     
     if model is not None:
         del model
@@ -250,266 +295,129 @@ def unload_model():
         del processor
         processor = None
     
+    if draft_model is not None:
+        del draft_model
+        draft_model = None
+    
     cleanup_gpu_memory()
     print("Model unloaded and memory cleaned")
 
-def extract_coordinates(action, image_width, image_height):
-    clean_action = action.replace("<|im_end|>", "").strip()
-    
-    patterns = [
-        r'<point>\[\[(\d+),\s*(\d+)\]\]</point>',
-        r'\[\[(\d+),\s*(\d+)\]\]',
-        r'<point>\[(\d+),\s*(\d+)\]</point>',
-        r'\[(\d+),\s*(\d+)\]',
-        r'<point>(\d+),\s*(\d+)</point>',
-        r'(\d+),\s*(\d+)',
-        r'at coordinates \((\d+),\s*(\d+)\)',
-        r'coordinates \((\d+),\s*(\d+)\)',
-        r'\((\d+),\s*(\d+)\)',
-        r'SCROLL\s+\[[^\]]+\]\s+<point>\[(\d+),\s*(\d+)\]</point>',
-        r'SLIDE\s+\[[^\]]+\]\s+<point>\[(\d+),\s*(\d+)\]</point>',
-        r'SCROLL\s+\[[^\]]+\]\s+\[(\d+),\s*(\d+)\]',
-        r'SLIDE\s+\[[^\]]+\]\s+\[(\d+),\s*(\d+)\]',
-    ]
-    
-    for i, pattern in enumerate(patterns):
-        match = re.search(pattern, clean_action)
-        if match:
-            x, y = map(int, match.groups())
-            
-            if 0 <= x <= 1000 and 0 <= y <= 1000:
-                abs_x = int(x * image_width / 1000)
-                abs_y = int(y * image_height / 1000)
-                return abs_x, abs_y
-            
-            elif 0 <= x <= 1 and 0 <= y <= 1:
-                abs_x = int(x * image_width)
-                abs_y = int(y * image_height)
-                return abs_x, abs_y
-            
-            elif 0 <= x <= image_width and 0 <= y <= image_height and x <= 2000 and y <= 2000:
-                return x, y
-            
-            elif 0 <= x <= 100 and 0 <= y <= 100:
-                abs_x = int(x * image_width / 100)
-                abs_y = int(y * image_height / 100)
-                return abs_x, abs_y
-            
-            else:
-                return None
-    
-    return None
-
-def standardize_action_format(action):
-    if not action:
-        return action
-    
-    clean_action = action.replace("<|im_end|>", "").strip()
-    
-    coords = None
-    patterns = [
-        r'<point>\[\[(\d+),\s*(\d+)\]\]</point>',
-        r'\[\[(\d+),\s*(\d+)\]\]',
-        r'<point>\[(\d+),\s*(\d+)\]</point>',
-        r'\[(\d+),\s*(\d+)\]',
-        r'<point>(\d+),\s*(\d+)</point>',
-        r'(\d+),\s*(\d+)',
-        r'at coordinates \((\d+),\s*(\d+)\)',
-        r'coordinates \((\d+),\s*(\d+)\)',
-        r'\((\d+),\s*(\d+)\)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, clean_action)
-        if match:
-            coords = (int(match.group(1)), int(match.group(2)))
-            break
-    
-    action_lower = clean_action.lower()
-    
-    if action_lower.startswith('click'):
-        if coords:
-            return f"CLICK at ({coords[0]}, {coords[1]})"
-        else:
-            # Debug: Show what the model actually output
-            if len(clean_action) > 10:
-                print(f"  [COORD PARSE FAILED] Action: '{clean_action[:100]}'")
-            return "CLICK"
-    
-    elif action_lower.startswith('scroll'):
-        if coords:
-            return f"SCROLL at ({coords[0]}, {coords[1]})"
-        else:
-            return "SCROLL"
-    
-    elif action_lower.startswith('slide'):
-        direction_match = re.search(r'\[(left|right)\]', action_lower)
-        direction = direction_match.group(1).upper() if direction_match else ""
-        if coords:
-            return f"SLIDE {direction} at ({coords[0]}, {coords[1]})"
-        else:
-            return f"SLIDE {direction}"
-    
-    elif action_lower.startswith('open_app'):
-        app_match = re.search(r'\[([^\]]+)\]', clean_action)
-        app_name = app_match.group(1) if app_match else "App"
-        return f"OPEN {app_name}"
-    
-    elif action_lower.startswith('type'):
-        text_match = re.search(r'\[([^\]]+)\]', clean_action)
-        text = text_match.group(1) if text_match else "text"
-        return f"TYPE: {text}"
-    
-    elif action_lower.startswith('press_back'):
-        return "PRESS BACK"
-    
-    elif action_lower.startswith('press_home'):
-        return "PRESS HOME"
-    
-    elif action_lower.startswith('complete'):
-        return "COMPLETE"
-    
-    elif action_lower.startswith('wait'):
-        return "WAIT"
-    
-    return clean_action
-
-def parse_osatlas_response(output_text):
-    thought, action = None, None
-    capturing_thought, capturing_action = False, False
-    temp_thought, temp_action = [], []
-    
-    for line in output_text.splitlines():
-        line = line.strip()
-    
-        if line.lower().startswith("thought:"):
-            capturing_thought = True
-            capturing_action = False
-            # Just "thought:" on this line - extract any content after it
-            thought_content = line[8:].strip()
-            if thought_content:
-                temp_thought.append(thought_content)
-            continue
-    
-        elif (line.lower().startswith("action:") or line.lower().startswith("actions:")):
-            capturing_thought = False
-            capturing_action = True
-            colon_index = line.find(":")
-            action_content = line[colon_index + 1:].strip()
-            if action_content:
-                temp_action.append(action_content)
-            continue
-    
-        # Check if "action:" appears in the line while capturing thought
-        if capturing_thought:
-            # Use case-insensitive search but find actual position
-            action_pos_match = re.search(r'\bAction:\s*', line, re.IGNORECASE)
-            if action_pos_match:
-                action_pos = action_pos_match.start()
-                thought_part = line[:action_pos].strip()
-                if thought_part:
-                    temp_thought.append(thought_part)
-                # Find the actual colon to extract after it
-                colon_pos = line.find(':', action_pos)
-                if colon_pos != -1:
-                    action_content = line[colon_pos + 1:].strip()
-                    if action_content:
-                        temp_action.append(action_content)
-                capturing_thought = False
-                capturing_action = True
-                continue
-        
-        if capturing_thought:
-            temp_thought.append(line)
-        elif capturing_action:
-            temp_action.append(line.replace("<|im_end|>", "").strip())
-    
-    thought = " ".join(temp_thought).strip() if temp_thought else None
-    action = " ".join(temp_action).strip() if temp_action else None
+def build_generation_config(processor, inputs, eos_token_ids, constrained):
+    generation_config = dict(
+        max_new_tokens=1024, 
+        do_sample=True,
+        temperature=0.1,
+        top_p=0.9,
+        repetition_penalty=1.1
+    )
+    
+    if constrained:
+        generation_config["max_new_tokens"] = CONSTRAINED_MAX_NEW_TOKENS
+        generation_config["logits_processor"] = LogitsProcessorList([
+            ActionGrammarLogitsProcessor(processor.tokenizer, inputs.input_ids.shape[1], eos_token_ids)
+        ])
+    return generation_config
+
+class ForwardCallCounter:
+    def __init__(self, time_first_call=False):
+        self.calls = 0
+        self.time_first_call = time_first_call
+        self.first_call_at = None
+    
+    def __call__(self, module, args, output):
+        self.calls += 1
+        if self.time_first_call and self.first_call_at is None:
+            # The first forward pass is the prefill (plus the first draft proposal with assisted decoding);
+            # wait for the GPU so its time is not just the kernel launch
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            self.first_call_at = time.time()
+
+def generate_step_output(model, processor, inputs, generation_config, assistant_model=None):
+    target_counter = ForwardCallCounter(time_first_call=True)
+    draft_counter = ForwardCallCounter()
+    hooks = [model.register_forward_hook(target_counter)]
+    
+    if assistant_model is not None:
+        hooks.append(assistant_model.register_forward_hook(draft_counter))
+        generation_config = dict(generation_config, assistant_model=assistant_model)
     
-    if not thought and action:
-        thought = f"Perform action: {standardize_action_format(action)}"
-    
-    if action:
-        action = standardize_action_format(action)
-    
-    # Debug logging
-    if not thought or not action:
-        print(f"  [PARSE DEBUG] thought='{thought}', action='{action}', temp_thought={temp_thought}, temp_action={temp_action}")
-        print(f"  [PARSE DEBUG] Full output lines: {[l.strip() for l in output_text.splitlines()]}")
+    try:
+        decode_start = time.time()
+        gen_ids = model.generate(**inputs, **generation_config, pad_token_id=processor.tokenizer.eos_token_id)
+        decode_seconds = time.time() - decode_start
+    finally:
+        for hook in hooks:
+            hook.remove()
+    
+    trimmed = [o[len(i):] for i, o in zip(inputs.input_ids, gen_ids)]
+    output_text = processor.batch_decode(trimmed, skip_special_tokens=False, clean_up_tokenization_spaces=False)[0]
+    
+    generated_tokens = int(trimmed[0].shape[0])
+    prefill_seconds = target_counter.first_call_at - decode_start if target_counter.first_call_at else 0
+    token_seconds = decode_seconds - prefill_seconds
+    stats = {
+        "generated_tokens": generated_tokens,
+        "decode_seconds": round(decode_seconds, 3),
+        "tokens_per_second": round(generated_tokens / decode_seconds, 2) if decode_seconds > 0 else 0,
+        "prefill_seconds": round(prefill_seconds, 3),
+        # The prefill pass yields the first token, the rest come from incremental decode steps
+        "decode_tokens_per_second": round((generated_tokens - 1) / token_seconds, 2) if generated_tokens > 1 and token_seconds > 0 else 0
+    }
     
-    return thought, action
+    if assistant_model is not None:
+        # Each verification pass of the target model contributes one token of its own,
+        # the rest of the generated tokens are draft proposals it accepted
+        accepted = max(0, generated_tokens - target_counter.calls)
+        stats["draft_tokens_proposed"] = draft_counter.calls
+        stats["draft_tokens_accepted"] = accepted
+        stats["acceptance_rate"] = round(accepted / draft_counter.calls, 3) if draft_counter.calls > 0 else 0
+    
+    return output_text, stats
+
+
+def summarize_frame_telemetry(frame_telemetry):
+    inferred = [t for t in frame_telemetry if "generated_tokens" in t]
+    outcomes = {}
+    for t in frame_telemetry:
+        outcomes[t["outcome"]] = outcomes.get(t["outcome"], 0) + 1
+    
+    def average(key):
+        values = [t[key] for t in inferred if key in t]
+        return round(sum(values) / len(values), 2) if values else 0
+    
+    return {
+        "frames_inferred": len(inferred),
+        "avg_prompt_text_tokens": average("prompt_text_tokens"),
+        "avg_vision_tokens": average("vision_tokens"),
+        "avg_generated_tokens": average("generated_tokens"),
+        "max_generated_tokens": max((t["generated_tokens"] for t in inferred), default=0),
+        "frames_hitting_token_limit": sum(1 for t in inferred if t.get("hit_token_limit")),
+        "avg_prefill_seconds": average("prefill_seconds"),
+        "total_prefill_seconds": round(sum(t["prefill_seconds"] for t in inferred), 2),
+        "avg_decode_tokens_per_second": average("decode_tokens_per_second"),
+        "outcomes": outcomes
+    }
 
-def draw_bounding_box(image, coordinates, step_number, action_type):
-    if coordinates is None:
-        return image
-    
-    x, y = coordinates
-    height, width = image.shape[:2]
-    
-    if x < 0 or x >= width or y < 0 or y >= height:
-        return image
-    
-    img_with_box = image.copy()
-    
-    box_size_x = min(120, int(width * 0.15))
-    box_size_y = min(120, int(height * 0.15))
-    
-    top_left = (max(0, x - box_size_x // 2), max(0, y - box_size_y // 2))
-    bottom_right = (min(width, x + box_size_x // 2), min(height, y + box_size_y // 2))
-    
-    color = (0, 255, 0)
-    shadow_color = (0, 180, 0)
-    
-    shadow_top_left = (top_left[0] + 2, top_left[1] + 2)
-    shadow_bottom_right = (bottom_right[0] + 2, bottom_right[1] + 2)
-    cv2.rectangle(img_with_box, shadow_top_left, shadow_bottom_right, shadow_color, thickness=6)
-    
-    cv2.rectangle(img_with_box, top_left, bottom_right, color, thickness=6)
-    
-    inner_margin = 3
-    inner_top_left = (top_left[0] + inner_margin, top_left[1] + inner_margin)
-    inner_bottom_right = (bottom_right[0] - inner_margin, bottom_right[1] - inner_margin)
-    cv2.rectangle(img_with_box, inner_top_left, inner_bottom_right, color, thickness=2)
-    
-    cv2.circle(img_with_box, (x, y), 8, (255, 255, 255), -1)
-    cv2.circle(img_with_box, (x, y), 8, color, thickness=3)
-    
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = max(0.8, min(width, height) / 800)
-    font_thickness = 3
-    
-    text = f"Step {step_number}"
-    text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
-    
-    text_margin = 15
-    if top_left[1] > text_size[1] + text_margin:
-        text_pos = (top_left[0], top_left[1] - text_margin)
-    else:
-        text_pos = (top_left[0], bottom_right[1] + text_size[1] + text_margin)
-    
-    text_padding = 8
-    text_bg_top_left = (text_pos[0] - text_padding, text_pos[1] - text_size[1] - text_padding)
-    text_bg_bottom_right = (text_pos[0] + text_size[0] + text_padding, text_pos[1] + text_padding)
+def run_osatlas_optimized(query, video_id, yield_progress=None, use_assisted_decoding=None, use_constrained_decoding=None, should_stop=None, use_output_memo=None):
+    print(f"Starting OS-Atlas processing for {video_id}")
     
-    shadow_text_pos = (text_pos[0] + 2, text_pos[1] + 2)
-    cv2.rectangle(img_with_box, 
-                  (text_bg_top_left[0] + 2, text_bg_top_left[1] + 2),
-                  (text_bg_bottom_right[0] + 2, text_bg_bottom_right[1] + 2),
-                  (0, 0, 0), -1)
+    with span("load_model", category="osatlas"):
+        model, processor = load_model()
     
-    cv2.rectangle(img_with_box, text_bg_top_left, text_bg_bottom_right, (255, 255, 255), -1)
-    cv2.rectangle(img_with_box, text_bg_top_left, text_bg_bottom_right, color, thickness=2)
+    if use_assisted_decoding is None:
+        use_assisted_decoding = USE_ASSISTED_DECODING
+    assistant_model = load_draft_model() if use_assisted_decoding else None
     
-    cv2.putText(img_with_box, text, text_pos, font, font_scale, (0, 0, 0), font_thickness)
+    if use_constrained_decoding is None:
+        use_constrained_decoding = USE_CONSTRAINED_DECODING
+    if use_output_memo is None:
+        use_output_memo = OUTPUT_MEMO_ENABLED
+    # Free-form and grammar-constrained decoding produce differently shaped outputs
+    prompt_version = f"{PROMPT_VERSION}-{'constrained' if use_constrained_decoding else 'free'}"
+    eos_token_ids = {processor.tokenizer.eos_token_id, processor.tokenizer.convert_tokens_to_ids("<|im_end|>")}
+    image_token_id = processor.tokenizer.convert_tokens_to_ids("<|image_pad|>")
     
-    return img_with_box
-
-
-def run_osatlas_optimized(query, video_id, yield_progress=None):
-    print(f"Starting OS-Atlas processing for {video_id}")
-    
-    model, processor = load_model()
     cleanup_gpu_memory()
     
     input_path = f'output/videos/{video_id}/ui-screens'
@@ -528,49 +436,61 @@ def run_osatlas_optimized(query, video_id, yield_progress=None):
     print(f"Processing {len(frames)} frames")
     
     result = []
-    step_number = 1
-    action_history = []
-    step_history = []  # Store (thought, action) tuples for context
-    steps_with_coords = 0
-    steps_with_thought_action = 0
-    duplicate_steps_filtered = 0
-    frames_processed = 0
-    action_types = {}
+    assembler = StepAssembler(frames)
+    # Raw outputs per frame, so changed filtering rules can be replayed without the model
+    raw_outputs = {}
+    generated_tokens_total = 0
+    decode_seconds_total = 0.0
+    draft_tokens_proposed = 0
+    draft_tokens_accepted = 0
+    frame_telemetry = []
+    interrupted = False
+    memo_hits = 0
+    memo_lookups = 0
+    gpu_seconds_saved = 0.0
+    
+    def skip_frame(reason):
+        assembler.skip(reason)
+        SKIPPED_FRAMES.inc(reason=reason)
+        frame_telemetry[-1]["outcome"] = reason
     
     for i, frame in enumerate(frames):
+        # Background callers (the cache warmer) hand the GPU back between frames
+        if should_stop and should_stop():
+            print(f"Stopping OS-Atlas processing for {video_id} after {assembler.frames_processed} frames")
+            interrupted = True
+            break
+        
         print(f"Processing frame {i+1}/{len(frames)}: {frame}")
+        frame_telemetry.append({"frame": frame, "outcome": None})
         
-        # Position-based intro/outro skipping only for longer videos (20+ frames)
-        # Shorter videos (<20 frames, typically <60s) usually don't have intro/outro
-        if len(frames) >= 20:
-            intro_cutoff = max(2, int(len(frames) * 0.15))
-            outro_start = max(0, len(frames) - max(1, int(len(frames) * 0.05)))
-            
-            skip_intro = i < intro_cutoff
-            skip_outro = i >= outro_start
-            if skip_intro or skip_outro:
-                print(f"  Skipping frame {i+1} - intro/outro position")
-                continue
+        position_skip = assembler.position_skip(i)
+        if position_skip:
+            print(f"  Skipping frame {i+1} - intro/outro position")
+            skip_frame(position_skip)
+            continue
         
         if yield_progress and (i + 1) % 3 == 0:
             yield_progress("osatlas-processing", "active", f"Processing frame {i+1}/{len(frames)}: {frame}")
         
         img_path = f'{input_path}/{frame}'
-        pixel_values = load_image_optimized(img_path, max_num=6)
+        with span("load_image", category="osatlas", frame=frame):
+            pixel_values = load_image_optimized(img_path, max_num=6)
+            img = cv2.imread(img_path)
         
-        if pixel_values is None:
+        if pixel_values is None or img is None:
+            skip_frame("image_load_failed")
             continue
         
-        # Add context about previous steps to help model avoid duplicates
-        context_text = ""
-        if len(step_history) > 0:
-            recent_steps = step_history[-3:] if len(step_history) >= 3 else step_history
-            step_descriptions = []
-            for prev_thought, prev_action in recent_steps:
-                if prev_thought and prev_action:
-                    step_descriptions.append(f"Thought: {prev_thought[:100]}... Action: {prev_action}")
-            if step_descriptions:
-                context_text = f"\nPrevious steps:\n" + "\n".join(f"- {desc}" for desc in step_descriptions)
+        context_text = assembler.context_text()
+        
+        memo_entry = None
+        screen_hash = None
+        if use_output_memo:
+            with span("memo_lookup", category="osatlas", frame=frame):
+                screen_hash = perceptual_hash(img)
+                memo_entry = output_memo.lookup(screen_hash, query, prompt_version, MODEL_ID)
+                memo_lookups += 1
         
         messages = [
             {
@@ -578,247 +498,135 @@ def run_osatlas_optimized(query, video_id, yield_progress=None):
                 "content": [
                     {"type": "text", "text": sys_prompt},
                     {"type": "image", "image": img_path},
-                    {"type": "text", "text": f"Task: {query}\n\nLook at the image carefully and describe EXACTLY what you see. Be accurate and factual - don't make up elements that aren't there. Use correct spelling and grammar.{context_text}\n\nFormat: Thought: [accurate description of what you see] Action: CLICK <point>[x,y]</point>"}
+                    {"type": "text", "text": task_prompt.format(query=query, context_text=context_text)}
                 ]
             }
         ]
 
         try:
-            text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-            
-            image_inputs, _ = process_vision_info(messages)
-            inputs = processor(text=[text], images=image_inputs, padding=True, return_tensors="pt").to("cuda")
-
-            generation_config = dict(
-                max_new_tokens=1024, 
-                do_sample=True,
-                temperature=0.1,
-                top_p=0.9,
-                repetition_penalty=1.1
-            )
-            
-            gen_ids = model.generate(**inputs, **generation_config, pad_token_id=processor.tokenizer.eos_token_id)
-            trimmed = [o[len(i):] for i, o in zip(inputs.input_ids, gen_ids)]
-            output_text = processor.batch_decode(trimmed, skip_special_tokens=False, clean_up_tokenization_spaces=False)[0]
-            
-            thought, action = parse_osatlas_response(output_text)
-            frames_processed += 1
-            
-            if not thought or not action:
-                print(f"  Skipping frame {i+1} - failed to parse response")
-                print(f"  Raw output: {output_text[:500]}")
-                continue
-            
-            thought_lower = thought.lower().strip()
-            action_lower = action.lower().strip()
-            
-            low_value_patterns = [
-                "the video content shows",
-                "the screen shows",
-                "the screen displays",
-                "the phone displays",
-                "the image shows",
-                "the image displays",
-                "a phone displaying",
-                "displaying settings for",
-                "focusing on",
-                "specifically focusing on"
-            ]
-            
-            is_low_value_thought = any(pattern in thought_lower for pattern in low_value_patterns)
-            
-            # Content-based intro/outro detection - only for longer videos and only before steps start
-            # Shorter videos typically jump right into the tutorial
-            if len(frames) >= 20 and step_number == 1 and i < 5:
-                intro_frame_patterns = [
-                    "no screen visible",
-                    "no phone visible",
-                    "title card",
-                    "title screen",
-                    "intro screen",
-                    "channel intro",
-                    "subscribe button",
-                    "youtube intro"
-                ]
+            if memo_entry is not None:
+                output_text = memo_entry["output_text"]
+                memo_hits += 1
+                # The stored time covers tokenization and vision preprocessing too, a hit skips all of it
+                gpu_seconds_saved += memo_entry.get("generate_seconds", 0)
+                frame_telemetry[-1].update({"memo_hit": True, "memo_distance": memo_entry["distance"]})
+                print(f"  Reusing memoized output (hash distance {memo_entry['distance']})")
+            else:
+                inference_start = time.time()
+                with span("tokenize", category="osatlas", frame=frame):
+                    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+                    
+                    image_inputs, _ = process_vision_info(messages)
+                    inputs = processor(text=[text], images=image_inputs, padding=True, return_tensors="pt").to("cuda")
                 
-                is_intro_frame = any(pattern in thought_lower for pattern in intro_frame_patterns)
+                prompt_tokens = int(inputs.input_ids.shape[1])
+                vision_tokens = int((inputs.input_ids == image_token_id).sum())
+                frame_telemetry[-1].update({
+                    "prompt_tokens": prompt_tokens,
+                    "prompt_text_tokens": prompt_tokens - vision_tokens,
+                    "vision_tokens": vision_tokens
+                })
+
+                generation_config = build_generation_config(processor, inputs, eos_token_ids, use_constrained_decoding)
                 
-                if is_intro_frame:
-                    print(f"  Skipping frame {i+1} - detected intro content")
-                    continue
-            
-            # Handle COMPLETE actions - only allow on the last frame
-            if 'complete' in action_lower:
-                if i == len(frames) - 1:
-                    # Last frame with COMPLETE - this is valid
-                    action = "COMPLETE"
-                    thought = "Task completed successfully"
-                    action_lower = "complete"
-                else:
-                    # COMPLETE on a middle frame - skip it
-                    print(f"Skipping COMPLETE action on middle frame {i+1}/{len(frames)}")
-                    continue
-            
-            if 'press' in action_lower and 'home' in action_lower:
-                if i == len(frames) - 1:
-                    action = "COMPLETE"
-                    thought = "Task completed successfully"
-                    action_lower = "complete"
-                elif is_low_value_thought:
-                    continue
-            
-            if is_low_value_thought and not ('complete' in action_lower or 'press' in action_lower):
-                print(f"  Skipping frame {i+1} - low value thought")
-                continue
-            
-            # Handle SKIP responses from the model
-            if 'skip' in action_lower or 'skip' in thought_lower:
-                print(f"  Skipping frame {i+1} - model returned SKIP")
-                continue
-            
-            action_clean = action_lower.replace('_', ' ').replace('-', ' ')
-            is_scroll = action_lower.startswith('scroll')
-            is_click = 'click' in action_clean and action_lower.startswith('click')
-            is_wait = action_lower.startswith('wait')
-            
-            # Skip consecutive SCROLL actions
-            if is_scroll and len(action_history) > 0:
-                last_action = action_history[-1].lower()
-                if 'scroll' in last_action:
-                    print(f"  Skipping frame {i+1} - consecutive SCROLL action")
-                    duplicate_steps_filtered += 1
-                    continue
-
-            # Skip consecutive WAIT actions
-            if is_wait and len(action_history) > 0:
-                last_action = action_history[-1].strip().lower()
-                if last_action.startswith('wait'):
-                    print(f"  Skipping frame {i+1} - consecutive WAIT action")
-                    duplicate_steps_filtered += 1
-                    continue
-            
-            # Skip if thought is exactly the same as the previous step
-            if len(step_history) > 0 and thought:
-                prev_thought, prev_action = step_history[-1]
-                if prev_thought and thought.strip().lower() == prev_thought.strip().lower():
-                    print(f"  Skipping frame {i+1} - duplicate thought: '{thought[:60]}...'")
-                    duplicate_steps_filtered += 1
-                    continue
-            
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
+                with span("generate", category="osatlas", frame=frame):
+                    output_text, decode_stats = generate_step_output(model, processor, inputs, generation_config, assistant_model)
+                inference_seconds = round(time.time() - inference_start, 3)
+                generated_tokens_total += decode_stats["generated_tokens"]
+                frame_telemetry[-1].update({
+                    "generated_tokens": decode_stats["generated_tokens"],
+                    "hit_token_limit": decode_stats["generated_tokens"] >= generation_config["max_new_tokens"],
+                    "prefill_seconds": decode_stats["prefill_seconds"],
+                    "generate_seconds": decode_stats["decode_seconds"],
+                    "decode_tokens_per_second": decode_stats["decode_tokens_per_second"],
+                    "inference_seconds": inference_seconds
+                })
+                decode_seconds_total += decode_stats["decode_seconds"]
                 
-            img_height, img_width, _ = img.shape
-            coords = extract_coordinates(action, img_width, img_height)
-            
-            if thought and action:
-                steps_with_thought_action += 1
-            
-            action_type = "unknown"
-            if is_click:
-                action_type = "click"
-            elif is_scroll:
-                action_type = "scroll"
-            elif 'slide' in action_clean and action_lower.startswith('slide'):
-                action_type = "slide"
-            elif 'type' in action_clean and action_lower.startswith('type'):
-                action_type = "type"
-            elif 'press' in action_clean and 'back' in action_clean:
-                action_type = "press_back"
-            elif 'press' in action_clean and 'home' in action_clean:
-                action_type = "press_home"
-            elif 'open' in action_clean and 'app' in action_clean:
-                action_type = "open_app"
-            elif 'complete' in action_clean:
-                action_type = "complete"
-            elif is_wait:
-                action_type = "wait"
-            
-            action_types[action_type] = action_types.get(action_type, 0) + 1
-            
-            must_have_coords = ['click', 'slide', 'type']
-            never_need_coords = ['open_app', 'press_back', 'press_home', 'complete', 'wait']
-            requires_coords = any(action_lower.startswith(action_type) for action_type in must_have_coords)
-            never_needs_coords = any(action_lower.startswith(action_type) for action_type in never_need_coords) or is_scroll
-            
-            if coords:
-                steps_with_coords += 1
-            
-            # Skip actions that require coordinates if coordinates are missing
-            if requires_coords and not coords:
-                print(f"  Skipping frame {i+1} - {action_type} action missing coordinates")
-                print(f"  Raw action output: {action}")
-                continue
-                
-            step_folder = os.path.join(output_path, f'step_{step_number:02d}')
-            os.makedirs(step_folder, exist_ok=True)
-            
-            if coords:
-                img_with_box = draw_bounding_box(img, coords, step_number, action)
-                cv2.imwrite(os.path.join(step_folder, frame), img_with_box)
-            else:
-                # Save original image when no coordinates are needed or provided
-                cv2.imwrite(os.path.join(step_folder, frame), img)
-            
-            step_details = {
-                "step_number": step_number,
-                "frame": frame,
-                "thought": thought or "",
-                "action": action,
-                "coordinates": coords
+                if assistant_model is not None:
+                    draft_tokens_proposed += decode_stats["draft_tokens_proposed"]
+                    draft_tokens_accepted += decode_stats["draft_tokens_accepted"]
+                    print(f"  Decode: {decode_stats['generated_tokens']} tokens at {decode_stats['tokens_per_second']} tok/s, draft acceptance {decode_stats['acceptance_rate']:.1%}")
+                else:
+                    print(f"  Decode: {decode_stats['generated_tokens']} tokens at {decode_stats['tokens_per_second']} tok/s")
+            
+            img_height, img_width = img.shape[:2]
+            raw_outputs[frame] = {
+                "index": i,
+                "output_text": output_text,
+                "width": img_width,
+                "height": img_height,
+                "source": "memo" if memo_entry is not None else "model"
             }
             
-            with open(os.path.join(step_folder, 'step_details.json'), 'w') as f:
-                json.dump(step_details, f, indent=2)
+            with span("parse", category="osatlas"):
+                step, reason = assembler.add(i, output_text, (img_width, img_height))
             
-            if coords:
-                box_width = min(120, int(img_width * 0.15))
-                box_height = min(120, int(img_height * 0.15))
-            else:
-                box_width = box_height = 100
+            # Only outputs that parse are worth replaying for another video
+            if memo_entry is None and screen_hash is not None and reason != "parse_failure":
+                output_memo.store(screen_hash, query, prompt_version, MODEL_ID, output_text,
+                                  inference_seconds, source=f"{video_id}/{frame}")
             
-            result.append({
-                "step": step_number,
-                "action": action,
-                "boundingBox": {
-                    "x": coords[0] if coords else 0,
-                    "y": coords[1] if coords else 0,
-                    "width": box_width,
-                    "height": box_height
-                },
-                "image": f"/api-vnava22/images/{video_id}/step_{step_number:02d}/{frame}",
-                "thought": thought or ""
-            })
+            if step is None:
+                if reason == "parse_failure":
+                    PARSE_FAILURES.inc()
+                    print(f"  Raw output: {output_text[:500]}")
+                print(f"  Skipping frame {i+1} - {reason.replace('_', ' ')}")
+                skip_frame(reason)
+                continue
             
-            action_history.append(action)
-            step_history.append((thought, action))
+            result.append(write_step(output_path, video_id, step, img))
             
-            print(f"Step {step_number}: {action}")
-            step_number += 1
+            print(f"Step {step['step_number']}: {step['action']}")
+            frame_telemetry[-1]["outcome"] = "accepted"
+            frame_telemetry[-1]["step_number"] = step["step_number"]
             
-            cleanup_gpu_memory()
+            with span("cleanup_gpu_memory", category="osatlas"):
+                cleanup_gpu_memory()
             
         except Exception as e:
             print(f"Error processing {frame}: {e}")
+            skip_frame("error")
             continue
     
     cleanup_gpu_memory()
     
-    total_steps = len(result)
-    steps_with_coords_percent = (steps_with_coords / total_steps * 100) if total_steps > 0 else 0
-    steps_complete_percent = (steps_with_thought_action / total_steps * 100) if total_steps > 0 else 0
-    
-    metrics = {
-        "total_steps": total_steps,
-        "steps_with_coordinates": steps_with_coords,
-        "steps_with_coordinates_percent": round(steps_with_coords_percent, 2),
-        "steps_with_thought_and_action": steps_with_thought_action,
-        "steps_complete_percent": round(steps_complete_percent, 2),
-        "duplicate_steps_filtered": duplicate_steps_filtered,
-        "frames_processed": frames_processed,
-        "action_type_distribution": action_types
-    }
+    with open(os.path.join(output_path, 'frame_telemetry.json'), 'w') as f:
+        json.dump(frame_telemetry, f, indent=2)
+    
+    save_raw_outputs(output_path, {
+        "video_id": video_id,
+        "query": query,
+        "model_id": MODEL_ID,
+        "prompt_version": prompt_version,
+        "frames": frames,
+        "outputs": raw_outputs
+    })
+    
+    frames_processed = assembler.frames_processed
+    metrics = assembler.metrics()
+    metrics.update({
+        "generated_tokens": generated_tokens_total,
+        "avg_tokens_per_second": round(generated_tokens_total / decode_seconds_total, 2) if decode_seconds_total > 0 else 0,
+        "avg_tokens_per_frame": round(generated_tokens_total / frames_processed, 1) if frames_processed > 0 else 0,
+        "constrained_decoding": use_constrained_decoding,
+        "assisted_decoding": assistant_model is not None,
+        "interrupted": interrupted,
+        "frame_telemetry": summarize_frame_telemetry(frame_telemetry),
+        "output_memo": {
+            "enabled": use_output_memo,
+            "lookups": memo_lookups,
+            "hits": memo_hits,
+            "hit_rate_percent": round(memo_hits / memo_lookups * 100, 2) if memo_lookups > 0 else 0,
+            "gpu_seconds_saved": round(gpu_seconds_saved, 2)
+        }
+    })
+    
+    if assistant_model is not None:
+        metrics["draft_model"] = DRAFT_MODEL_ID
+        metrics["draft_tokens_proposed"] = draft_tokens_proposed
+        metrics["draft_tokens_accepted"] = draft_tokens_accepted
+        metrics["draft_acceptance_rate"] = round(draft_tokens_accepted / draft_tokens_proposed, 3) if draft_tokens_proposed > 0 else 0
     
     return result, metrics
 
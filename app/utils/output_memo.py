@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from app.utils.frame_index import hamming
+from app.utils.request_log import normalize_query
+from app.utils.metrics_registry import OSATLAS_MEMO_LOOKUPS, OSATLAS_GPU_SECONDS_SAVED
+
+OUTPUT_MEMO_DIR = "output/osatlas_memo"
+OUTPUT_MEMO_ENABLED = os.environ.get("OSATLAS_OUTPUT_MEMO", "1") == "1"
+OUTPUT_MEMO_MAX_ENTRIES = int(os.environ.get("OSATLAS_OUTPUT_MEMO_MAX_ENTRIES", "20000"))
+# Tighter than FRAME_DEDUP_RADIUS: a wrong hit skips the model entirely, on another video's screen
+OUTPUT_MEMO_RADIUS = int(os.environ.get("OSATLAS_OUTPUT_MEMO_RADIUS", "6"))
+# Eviction trims to this share of the cap so it does not run on every store
+EVICTION_TARGET = 0.9
+
+class OutputMemo:
+    """Raw OS-Atlas outputs shared across videos, keyed by the cropped screen's perceptual hash.
+
+    Entries live in output/osatlas_memo/<partition>/<hash>.json, where the partition covers
+    the normalized query, prompt version and model id. A lookup scans one partition for the
+    nearest hash within the radius. File mtimes track recency for LRU eviction.
+    """
+
+    def __init__(self, memo_dir=OUTPUT_MEMO_DIR, max_entries=OUTPUT_MEMO_MAX_ENTRIES, radius=OUTPUT_MEMO_RADIUS):
+        self.memo_dir = memo_dir
+        self.max_entries = max_entries
+        self.radius = radius
+        self.entry_count = None
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "near_hits": 0, "stores": 0, "evictions": 0, "gpu_seconds_saved": 0.0}
+
+    def partition_dir(self, query, prompt_version, model_id):
+        raw = json.dumps([normalize_query(query), prompt_version, model_id])
+        return os.path.join(self.memo_dir, hashlib.sha1(raw.encode()).hexdigest()[:16])
+
+    def lookup(self, screen_hash, query, prompt_version, model_id):
+        directory = self.partition_dir(query, prompt_version, model_id)
+        exact = f"{screen_hash:064x}.json"
+        best = None
+        if os.path.exists(os.path.join(directory, exact)):
+            best = (0, exact)
+        elif os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    distance = hamming(screen_hash, int(name[:-5], 16))
+                except ValueError:
+                    continue
+                if distance <= self.radius and (best is None or distance < best[0]):
+                    best = (distance, name)
+
+        entry = None
+        if best is not None:
+            path = os.path.join(directory, best[1])
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                os.utime(path)
+            except Exception:
+                entry = None
+
+        with self.lock:
+            self.stats["lookups"] += 1
+            if entry is not None:
+                self.stats["hits"] += 1
+                self.stats["near_hits"] += 1 if best[0] > 0 else 0
+                self.stats["gpu_seconds_saved"] += entry.get("generate_seconds", 0)
+        if entry is None:
+            OSATLAS_MEMO_LOOKUPS.inc(result="miss")
+            return None
+        OSATLAS_MEMO_LOOKUPS.inc(result="hit" if best[0] == 0 else "near_hit")
+        OSATLAS_GPU_SECONDS_SAVED.inc(entry.get("generate_seconds", 0))
+        return dict(entry, distance=best[0])
+
+    def store(self, screen_hash, query, prompt_version, model_id, output_text, generate_seconds, source=None):
+        directory = self.partition_dir(query, prompt_version, model_id)
+        path = os.path.join(directory, f"{screen_hash:064x}.json")
+        is_new = not os.path.exists(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    "output_text": output_text,
+                    "generate_seconds": generate_seconds,
+                    "query": normalize_query(query),
+                    "prompt_version": prompt_version,
+                    "model_id": model_id,
+                    "source": source,
+                    "stored_at": time.time()
+                }, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Failed to write OS-Atlas memo entry: {e}")
+            return
+
+        with self.lock:
+            self.stats["stores"] += 1
+            if self.entry_count is None:
+                self.entry_count = self.count_entries()
+            elif is_new:
+                self.entry_count += 1
+            over_cap = self.entry_count > self.max_entries
+        if over_cap:
+            self.evict()
+
+    def entries(self):
+        if not os.path.isdir(self.memo_dir):
+            return []
+        entries = []
+        for partition in os.listdir(self.memo_dir):
+            directory = os.path.join(self.memo_dir, partition)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    path = os.path.join(directory, name)
+                    try:
+                        entries.append((os.path.getmtime(path), path))
+                    except OSError:
+                        continue
+        return entries
+
+    def count_entries(self):
+        return len(self.entries())
+
+    def evict(self):
+        with self.lock:
+            entries = sorted(self.entries())
+            excess = len(entries) - int(self.max_entries * EVICTION_TARGET)
+            removed = 0
+            for _, path in entries[:max(0, excess)]:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    continue
+            self.entry_count = len(entries) - removed
+            self.stats["evictions"] += removed
+        print(f"Evicted {removed} least recently used OS-Atlas memo entries")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            if self.entry_count is None:
+                self.entry_count = self.count_entries()
+            stats["entries"] = self.entry_count
+        stats["max_entries"] = self.max_entries
+        stats["hit_rate_percent"] = round(stats["hits"] / stats["lookups"] * 100, 2) if stats["lookups"] else 0
+        stats["gpu_seconds_saved"] = round(stats["gpu_seconds_saved"], 2)
+        return stats
+
+output_memo = OutputMemo()
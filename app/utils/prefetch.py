@@ -0,0 +1,95 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.cache import extract_video_id, is_video_cached, video_claims
+from app.utils.video_download import VideoDownloader, get_downloader
+
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "1"))
+# Runner-up candidates fetched per request, and the cap on downloads queued across all requests
+PREFETCH_CANDIDATES = 2
+MAX_PENDING_PREFETCHES = 4
+
+class VideoPrefetcher:
+    def __init__(self, max_workers=PREFETCH_WORKERS, output_folder="output/videos"):
+        self.output_folder = output_folder
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        # Separate downloader so prefetches never reuse the YoutubeDL instances foreground downloads check out
+        self.downloader = VideoDownloader()
+        self.downloader.use_cookies_from(get_downloader())
+        self.futures = {}
+        self.lock = threading.Lock()
+    
+    def download(self, video_url, video_id):
+        # Requests and the warmer write this folder under the video's claim, a claimed video is left to them.
+        # A request falling back to this video waits for the claim, then picks up the finished download.
+        if not video_claims.try_acquire(video_id):
+            print(f"Skipping prefetch of {video_id}, another job is using it")
+            return None, {}
+        try:
+            video_folder = os.path.join(self.output_folder, video_id)
+            os.makedirs(video_folder, exist_ok=True)
+            video_path, metrics = self.downloader.download(video_url, video_folder)
+        finally:
+            video_claims.release(video_id)
+        if video_path:
+            print(f"Prefetched runner-up video: {video_id}")
+        return video_path, metrics
+    
+    def prefetch(self, videos):
+        submitted = 0
+        with self.lock:
+            for video in videos[:PREFETCH_CANDIDATES]:
+                video_id = extract_video_id(video["url"])
+                if video_id in self.futures or is_video_cached(video_id):
+                    continue
+                pending = sum(1 for future in self.futures.values() if not future.done())
+                if pending >= MAX_PENDING_PREFETCHES:
+                    break
+                self.futures[video_id] = self.executor.submit(self.download, video["url"], video_id)
+                submitted += 1
+        return submitted
+    
+    def pending_count(self):
+        with self.lock:
+            return sum(1 for future in self.futures.values() if not future.done())
+    
+    def get(self, video_id, timeout=None):
+        with self.lock:
+            future = self.futures.pop(video_id, None)
+        
+        if future is None or future.cancelled():
+            return None
+        
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            print(f"Prefetch of {video_id} failed: {e}")
+            return None
+    
+    def discard(self, video_id):
+        # A request or the warmer may have picked the video up in the meantime
+        if is_video_cached(video_id) or not video_claims.try_acquire(video_id):
+            return
+        try:
+            shutil.rmtree(os.path.join(self.output_folder, video_id), ignore_errors=True)
+            print(f"Discarded unused prefetch: {video_id}")
+        finally:
+            video_claims.release(video_id)
+    
+    def release(self, videos):
+        with self.lock:
+            for video in videos:
+                video_id = extract_video_id(video["url"])
+                future = self.futures.pop(video_id, None)
+                # cancel() only stops downloads that have not started, the rest are removed once they finish
+                if future is not None and not future.cancel():
+                    future.add_done_callback(lambda _, video_id=video_id: self.discard(video_id))
+
+prefetcher = None
+
+def get_prefetcher():
+    global prefetcher
+    if prefetcher is None:
+        prefetcher = VideoPrefetcher()
+    return prefetcher
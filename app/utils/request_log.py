@@ -0,0 +1,60 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+REQUEST_LOG_FILE = "output/request_log.jsonl"
+
+log_lock = threading.Lock()
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def log_request(query, video_id=None, cache_hit=False, source="user"):
+    entry = {
+        "timestamp": time.time(),
+        "query": query,
+        "video_id": video_id,
+        "cache_hit": cache_hit,
+        "source": source
+    }
+    with log_lock:
+        os.makedirs(os.path.dirname(REQUEST_LOG_FILE), exist_ok=True)
+        with open(REQUEST_LOG_FILE, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+def read_request_log(since=None):
+    if not os.path.exists(REQUEST_LOG_FILE):
+        return []
+    entries = []
+    with open(REQUEST_LOG_FILE, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or entry.get("timestamp", 0) >= since:
+                entries.append(entry)
+    return entries
+
+def cache_hit_rate_over_time(bucket_seconds=3600, since=None):
+    buckets = {}
+    for entry in read_request_log(since):
+        if entry.get("source") != "user":
+            continue
+        bucket = int(entry["timestamp"] // bucket_seconds * bucket_seconds)
+        counts = buckets.setdefault(bucket, {"requests": 0, "cache_hits": 0})
+        counts["requests"] += 1
+        counts["cache_hits"] += 1 if entry.get("cache_hit") else 0
+
+    report = []
+    for bucket in sorted(buckets):
+        counts = buckets[bucket]
+        report.append({
+            "bucket_start": datetime.fromtimestamp(bucket).isoformat(),
+            "requests": counts["requests"],
+            "cache_hits": counts["cache_hits"],
+            "hit_rate_percent": round(counts["cache_hits"] / counts["requests"] * 100, 2)
+        })
+    return report
@@ -0,0 +1,91 @@
+import os
+import time
+import resource
+import threading
+
+RSS_SAMPLE_SECONDS = 0.05
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def cpu_seconds():
+    # Children cover ffmpeg merges and other subprocesses spawned by yt-dlp
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def current_rss():
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the lifetime peak in KiB, the closest portable stand-in
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def io_counters():
+    counters = {}
+    try:
+        with open("/proc/self/io", 'r') as f:
+            for line in f:
+                name, value = line.split(":")
+                counters[name.strip()] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+class ResourceMeter:
+    """Process-wide CPU, RSS and I/O used between start() and stop().
+
+    Counters are per process, so stages of concurrent requests are charged to each other.
+    """
+
+    def __init__(self, sample_interval=RSS_SAMPLE_SECONDS):
+        self.sample_interval = sample_interval
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.peak_rss = 0
+        self.usage = None
+
+    def sample_rss(self):
+        while not self.stop_event.wait(self.sample_interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def start(self):
+        self.start_time = time.time()
+        self.start_cpu = cpu_seconds()
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+        self.start_io = io_counters()
+        self.sampler = threading.Thread(target=self.sample_rss, name="rss-sampler", daemon=True)
+        self.sampler.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.usage = self.stop()
+        return False
+
+    def stop(self):
+        self.stop_event.set()
+        self.sampler.join()
+        end_rss = current_rss()
+        self.peak_rss = max(self.peak_rss, end_rss)
+        wall_seconds = time.time() - self.start_time
+        cpu = cpu_seconds() - self.start_cpu
+        end_io = io_counters()
+
+        def io_delta(name):
+            return end_io.get(name, 0) - self.start_io.get(name, 0)
+
+        return {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_utilization_percent": round(cpu / wall_seconds * 100, 1) if wall_seconds > 0 else 0,
+            "rss_start_mb": round(self.start_rss / (1024 * 1024), 1),
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 1),
+            "peak_rss_delta_mb": round((self.peak_rss - self.start_rss) / (1024 * 1024), 1),
+            # rchar/wchar count every read/write call, read_bytes/write_bytes only what reached storage
+            "bytes_read": io_delta("rchar"),
+            "bytes_written": io_delta("wchar"),
+            "storage_bytes_read": io_delta("read_bytes"),
+            "storage_bytes_written": io_delta("write_bytes")
+        }
@@ -0,0 +1,119 @@
+import json
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+# A P-frame this many times larger than usual for its GOP position and neighbourhood starts a new screen
+PACKET_SPIKE_RATIO = 2.0
+LOCAL_WINDOW_SECONDS = 2.0
+# Keyframes this much earlier than the regular GOP cadence were placed by the encoder's scene-cut detection
+IRREGULAR_KEYFRAME_RATIO = 0.8
+MIN_TRANSITION_GAP_SECONDS = 0.5
+# UI animations finish a moment after the first changed frame
+SETTLE_SECONDS = 0.4
+
+def read_packets_opencv(video_path):
+    # CAP_PROP_FORMAT=-1 makes read() return the encoded packet without decoding it
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+        cap.release()
+        return None
+    packets = []
+    while True:
+        ok, packet = cap.read()
+        if not ok:
+            break
+        packets.append((cap.get(cv2.CAP_PROP_POS_MSEC) / 1000, packet.size, bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))))
+    cap.release()
+    return packets or None
+
+def read_packets_ffprobe(video_path):
+    if shutil.which("ffprobe") is None:
+        return None
+    command = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "packet=pts_time,size,flags", "-of", "json", video_path]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=60, check=True).stdout
+        entries = json.loads(output).get("packets", [])
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None
+    packets = []
+    for entry in entries:
+        try:
+            packets.append((float(entry["pts_time"]), int(entry["size"]), "K" in entry.get("flags", "")))
+        except (KeyError, ValueError):
+            continue
+    return packets or None
+
+def read_packet_index(video_path):
+    for source, reader in (("opencv", read_packets_opencv), ("ffprobe", read_packets_ffprobe)):
+        packets = reader(video_path)
+        if packets:
+            # Decode order differs from display order when the stream has B-frames
+            return sorted(packets, key=lambda packet: packet[0]), source
+    return None, None
+
+def detect_transitions(packets, fps):
+    times = np.array([packet[0] for packet in packets])
+    sizes = np.array([packet[1] for packet in packets], dtype=float)
+    keys = np.array([packet[2] for packet in packets])
+
+    key_indices = np.flatnonzero(keys)
+    gop_offsets = np.arange(len(packets)) - np.maximum.accumulate(np.where(keys, np.arange(len(packets)), 0))
+    transitions = []
+
+    if len(key_indices) >= 3:
+        intervals = np.diff(key_indices)
+        regular_gop = np.median(intervals)
+        for index, interval in zip(key_indices[1:], intervals):
+            if interval < IRREGULAR_KEYFRAME_RATIO * regular_gop:
+                transitions.append((float(times[index]), PACKET_SPIKE_RATIO))
+
+    # Packets right after a keyframe are large on every GOP, compare each one with its own GOP position
+    non_key = np.flatnonzero(~keys)
+    offset_medians = {}
+    for offset in np.unique(gop_offsets[non_key]):
+        same_offset = sizes[non_key[gop_offsets[non_key] == offset]]
+        if same_offset.size >= 3:
+            offset_medians[offset] = np.median(same_offset)
+
+    window = max(3, int(LOCAL_WINDOW_SECONDS * fps))
+    for position, index in enumerate(non_key):
+        recent = sizes[non_key[max(0, position - window):position]]
+        if recent.size < 3:
+            continue
+        baseline = max(np.median(recent), offset_medians.get(gop_offsets[index], 0))
+        ratio = sizes[index] / baseline
+        if ratio >= PACKET_SPIKE_RATIO:
+            transitions.append((float(times[index]), float(ratio)))
+
+    merged = []
+    for transition in sorted(transitions):
+        if merged and transition[0] - merged[-1][0] < MIN_TRANSITION_GAP_SECONDS:
+            if transition[1] > merged[-1][1]:
+                merged[-1] = transition
+            continue
+        merged.append(transition)
+    return merged
+
+def candidate_frames(transitions, fps, total_frames, max_candidates, max_gap_seconds):
+    duration = total_frames / fps
+    # Too many spikes means camera footage rather than screen changes, keep the strongest
+    if len(transitions) > max_candidates:
+        transitions = sorted(sorted(transitions, key=lambda t: t[1], reverse=True)[:max_candidates])
+
+    times = [0.0]
+    for index, (start, _) in enumerate(transitions):
+        next_start = transitions[index + 1][0] if index + 1 < len(transitions) else duration
+        times.append(min(start + SETTLE_SECONDS, max(start, next_start - 1 / fps)))
+
+    # Transitions that land on a regular keyframe leave no spike, cover long gaps at the uniform interval
+    filled = []
+    for start, end in zip(times, times[1:] + [duration]):
+        filled.append(start)
+        gaps = int(np.ceil((end - start) / max_gap_seconds))
+        filled.extend(start + (end - start) * step / gaps for step in range(1, gaps))
+
+    frames = sorted({min(total_frames - 1, int(round(t * fps))) for t in filled})
+    return frames
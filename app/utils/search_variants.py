@@ -0,0 +1,43 @@
+import os
+import json
+import threading
+
+VARIANT_YIELD_FILE = "output/api_cache/variant_yield.json"
+
+yield_lock = threading.Lock()
+
+def variant_template(query, search_query):
+    return search_query.replace(query, "{query}")
+
+def load_variant_yield():
+    if not os.path.exists(VARIANT_YIELD_FILE):
+        return {}
+    try:
+        with open(VARIANT_YIELD_FILE, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def rank_search_variants(query, search_queries):
+    variant_yield = load_variant_yield()
+    # Variants whose results most often reached the shortlist go first, ties keep create_search_queries order
+    return sorted(
+        search_queries,
+        key=lambda q: -variant_yield.get(variant_template(query, q), 0)
+    )
+
+def record_variant_yield(query, shortlisted_videos):
+    if not shortlisted_videos:
+        return
+
+    with yield_lock:
+        variant_yield = load_variant_yield()
+        for video in shortlisted_videos:
+            search_query = video.get("search_query")
+            if search_query:
+                template = variant_template(query, search_query)
+                variant_yield[template] = variant_yield.get(template, 0) + 1
+
+        os.makedirs(os.path.dirname(VARIANT_YIELD_FILE), exist_ok=True)
+        with open(VARIANT_YIELD_FILE, 'w') as f:
+            json.dump(variant_yield, f, indent=2)
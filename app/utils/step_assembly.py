@@ -0,0 +1,625 @@
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import cv2
+from app.utils.tracing import span
+from app.utils.cache import cache_video_result, video_claims
+
+# Single pass parser for grammar-conformant output
+STEP_PATTERN = re.compile(
+    r'Thought: (?P<thought>[^\n<]+)\nAction: (?P<action>[A-Z_]+[^\n]*?)(?:<\|im_end\|>)?\s*$'
+)
+
+COORDINATE_PATTERNS = [re.compile(pattern) for pattern in [
+    r'<point>\[\[(\d+),\s*(\d+)\]\]</point>',
+    r'\[\[(\d+),\s*(\d+)\]\]',
+    r'<point>\[(\d+),\s*(\d+)\]</point>',
+    r'\[(\d+),\s*(\d+)\]',
+    r'<point>(\d+),\s*(\d+)</point>',
+    r'(\d+),\s*(\d+)',
+    r'at coordinates \((\d+),\s*(\d+)\)',
+    r'coordinates \((\d+),\s*(\d+)\)',
+    r'\((\d+),\s*(\d+)\)',
+    r'SCROLL\s+\[[^\]]+\]\s+<point>\[(\d+),\s*(\d+)\]</point>',
+    r'SLIDE\s+\[[^\]]+\]\s+<point>\[(\d+),\s*(\d+)\]</point>',
+    r'SCROLL\s+\[[^\]]+\]\s+\[(\d+),\s*(\d+)\]',
+    r'SLIDE\s+\[[^\]]+\]\s+\[(\d+),\s*(\d+)\]',
+]]
+
+# The SCROLL/SLIDE specific patterns are only needed for coordinate extraction
+ACTION_COORDINATE_PATTERNS = COORDINATE_PATTERNS[:9]
+
+def extract_coordinates(action, image_width, image_height):
+    clean_action = action.replace("<|im_end|>", "").strip()
+    
+    for pattern in COORDINATE_PATTERNS:
+        match = pattern.search(clean_action)
+        if match:
+            x, y = map(int, match.groups())
+            
+            if 0 <= x <= 1000 and 0 <= y <= 1000:
+                abs_x = int(x * image_width / 1000)
+                abs_y = int(y * image_height / 1000)
+                return abs_x, abs_y
+            
+            elif 0 <= x <= 1 and 0 <= y <= 1:
+                abs_x = int(x * image_width)
+                abs_y = int(y * image_height)
+                return abs_x, abs_y
+            
+            elif 0 <= x <= image_width and 0 <= y <= image_height and x <= 2000 and y <= 2000:
+                return x, y
+            
+            elif 0 <= x <= 100 and 0 <= y <= 100:
+                abs_x = int(x * image_width / 100)
+                abs_y = int(y * image_height / 100)
+                return abs_x, abs_y
+            
+            else:
+                return None
+    
+    return None
+
+def standardize_action_format(action):
+    if not action:
+        return action
+    
+    clean_action = action.replace("<|im_end|>", "").strip()
+    
+    coords = None
+    for pattern in ACTION_COORDINATE_PATTERNS:
+        match = pattern.search(clean_action)
+        if match:
+            coords = (int(match.group(1)), int(match.group(2)))
+            break
+    
+    action_lower = clean_action.lower()
+    
+    if action_lower.startswith('click'):
+        if coords:
+            return f"CLICK at ({coords[0]}, {coords[1]})"
+        else:
+            # Debug: Show what the model actually output
+            if len(clean_action) > 10:
+                print(f"  [COORD PARSE FAILED] Action: '{clean_action[:100]}'")
+            return "CLICK"
+    
+    elif action_lower.startswith('scroll'):
+        if coords:
+            return f"SCROLL at ({coords[0]}, {coords[1]})"
+        else:
+            return "SCROLL"
+    
+    elif action_lower.startswith('slide'):
+        direction_match = re.search(r'\[(left|right)\]', action_lower)
+        direction = direction_match.group(1).upper() if direction_match else ""
+        if coords:
+            return f"SLIDE {direction} at ({coords[0]}, {coords[1]})"
+        else:
+            return f"SLIDE {direction}"
+    
+    elif action_lower.startswith('open_app'):
+        app_match = re.search(r'\[([^\]]+)\]', clean_action)
+        app_name = app_match.group(1) if app_match else "App"
+        return f"OPEN {app_name}"
+    
+    elif action_lower.startswith('type'):
+        text_match = re.search(r'\[([^\]]+)\]', clean_action)
+        text = text_match.group(1) if text_match else "text"
+        return f"TYPE: {text}"
+    
+    elif action_lower.startswith('press_back'):
+        return "PRESS BACK"
+    
+    elif action_lower.startswith('press_home'):
+        return "PRESS HOME"
+    
+    elif action_lower.startswith('complete'):
+        return "COMPLETE"
+    
+    elif action_lower.startswith('wait'):
+        return "WAIT"
+    
+    return clean_action
+
+def parse_osatlas_response(output_text):
+    # Grammar-constrained output parses in a single compiled pass
+    step_match = STEP_PATTERN.match(output_text.strip())
+    if step_match:
+        return step_match.group("thought").strip(), standardize_action_format(step_match.group("action"))
+    
+    thought, action = None, None
+    capturing_thought, capturing_action = False, False
+    temp_thought, temp_action = [], []
+    
+    for line in output_text.splitlines():
+        line = line.strip()
+    
+        if line.lower().startswith("thought:"):
+            capturing_thought = True
+            capturing_action = False
+            # Just "thought:" on this line - extract any content after it
+            thought_content = line[8:].strip()
+            if thought_content:
+                temp_thought.append(thought_content)
+            continue
+    
+        elif (line.lower().startswith("action:") or line.lower().startswith("actions:")):
+            capturing_thought = False
+            capturing_action = True
+            colon_index = line.find(":")
+            action_content = line[colon_index + 1:].strip()
+            if action_content:
+                temp_action.append(action_content)
+            continue
+    
+        # Check if "action:" appears in the line while capturing thought
+        if capturing_thought:
+            # Use case-insensitive search but find actual position
+            action_pos_match = re.search(r'\bAction:\s*', line, re.IGNORECASE)
+            if action_pos_match:
+                action_pos = action_pos_match.start()
+                thought_part = line[:action_pos].strip()
+                if thought_part:
+                    temp_thought.append(thought_part)
+                # Find the actual colon to extract after it
+                colon_pos = line.find(':', action_pos)
+                if colon_pos != -1:
+                    action_content = line[colon_pos + 1:].strip()
+                    if action_content:
+                        temp_action.append(action_content)
+                capturing_thought = False
+                capturing_action = True
+                continue
+        
+        if capturing_thought:
+            temp_thought.append(line)
+        elif capturing_action:
+            temp_action.append(line.replace("<|im_end|>", "").strip())
+    
+    thought = " ".join(temp_thought).strip() if temp_thought else None
+    action = " ".join(temp_action).strip() if temp_action else None
+    
+    if not thought and action:
+        thought = f"Perform action: {standardize_action_format(action)}"
+    
+    if action:
+        action = standardize_action_format(action)
+    
+    # Debug logging
+    if not thought or not action:
+        print(f"  [PARSE DEBUG] thought='{thought}', action='{action}', temp_thought={temp_thought}, temp_action={temp_action}")
+        print(f"  [PARSE DEBUG] Full output lines: {[l.strip() for l in output_text.splitlines()]}")
+    
+    return thought, action
+
+def draw_bounding_box(image, coordinates, step_number, action_type):
+    if coordinates is None:
+        return image
+    
+    x, y = coordinates
+    height, width = image.shape[:2]
+    
+    if x < 0 or x >= width or y < 0 or y >= height:
+        return image
+    
+    img_with_box = image.copy()
+    
+    box_size_x = min(120, int(width * 0.15))
+    box_size_y = min(120, int(height * 0.15))
+    
+    top_left = (max(0, x - box_size_x // 2), max(0, y - box_size_y // 2))
+    bottom_right = (min(width, x + box_size_x // 2), min(height, y + box_size_y // 2))
+    
+    color = (0, 255, 0)
+    shadow_color = (0, 180, 0)
+    
+    shadow_top_left = (top_left[0] + 2, top_left[1] + 2)
+    shadow_bottom_right = (bottom_right[0] + 2, bottom_right[1] + 2)
+    cv2.rectangle(img_with_box, shadow_top_left, shadow_bottom_right, shadow_color, thickness=6)
+    
+    cv2.rectangle(img_with_box, top_left, bottom_right, color, thickness=6)
+    
+    inner_margin = 3
+    inner_top_left = (top_left[0] + inner_margin, top_left[1] + inner_margin)
+    inner_bottom_right = (bottom_right[0] - inner_margin, bottom_right[1] - inner_margin)
+    cv2.rectangle(img_with_box, inner_top_left, inner_bottom_right, color, thickness=2)
+    
+    cv2.circle(img_with_box, (x, y), 8, (255, 255, 255), -1)
+    cv2.circle(img_with_box, (x, y), 8, color, thickness=3)
+    
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = max(0.8, min(width, height) / 800)
+    font_thickness = 3
+    
+    text = f"Step {step_number}"
+    text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
+    
+    text_margin = 15
+    if top_left[1] > text_size[1] + text_margin:
+        text_pos = (top_left[0], top_left[1] - text_margin)
+    else:
+        text_pos = (top_left[0], bottom_right[1] + text_size[1] + text_margin)
+    
+    text_padding = 8
+    text_bg_top_left = (text_pos[0] - text_padding, text_pos[1] - text_size[1] - text_padding)
+    text_bg_bottom_right = (text_pos[0] + text_size[0] + text_padding, text_pos[1] + text_padding)
+    
+    shadow_text_pos = (text_pos[0] + 2, text_pos[1] + 2)
+    cv2.rectangle(img_with_box, 
+                  (text_bg_top_left[0] + 2, text_bg_top_left[1] + 2),
+                  (text_bg_bottom_right[0] + 2, text_bg_bottom_right[1] + 2),
+                  (0, 0, 0), -1)
+    
+    cv2.rectangle(img_with_box, text_bg_top_left, text_bg_bottom_right, (255, 255, 255), -1)
+    cv2.rectangle(img_with_box, text_bg_top_left, text_bg_bottom_right, color, thickness=2)
+    
+    cv2.putText(img_with_box, text, text_pos, font, font_scale, (0, 0, 0), font_thickness)
+    
+    return img_with_box
+
+RAW_OUTPUTS_FILE = "raw_outputs.json"
+
+# Position-based intro/outro skipping only for longer videos
+# Shorter videos (<20 frames, typically <60s) usually don't have intro/outro
+INTRO_OUTRO_MIN_FRAMES = 20
+INTRO_SHARE = 0.15
+OUTRO_SHARE = 0.05
+
+LOW_VALUE_PATTERNS = [
+    "the video content shows",
+    "the screen shows",
+    "the screen displays",
+    "the phone displays",
+    "the image shows",
+    "the image displays",
+    "a phone displaying",
+    "displaying settings for",
+    "focusing on",
+    "specifically focusing on"
+]
+
+INTRO_FRAME_PATTERNS = [
+    "no screen visible",
+    "no phone visible",
+    "title card",
+    "title screen",
+    "intro screen",
+    "channel intro",
+    "subscribe button",
+    "youtube intro"
+]
+
+MUST_HAVE_COORDS = ['click', 'slide', 'type']
+
+class StepAssembler:
+    """Turns raw OS-Atlas outputs into tutorial steps, one frame at a time.
+
+    Holds no model or file state: the live run feeds it outputs as they are generated and
+    assemble_steps replays stored outputs through it, so both apply the same filtering rules.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.step_number = 1
+        self.action_history = []
+        self.step_history = []  # Store (thought, action) tuples for context
+        self.steps_with_coords = 0
+        self.steps_with_thought_action = 0
+        self.duplicate_steps_filtered = 0
+        self.frames_processed = 0
+        self.action_types = {}
+        self.skipped_frames = {}
+
+    def skip(self, reason):
+        self.skipped_frames[reason] = self.skipped_frames.get(reason, 0) + 1
+
+    def position_skip(self, index):
+        if len(self.frames) < INTRO_OUTRO_MIN_FRAMES:
+            return None
+        intro_cutoff = max(2, int(len(self.frames) * INTRO_SHARE))
+        outro_start = max(0, len(self.frames) - max(1, int(len(self.frames) * OUTRO_SHARE)))
+        if index < intro_cutoff or index >= outro_start:
+            return "intro_outro_position"
+        return None
+
+    def context_text(self):
+        # Context about previous steps helps the model avoid duplicates
+        step_descriptions = []
+        for prev_thought, prev_action in self.step_history[-3:]:
+            if prev_thought and prev_action:
+                step_descriptions.append(f"Thought: {prev_thought[:100]}... Action: {prev_action}")
+        if not step_descriptions:
+            return ""
+        return f"\nPrevious steps:\n" + "\n".join(f"- {desc}" for desc in step_descriptions)
+
+    def add(self, index, output_text, image_size):
+        """Returns (step, None) for an accepted frame or (None, skip_reason)."""
+        frame = self.frames[index]
+        is_last_frame = index == len(self.frames) - 1
+        thought, action = parse_osatlas_response(output_text)
+        self.frames_processed += 1
+        
+        if not thought or not action:
+            return None, "parse_failure"
+        
+        thought_lower = thought.lower().strip()
+        action_lower = action.lower().strip()
+        is_low_value_thought = any(pattern in thought_lower for pattern in LOW_VALUE_PATTERNS)
+        
+        # Content-based intro detection - only for longer videos and only before steps start
+        # Shorter videos typically jump right into the tutorial
+        if len(self.frames) >= INTRO_OUTRO_MIN_FRAMES and self.step_number == 1 and index < 5:
+            if any(pattern in thought_lower for pattern in INTRO_FRAME_PATTERNS):
+                return None, "intro_content"
+        
+        # Handle COMPLETE actions - only allow on the last frame
+        if 'complete' in action_lower:
+            if not is_last_frame:
+                return None, "complete_mid_video"
+            action = "COMPLETE"
+            thought = "Task completed successfully"
+            action_lower = "complete"
+        
+        if 'press' in action_lower and 'home' in action_lower:
+            if is_last_frame:
+                action = "COMPLETE"
+                thought = "Task completed successfully"
+                action_lower = "complete"
+            elif is_low_value_thought:
+                return None, "low_value_thought"
+        
+        if is_low_value_thought and not ('complete' in action_lower or 'press' in action_lower):
+            return None, "low_value_thought"
+        
+        # Handle SKIP responses from the model
+        if 'skip' in action_lower or 'skip' in thought_lower:
+            return None, "model_skip"
+        
+        action_clean = action_lower.replace('_', ' ').replace('-', ' ')
+        is_scroll = action_lower.startswith('scroll')
+        is_click = 'click' in action_clean and action_lower.startswith('click')
+        is_wait = action_lower.startswith('wait')
+        
+        # Skip consecutive SCROLL and WAIT actions
+        if self.action_history:
+            last_action = self.action_history[-1].strip().lower()
+            if is_scroll and 'scroll' in last_action:
+                self.duplicate_steps_filtered += 1
+                return None, "consecutive_scroll"
+            if is_wait and last_action.startswith('wait'):
+                self.duplicate_steps_filtered += 1
+                return None, "consecutive_wait"
+        
+        # Skip if thought is exactly the same as the previous step
+        if self.step_history:
+            prev_thought, _ = self.step_history[-1]
+            if prev_thought and thought.strip().lower() == prev_thought.strip().lower():
+                self.duplicate_steps_filtered += 1
+                return None, "duplicate_thought"
+        
+        if image_size is None:
+            return None, "image_load_failed"
+        
+        img_width, img_height = image_size
+        coords = extract_coordinates(action, img_width, img_height)
+        self.steps_with_thought_action += 1
+        
+        action_type = "unknown"
+        if is_click:
+            action_type = "click"
+        elif is_scroll:
+            action_type = "scroll"
+        elif 'slide' in action_clean and action_lower.startswith('slide'):
+            action_type = "slide"
+        elif 'type' in action_clean and action_lower.startswith('type'):
+            action_type = "type"
+        elif 'press' in action_clean and 'back' in action_clean:
+            action_type = "press_back"
+        elif 'press' in action_clean and 'home' in action_clean:
+            action_type = "press_home"
+        elif 'open' in action_clean and 'app' in action_clean:
+            action_type = "open_app"
+        elif 'complete' in action_clean:
+            action_type = "complete"
+        elif is_wait:
+            action_type = "wait"
+        
+        self.action_types[action_type] = self.action_types.get(action_type, 0) + 1
+        
+        if coords:
+            self.steps_with_coords += 1
+        
+        # Skip actions that require coordinates if coordinates are missing
+        if any(action_lower.startswith(prefix) for prefix in MUST_HAVE_COORDS) and not coords:
+            return None, "missing_coordinates"
+        
+        step = {
+            "step_number": self.step_number,
+            "frame": frame,
+            "thought": thought or "",
+            "action": action,
+            "action_type": action_type,
+            "coordinates": coords
+        }
+        self.action_history.append(action)
+        self.step_history.append((thought, action))
+        self.step_number += 1
+        return step, None
+
+    def metrics(self):
+        total_steps = self.step_number - 1
+        parse_failures = self.skipped_frames.get("parse_failure", 0)
+        return {
+            "total_steps": total_steps,
+            "steps_with_coordinates": self.steps_with_coords,
+            "steps_with_coordinates_percent": round(self.steps_with_coords / total_steps * 100, 2) if total_steps > 0 else 0,
+            "steps_with_thought_and_action": self.steps_with_thought_action,
+            "steps_complete_percent": round(self.steps_with_thought_action / total_steps * 100, 2) if total_steps > 0 else 0,
+            "duplicate_steps_filtered": self.duplicate_steps_filtered,
+            "frames_processed": self.frames_processed,
+            "action_type_distribution": self.action_types,
+            "parse_failures": parse_failures,
+            "parse_failure_rate_percent": round(parse_failures / self.frames_processed * 100, 2) if self.frames_processed > 0 else 0,
+            "skipped_frames": self.skipped_frames
+        }
+
+def assemble_steps(frames, outputs):
+    """Replays stored outputs ({frame: {"output_text", "width", "height"}}) through the filtering rules."""
+    assembler = StepAssembler(frames)
+    steps = []
+    for index, frame in enumerate(frames):
+        reason = assembler.position_skip(index)
+        record = outputs.get(frame)
+        if reason is None and record is None:
+            # Frames the live run never sent to the model (load failures, earlier position rules)
+            reason = "no_raw_output"
+        if reason is None:
+            size = (record["width"], record["height"]) if record.get("width") else None
+            step, reason = assembler.add(index, record["output_text"], size)
+            if step is not None:
+                steps.append(step)
+                continue
+        assembler.skip(reason)
+    return steps, assembler
+
+def write_step(output_path, video_id, step, img):
+    step_number, frame, coords = step["step_number"], step["frame"], step["coordinates"]
+    step_folder = os.path.join(output_path, f'step_{step_number:02d}')
+    os.makedirs(step_folder, exist_ok=True)
+    
+    if coords:
+        with span("draw_box", category="osatlas"):
+            img_with_box = draw_bounding_box(img, coords, step_number, step["action"])
+        with span("imwrite", category="osatlas"):
+            cv2.imwrite(os.path.join(step_folder, frame), img_with_box)
+    else:
+        # Save original image when no coordinates are needed or provided
+        with span("imwrite", category="osatlas"):
+            cv2.imwrite(os.path.join(step_folder, frame), img)
+    
+    step_details = {
+        "step_number": step_number,
+        "frame": frame,
+        "thought": step["thought"],
+        "action": step["action"],
+        "coordinates": coords
+    }
+    
+    with span("json_dump", category="osatlas"):
+        with open(os.path.join(step_folder, 'step_details.json'), 'w') as f:
+            json.dump(step_details, f, indent=2)
+    
+    img_height, img_width = img.shape[:2]
+    if coords:
+        box_width = min(120, int(img_width * 0.15))
+        box_height = min(120, int(img_height * 0.15))
+    else:
+        box_width = box_height = 100
+    
+    return {
+        "step": step_number,
+        "action": step["action"],
+        "boundingBox": {
+            "x": coords[0] if coords else 0,
+            "y": coords[1] if coords else 0,
+            "width": box_width,
+            "height": box_height
+        },
+        "image": f"/api-vnava22/images/{video_id}/step_{step_number:02d}/{frame}",
+        "thought": step["thought"]
+    }
+
+def save_raw_outputs(output_path, record):
+    with open(os.path.join(output_path, RAW_OUTPUTS_FILE), 'w') as f:
+        json.dump(record, f, indent=2)
+
+def load_raw_outputs(video_id):
+    path = f'output/videos/{video_id}/os_atlas_steps/{RAW_OUTPUTS_FILE}'
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def reprocess_video(video_id):
+    """Rebuilds the steps, step images and cached result of a video from its stored outputs.
+
+    The new step folders are built next to the old ones and swapped in only once every image
+    was written, so a missing screen or a crash leaves the previous result intact.
+    """
+    record = load_raw_outputs(video_id)
+    if record is None:
+        return None
+    start = time.time()
+    input_path = f'output/videos/{video_id}/ui-screens'
+    output_path = f'output/videos/{video_id}/os_atlas_steps'
+    
+    with span("assemble_steps", category="reprocess", video_id=video_id):
+        steps, assembler = assemble_steps(record["frames"], record["outputs"])
+    
+    images = {}
+    for step in steps:
+        img = cv2.imread(os.path.join(input_path, step["frame"]))
+        if img is None:
+            raise FileNotFoundError(f"UI screen {step['frame']} for {video_id} is missing")
+        images[step["frame"]] = img
+    
+    # A request writing this video's folders would race the swap
+    if not video_claims.try_acquire(video_id):
+        raise RuntimeError(f"{video_id} is being processed, try again later")
+    try:
+        staging_path = tempfile.mkdtemp(prefix=".os_atlas_steps.", dir=os.path.dirname(output_path))
+        try:
+            # Everything but the step folders (raw outputs, ...) carries over unchanged
+            for name in os.listdir(output_path):
+                if not name.startswith("step_"):
+                    shutil.copy2(os.path.join(output_path, name), staging_path)
+            result = [write_step(staging_path, video_id, step, images[step["frame"]]) for step in steps]
+            swap_directory(staging_path, output_path)
+        except Exception:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+        cache_video_result(video_id, result)
+    finally:
+        video_claims.release(video_id)
+    
+    metrics = dict(assembler.metrics(), reprocess_seconds=round(time.time() - start, 3))
+    return result, metrics
+
+def swap_directory(new_path, path):
+    old_path = f"{new_path}.old"
+    os.rename(path, old_path)
+    try:
+        os.rename(new_path, path)
+    except Exception:
+        os.rename(old_path, path)
+        raise
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def cached_video_ids():
+    cache_dir = "output/video_cache"
+    if not os.path.isdir(cache_dir):
+        return []
+    return sorted(f[:-5] for f in os.listdir(cache_dir) if f.endswith('.json'))
+
+def reprocess_videos(video_ids=None):
+    """Reprocesses the given videos, or every cached one; videos without stored outputs or that fail are reported, not rerun."""
+    report = {"reprocessed": {}, "missing_outputs": [], "errors": {}}
+    for video_id in video_ids or cached_video_ids():
+        try:
+            processed = reprocess_video(video_id)
+        except Exception as e:
+            # One broken video must not stop the rest of an --all run
+            report["errors"][video_id] = str(e)
+            continue
+        if processed is None:
+            report["missing_outputs"].append(video_id)
+            continue
+        report["reprocessed"][video_id] = processed[1]
+    return report
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+
+TRACE_DIR = "output/traces"
+# Fraction of requests traced; spans are no-ops for the rest
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+# Per-trace cap so a runaway loop cannot grow a trace without bound
+MAX_TRACE_EVENTS = 200000
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{random.getrandbits(32):08x}"
+        self.pid = os.getpid()
+        self.events = []
+        self.thread_names = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def add(self, name, category, start, end, args=None):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round(start * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": self.pid,
+            "tid": thread.ident
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            if len(self.events) >= MAX_TRACE_EVENTS:
+                self.dropped += 1
+                return
+            self.events.append(event)
+            self.thread_names.setdefault((self.pid, thread.ident), thread.name)
+
+    def merge(self, events, thread_names):
+        # Spans another process recorded against the same clock, e.g. a CPU pool worker
+        with self.lock:
+            room = max(0, MAX_TRACE_EVENTS - len(self.events))
+            self.events.extend(events[:room])
+            self.dropped += max(0, len(events) - room)
+            self.thread_names.update(thread_names)
+
+    def export(self):
+        with self.lock:
+            return list(self.events), dict(self.thread_names)
+
+    def to_chrome_trace(self):
+        events, thread_names = self.export()
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for (pid, tid), name in thread_names.items()
+        ]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.trace_id, "name": self.name, "dropped_events": self.dropped}
+        }
+
+    def save(self, trace_dir=TRACE_DIR):
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"{self.trace_id}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+        return path
+
+def start_trace(name, sample_rate=None):
+    if sample_rate is None:
+        sample_rate = TRACE_SAMPLE_RATE
+    trace = Trace(name) if sample_rate > 0 and random.random() < sample_rate else None
+    current_trace.set(trace)
+    return trace
+
+def end_trace():
+    current_trace.set(None)
+
+@contextmanager
+def span(name, category="pipeline", **args):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        trace.add(name, category, start, time.time(), args)
+
+def record_span(name, start, end, category="pipeline", **args):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, category, start, end, args)
+
+def propagate_context(target):
+    # Threads start with an empty context, carry the active trace over to the worker
+    context = contextvars.copy_context()
+    def run(*args, **kwargs):
+        return context.run(target, *args, **kwargs)
+    return run
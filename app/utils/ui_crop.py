@@ -1,6 +1,39 @@
 import cv2
 import numpy as np
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.tracing import span, propagate_context
+
+# "content" locates the phone display once per video, "fixed" keeps the aspect-ratio based crop
+UI_CROP_MODE = os.environ.get("UI_CROP_MODE", "content")
+LOCALIZATION_SAMPLES = 5
+# Rows/columns darker and flatter than this are treated as letterbox bars
+LETTERBOX_MAX_MEAN = 20
+LETTERBOX_MAX_STD = 8
+SCREEN_MIN_AREA = 0.08
+SCREEN_MIN_RECTANGULARITY = 0.85
+# Phone displays are between 4:3 and 22:9 in either orientation
+SCREEN_MIN_ASPECT, SCREEN_MAX_ASPECT = 1.3, 2.5
+# imread/resize/imwrite release the GIL, so frames are cropped on a thread pool shared by all requests
+UI_CROP_WORKERS = int(os.environ.get("UI_CROP_WORKERS", min(8, os.cpu_count() or 1)))
+# OpenCV's own threads per call; parallelism comes from the pool, more would oversubscribe the cores
+UI_CROP_CV_THREADS = int(os.environ.get("UI_CROP_CV_THREADS", "1"))
+JPEG_QUALITY = 95
+
+crop_executor = None
+crop_executor_lock = threading.Lock()
+
+def get_crop_executor():
+    global crop_executor
+    with crop_executor_lock:
+        if crop_executor is None:
+            cv2.setNumThreads(UI_CROP_CV_THREADS)
+            crop_executor = ThreadPoolExecutor(max_workers=UI_CROP_WORKERS, thread_name_prefix="ui-crop")
+        return crop_executor
+
+# Qwen2-VL merges 2x2 patches of 14px, one vision token per 28x28 block
+VISION_TOKEN_PIXELS = 28
 
 def detect_phone_screen(frame):
     height, width = frame.shape[:2]
@@ -28,6 +61,87 @@ def detect_phone_screen(frame):
     
     return (x, y, crop_w, crop_h)
 
+def detect_letterbox(gray):
+    row_content = (gray.mean(axis=1) > LETTERBOX_MAX_MEAN) | (gray.std(axis=1) > LETTERBOX_MAX_STD)
+    col_content = (gray.mean(axis=0) > LETTERBOX_MAX_MEAN) | (gray.std(axis=0) > LETTERBOX_MAX_STD)
+    rows, cols = np.flatnonzero(row_content), np.flatnonzero(col_content)
+    if rows.size == 0 or cols.size == 0:
+        return None
+    return (int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+
+def find_screen_contour(gray, content_rect):
+    cx, cy, cw, ch = content_rect
+    region = gray[cy:cy+ch, cx:cx+cw]
+    edges = cv2.Canny(cv2.GaussianBlur(region, (5, 5), 0), 40, 120)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    
+    best, best_area = None, 0
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        area = w * h
+        if area < SCREEN_MIN_AREA * cw * ch or area >= 0.95 * cw * ch:
+            continue
+        aspect = max(w, h) / max(1, min(w, h))
+        if not SCREEN_MIN_ASPECT <= aspect <= SCREEN_MAX_ASPECT:
+            continue
+        if cv2.contourArea(contour) < SCREEN_MIN_RECTANGULARITY * area:
+            continue
+        if area > best_area:
+            best, best_area = (cx + x, cy + y, w, h), area
+    return best
+
+def locate_phone_screen(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    content_rect = detect_letterbox(gray)
+    if content_rect is None:
+        return None
+    
+    screen_rect = find_screen_contour(gray, content_rect)
+    if screen_rect is not None:
+        return screen_rect
+    
+    # No display outline: a screen recording, either full frame (portrait) or pillarboxed inside a landscape frame
+    _, _, cw, ch = content_rect
+    if height > width or cw * ch < 0.9 * width * height:
+        return content_rect
+    return None
+
+def rect_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    overlap_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    overlap = overlap_w * overlap_h
+    return overlap / (aw * ah + bw * bh - overlap)
+
+def localize_phone_screen(sample_frames):
+    detections = [rect for rect in (locate_phone_screen(frame) for frame in sample_frames) if rect is not None]
+    if len(detections) * 2 <= len(sample_frames):
+        return None, len(detections)
+    
+    # Median per edge is robust to a frame where a hand or overlay shifted the outline
+    median_rect = tuple(int(v) for v in np.median(np.array(detections), axis=0))
+    agreeing = sum(1 for rect in detections if rect_iou(rect, median_rect) >= 0.8)
+    if agreeing * 2 <= len(sample_frames):
+        return None, len(detections)
+    return median_rect, len(detections)
+
+def estimate_vision_tokens(width, height):
+    return max(1, round(width / VISION_TOKEN_PIXELS)) * max(1, round(height / VISION_TOKEN_PIXELS))
+
+def crop_output_size(rect):
+    # Mirrors the resize bounds in crop_phone_screen
+    _, _, w, h = rect
+    if w < 200 or h < 300:
+        scale = max(200 / w, 300 / h)
+    elif w > 1200 or h > 1800:
+        scale = min(1200 / w, 1800 / h)
+    else:
+        scale = 1.0
+    return int(w * scale), int(h * scale)
+
 def crop_phone_screen(frame, phone_rect):
     if phone_rect is None:
         return frame
@@ -57,12 +171,32 @@ def crop_phone_screen(frame, phone_rect):
     
     return phone_area
 
-def extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=None):
+def crop_frame(input_path, output_path, frame_file, screen_rect, frame_shape):
+    with span("imread", frame=frame_file):
+        img = cv2.imread(os.path.join(input_path, frame_file))
+    
+    if img is None:
+        return False
+    
+    if screen_rect is not None and img.shape == frame_shape:
+        phone_rect = screen_rect
+    else:
+        with span("detect_phone_screen"):
+            phone_rect = detect_phone_screen(img)
+    with span("crop_phone_screen"):
+        cropped_screen = crop_phone_screen(img, phone_rect)
+    
+    if cropped_screen is None or cropped_screen.size == 0:
+        return False
+    with span("imwrite", frame=frame_file):
+        return cv2.imwrite(os.path.join(output_path, frame_file), cropped_screen, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+
+def extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=None, workers=None):
     if video_id is None:
         video_dirs = os.listdir(input_folder)
         for vd in video_dirs:
             if os.path.isdir(os.path.join(input_folder, vd)):
-                extract_ui_screenshots(input_folder, output_folder, vd)
+                extract_ui_screenshots(input_folder, output_folder, vd, workers)
         return
     
     input_path = os.path.join(input_folder, video_id, "frames")
@@ -79,22 +213,63 @@ def extract_ui_screenshots(input_folder="output/videos", output_folder="output/v
     
     print(f"UI screen extraction started: processing {len(frame_files)} frames")
     
-    for frame_file in frame_files:
-        img_path = os.path.join(input_path, frame_file)
-        img = cv2.imread(img_path)
-        
-        if img is None:
-            failed += 1
-            continue
-        
-        phone_rect = detect_phone_screen(img)
-        cropped_screen = crop_phone_screen(img, phone_rect)
-        
-        if cropped_screen is not None and cropped_screen.size > 0:
-            output_file = os.path.join(output_path, frame_file)
-            cv2.imwrite(output_file, cropped_screen, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            successful += 1
-        else:
-            failed += 1
-    
-    print(f"UI screen extraction completed: {successful} successful, {failed} failed")
\ No newline at end of file
+    # The phone does not move within a tutorial, locate it on a few frames and slice the rest
+    screen_rect, detections, frame_shape, sample_count = None, 0, None, 0
+    if UI_CROP_MODE == "content" and frame_files:
+        with span("localize_phone_screen"):
+            sample_indices = sorted(set(np.linspace(0, len(frame_files) - 1, min(LOCALIZATION_SAMPLES, len(frame_files))).astype(int)))
+            samples = [cv2.imread(os.path.join(input_path, frame_files[i])) for i in sample_indices]
+            samples = [frame for frame in samples if frame is not None]
+            sample_count = len(samples)
+            if samples:
+                frame_shape = samples[0].shape
+                samples = [frame for frame in samples if frame.shape == frame_shape]
+                screen_rect, detections = localize_phone_screen(samples)
+    
+    # A worker count gets a dedicated pool (benchmarks), otherwise the shared pool bounds all requests together
+    if workers is None:
+        executor, owned = get_crop_executor(), False
+    else:
+        cv2.setNumThreads(UI_CROP_CV_THREADS)
+        executor, owned = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-crop"), True
+    try:
+        futures = [
+            executor.submit(propagate_context(crop_frame), input_path, output_path, frame_file, screen_rect, frame_shape)
+            for frame_file in frame_files
+        ]
+        for future in futures:
+            if future.result():
+                successful += 1
+            else:
+                failed += 1
+    finally:
+        if owned:
+            executor.shutdown()
+    
+    print(f"UI screen extraction completed: {successful} successful, {failed} failed")
+    
+    metrics = {
+        "crop_method": "content" if screen_rect is not None else "fixed",
+        "successful": successful,
+        "failed": failed,
+        "sampled_frames": sample_count,
+        "detections": detections
+    }
+    if frame_shape is not None:
+        height, width = frame_shape[:2]
+        fixed_rect = detect_phone_screen(np.empty((height, width, 1), np.uint8))
+        rect = screen_rect or fixed_rect
+        tokens = estimate_vision_tokens(*crop_output_size(rect))
+        fixed_tokens = estimate_vision_tokens(*crop_output_size(fixed_rect))
+        metrics.update({
+            "frame_size": [width, height],
+            "screen_rect": list(rect),
+            "crop_area_percent": round(rect[2] * rect[3] / (width * height) * 100, 2),
+            "fixed_crop_area_percent": round(fixed_rect[2] * fixed_rect[3] / (width * height) * 100, 2),
+            "area_reduction_percent": round((1 - rect[2] * rect[3] / (fixed_rect[2] * fixed_rect[3])) * 100, 2),
+            "est_vision_tokens_per_frame": tokens,
+            "fixed_est_vision_tokens_per_frame": fixed_tokens,
+            "est_vision_tokens_saved": (fixed_tokens - tokens) * successful
+        })
+        print(f"Phone screen {metrics['crop_method']} crop {rect}: {metrics['area_reduction_percent']}% less area than the fixed crop")
+    return metrics
@@ -2,22 +2,39 @@ import yt_dlp
 import os
 import shutil
 import json
-import sys
-from contextlib import contextmanager
+import time
+import threading
+from yt_dlp.cookies import extract_cookies_from_browser
+from app.utils.tracing import span
 
-@contextmanager
-def suppress_stdout_stderr():
-    original_stdout = sys.stdout
-    original_stderr = sys.stderr
-    try:
-        sys.stdout = open(os.devnull, 'w')
-        sys.stderr = open(os.devnull, 'w')
-        yield
-    finally:
-        sys.stdout.close()
-        sys.stderr.close()
-        sys.stdout = original_stdout
-        sys.stderr = original_stderr
+# "minimal" fetches the smallest video-only stream that still meets TARGET_RESOLUTION,
+# "full" keeps the original best-quality audio+video download
+DOWNLOAD_PROFILE = os.environ.get("VIDEO_DOWNLOAD_PROFILE", "minimal")
+# Frames are cropped and capped at 1200x1800 before inference, so the shorter side rarely needs more than 720px
+TARGET_RESOLUTION = int(os.environ.get("VIDEO_TARGET_RESOLUTION", "720"))
+VIDEO_EXTENSIONS = (".mp4", ".webm", ".mkv")
+
+# Browser whose cookie database is decrypted once per process, empty to disable
+COOKIES_BROWSER = os.environ.get("YTDLP_COOKIES_BROWSER", "chrome")
+CONCURRENT_FRAGMENTS = int(os.environ.get("YTDLP_CONCURRENT_FRAGMENTS", "4"))
+# Attempts with the requested profile before the fallback format; retries resume the .part file
+DOWNLOAD_ATTEMPTS = 2
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+class SilentLogger:
+    # Also passed to cookie extraction, which calls info() and warning(msg, only_once=...)
+    def debug(self, msg):
+        pass
+    
+    def info(self, msg):
+        pass
+    
+    def warning(self, msg, only_once=False):
+        pass
+    
+    def error(self, msg):
+        pass
 
 def setup_folders(video_id, base_output_dir="output"):
     video_dir = os.path.join(base_output_dir, "videos", video_id)
@@ -31,7 +48,200 @@ def setup_folders(video_id, base_output_dir="output"):
             shutil.rmtree(subdir_path)
         os.makedirs(subdir_path, exist_ok=True)
 
-def download_video(video_url, output_folder="output/videos", video_id=None):
+def build_download_options(profile=DOWNLOAD_PROFILE, target_resolution=TARGET_RESOLUTION):
+    ydl_opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "noprogress": True,
+        # Output goes through the logger, never through the process-wide sys.stdout/sys.stderr
+        "logger": SilentLogger(),
+        "ignoreerrors": True,
+        "extract_flat": False,
+        "noplaylist": True,
+        "user_agent": USER_AGENT,
+        "referer": "https://www.youtube.com/",
+        "continuedl": True,
+        "nopart": False,
+        "concurrent_fragment_downloads": CONCURRENT_FRAGMENTS,
+        "http_chunk_size": 10 * 1024 * 1024,
+        "retries": 3,
+        "fragment_retries": 3,
+    }
+    
+    if profile == "full":
+        ydl_opts.update({
+            "format": "best[ext=mp4]/best",
+            "writeinfojson": True,
+            "writethumbnail": True,
+            "sleep_interval": 1,
+            "max_sleep_interval": 5,
+        })
+    elif profile == "fallback":
+        ydl_opts.update({
+            "format": "best",
+            "source_address": "0.0.0.0",
+        })
+    else:
+        # Worst video-only stream whose shorter side meets the target, then the best
+        # available below it, with muxed streams as a last resort
+        min_side = f"[height>={target_resolution}][width>={target_resolution}]"
+        ydl_opts.update({
+            "format": f"wv{min_side}[ext=mp4]/wv{min_side}/bv[ext=mp4]/bv/b[ext=mp4]/b",
+            "writeinfojson": False,
+            "writethumbnail": False,
+        })
+    
+    return ydl_opts
+
+def find_downloaded_video(video_folder, video_id=None):
+    video_files = sorted(f for f in os.listdir(video_folder) if f.endswith(VIDEO_EXTENSIONS))
+    
+    if video_id:
+        for f in video_files:
+            if video_id in f:
+                return os.path.join(video_folder, f)
+    
+    if video_files:
+        return os.path.join(video_folder, video_files[0])
+    return None
+
+def build_download_metrics(video_path, download_stats, download_start, profile, info=None):
+    file_size = os.path.getsize(video_path)
+    download_seconds = time.time() - download_start
+    resumed_bytes = download_stats.get("resumed_bytes", 0)
+    downloaded_bytes = max(0, (download_stats.get("downloaded_bytes") or file_size) - resumed_bytes)
+    
+    metrics = {
+        "profile": profile,
+        "downloaded_bytes": downloaded_bytes,
+        "file_size_bytes": file_size,
+        "download_seconds": round(download_seconds, 2),
+        "throughput_mbps": round(downloaded_bytes * 8 / download_seconds / 1e6, 2) if download_seconds > 0 else 0,
+        "attempts": download_stats.get("attempts", 1),
+        "resumed_bytes": resumed_bytes
+    }
+    
+    if info:
+        metrics["format_id"] = info.get("format_id")
+        if info.get("width") and info.get("height"):
+            metrics["resolution"] = f"{info['width']}x{info['height']}"
+        metrics["vcodec"] = info.get("vcodec")
+        metrics["has_audio"] = info.get("acodec") not in (None, "none")
+    
+    return metrics
+
+class VideoDownloader:
+    def __init__(self, cookies_browser=COOKIES_BROWSER):
+        self.cookies_browser = cookies_browser
+        self.cookiejar = None
+        self.cookies_loaded = False
+        # YoutubeDL instances are not thread-safe: each download checks one out per profile,
+        # idle ones are reused so concurrent downloads (user requests, warmer, prefetch) never wait on each other
+        self.idle_instances = {}
+        self.lock = threading.Lock()
+    
+    def load_cookies(self):
+        with self.lock:
+            if self.cookies_loaded:
+                return self.cookiejar
+            
+            self.cookies_loaded = True
+            if not self.cookies_browser:
+                return None
+            
+            try:
+                self.cookiejar = extract_cookies_from_browser(self.cookies_browser, logger=SilentLogger())
+                print(f"Loaded {len(self.cookiejar)} cookies from {self.cookies_browser}")
+            except Exception as e:
+                print(f"Could not load cookies from {self.cookies_browser}: {e}")
+                self.cookiejar = None
+            
+            return self.cookiejar
+    
+    def use_cookies_from(self, other):
+        cookiejar = other.load_cookies()
+        with self.lock:
+            self.cookiejar = cookiejar
+            self.cookies_loaded = True
+    
+    def acquire_instance(self, profile):
+        with self.lock:
+            idle = self.idle_instances.get(profile)
+            if idle:
+                return idle.pop()
+        
+        ydl_opts = build_download_options(profile)
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        ydl.download_stats = None
+        ydl.add_progress_hook(lambda status: self.progress_hook(ydl, status))
+        
+        cookiejar = self.load_cookies()
+        if cookiejar is not None:
+            # Share the decrypted jar instead of having every instance re-read the browser database
+            ydl.cookiejar = cookiejar
+        return ydl
+    
+    def release_instance(self, profile, ydl):
+        ydl.download_stats = None
+        with self.lock:
+            self.idle_instances.setdefault(profile, []).append(ydl)
+    
+    def progress_hook(self, ydl, status):
+        if ydl.download_stats is not None and status.get("status") == "finished":
+            ydl.download_stats["downloaded_bytes"] += status.get("downloaded_bytes") or status.get("total_bytes") or 0
+    
+    def download(self, video_url, video_folder, profile=DOWNLOAD_PROFILE):
+        attempt_profiles = [profile] * DOWNLOAD_ATTEMPTS + ["fallback"]
+        download_stats = {"downloaded_bytes": 0, "resumed_bytes": 0, "attempts": 0}
+        download_start = time.time()
+        
+        for attempt_profile in attempt_profiles:
+            download_stats["attempts"] += 1
+            # yt-dlp continues from existing .part files, so those bytes are not fetched again
+            download_stats["resumed_bytes"] = sum(
+                os.path.getsize(os.path.join(video_folder, f)) for f in os.listdir(video_folder) if f.endswith(".part")
+            )
+            
+            ydl = self.acquire_instance(attempt_profile)
+            ydl.params["outtmpl"]["default"] = f"{video_folder}/%(id)s.%(ext)s"
+            ydl.download_stats = download_stats
+            try:
+                with span("yt_dlp_download", category="download", attempt=download_stats["attempts"], profile=attempt_profile):
+                    info = ydl.extract_info(video_url, download=True)
+            except Exception as e:
+                print(f"Download attempt {download_stats['attempts']} ({attempt_profile}) failed: {e}")
+                continue
+            finally:
+                self.release_instance(attempt_profile, ydl)
+            
+            if not info:
+                print(f"Download attempt {download_stats['attempts']} ({attempt_profile}) failed")
+                continue
+            
+            with span("find_downloaded_video", category="download"):
+                video_path = find_downloaded_video(video_folder, info.get("id"))
+            if not video_path:
+                continue
+            
+            file_size = os.path.getsize(video_path)
+            if file_size > 0:
+                label = " (fallback)" if attempt_profile == "fallback" else ""
+                print(f"Video downloaded{label}: {os.path.basename(video_path)} ({file_size / (1024*1024):.1f} MB)")
+                return video_path, build_download_metrics(video_path, download_stats, download_start, attempt_profile, info)
+            
+            os.remove(video_path)
+        
+        return None, {}
+
+downloader = None
+
+def get_downloader():
+    global downloader
+    if downloader is None:
+        downloader = VideoDownloader()
+    return downloader
+
+def download_video(video_url, output_folder="output/videos", video_id=None, profile=DOWNLOAD_PROFILE):
     if video_id is None:
         from urllib.parse import urlparse, parse_qs
         import hashlib
@@ -50,74 +260,5 @@ def download_video(video_url, output_folder="output/videos", video_id=None):
     
     video_folder = os.path.join(output_folder, video_id)
     os.makedirs(video_folder, exist_ok=True)
-
-    ydl_opts = {
-        "format": "best[ext=mp4]/best",
-        "outtmpl": f"{video_folder}/%(id)s.%(ext)s",
-        "quiet": True,
-        "no_warnings": True,
-        "writeinfojson": True,
-        "writethumbnail": True,
-        "ignoreerrors": True,
-        "extract_flat": False,
-        "noplaylist": True,
-        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "referer": "https://www.youtube.com/",
-        "sleep_interval": 1,
-        "max_sleep_interval": 5,
-    }
     
-    ydl_opts["cookiesfrombrowser"] = ("chrome",)
-
-    try:
-        with suppress_stdout_stderr():
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=True)
-        
-        video_path = None
-        for f in os.listdir(video_folder):
-            if f.endswith(".mp4") and info["id"] in f:
-                video_path = os.path.join(video_folder, f)
-                break
-        
-        if not video_path:
-            mp4_files = [f for f in os.listdir(video_folder) if f.endswith(".mp4")]
-            if mp4_files:
-                video_path = os.path.join(video_folder, mp4_files[0])
-        
-        if video_path and os.path.exists(video_path):
-            file_size = os.path.getsize(video_path)
-            if file_size > 0:
-                print(f"Video downloaded: {os.path.basename(video_path)} ({file_size / (1024*1024):.1f} MB)")
-                return video_path
-            else:
-                os.remove(video_path)
-                return None
-        
-    except Exception as e:
-        try:
-            fallback_opts = {
-                "format": "best",
-                "outtmpl": f"{video_folder}/%(id)s.%(ext)s",
-                "force-ipv4": True,
-                "quiet": True,
-                "no_warnings": True
-            }
-            with suppress_stdout_stderr():
-                with yt_dlp.YoutubeDL(fallback_opts) as ydl:
-                    ydl.download([video_url])
-            
-            mp4_files = [f for f in os.listdir(video_folder) if f.endswith(".mp4")]
-            if mp4_files:
-                video_path = os.path.join(video_folder, mp4_files[0])
-                file_size = os.path.getsize(video_path)
-                if file_size > 0:
-                    print(f"Video downloaded (fallback): {os.path.basename(video_path)} ({file_size / (1024*1024):.1f} MB)")
-                    return video_path
-                else:
-                    os.remove(video_path)
-                    return None
-        except:
-            pass
-
-    return None
\ No newline at end of file
+    return get_downloader().download(video_url, video_folder, profile)
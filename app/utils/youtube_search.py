@@ -1,6 +1,9 @@
-import requests
+import os
 import re
 from datetime import datetime
+from app.utils.api_cache import cached_api_get, quota_remaining
+from app.utils.search_variants import rank_search_variants, record_variant_yield
+from app.utils.tracing import span
 
 YOUTUBE_API_KEY = "" # Add your API Key here
 
@@ -46,6 +49,15 @@ def get_duration_rank(duration):
     else:
         return 999
 
+ISO8601_DURATION = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+def parse_iso8601_duration(duration_str):
+    match = ISO8601_DURATION.match(duration_str or "")
+    if not match:
+        return 0
+    days, hours, minutes, seconds = (int(part) if part else 0 for part in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
 def has_tutorial_indicators(title, description):
     tutorial_terms = [
         "how to", "tutorial", "guide", "step by step", "walkthrough",
@@ -215,56 +227,65 @@ def create_search_queries(original_query):
     
     return unique_queries[:8]
 
-def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration_seconds=20):
-    search_queries = create_search_queries(query)
-    all_videos = []
-    
-    for search_query in search_queries:
-        search_url = "https://www.googleapis.com/youtube/v3/search"
-        search_params = {
-            "part": "snippet",
-            "q": search_query,
-            "type": "video",
-            "maxResults": max(10, max_results // len(search_queries) + 5),
-            "key": YOUTUBE_API_KEY,
-            "relevanceLanguage": "en",
-            "order": "relevance",
-            "videoDefinition": "high",
-            "videoCategoryId": "28",
-            "safeSearch": "moderate"
-        }
-
-        try:
-            response = requests.get(search_url, params=search_params).json()
-            if "error" in response:
-                error_info = response.get("error", {})
-                print(f"YouTube API Error: {error_info}")
-                continue
-        except Exception as e:
-            print(f"YouTube Search API request failed: {str(e)}")
-            continue
-
-        for item in response.get("items", []):
-            video_id = item["id"]["videoId"]
-            title = item["snippet"]["title"]
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            
-            if not any(v["id"] == video_id for v in all_videos):
-                published_at = item["snippet"].get("publishedAt", "")
-                all_videos.append({
-                    "id": video_id, 
-                    "title": title, 
-                    "url": video_url,
-                    "search_query": search_query,
-                    "published_at": published_at
-                })
-
-    if not all_videos:
-        print("No videos found from YouTube search")
-        return None
-
-    video_ids = [v["id"] for v in all_videos]
+SHORTLIST_SIZE = 3
+
+# "incremental" searches the query variants one at a time and stops once a high-confidence
+# candidate exists, "exhaustive" searches every variant before ranking
+SEARCH_MODE = os.environ.get("YOUTUBE_SEARCH_MODE", "incremental")
+EARLY_STOP_MIN_VARIANTS = 2
+SEARCH_QUOTA_COST = 100
+DETAILS_QUOTA_COST = 1
+
+STOP_WORDS = {'how', 'to', 'a', 'an', 'the', 'on', 'in', 'at', 'for', 'of', 'with', 'do', 'i', 'you', 'my', 'me'}
+
+ENGAGEMENT_STRICT_MIN_LIKES = 10
+ENGAGEMENT_STRICT_MIN_RATIO = 0.015
+ENGAGEMENT_RELAXED_MIN_LIKES = 3
+ENGAGEMENT_RELAXED_MIN_RATIO = 0.005
+RELEVANCE_THRESHOLD = 0.75
+SECONDARY_RELEVANCE_THRESHOLD = 0.6
+
+def search_videos(search_query, results_per_query, cache_only=False):
+    search_url = "https://www.googleapis.com/youtube/v3/search"
+    search_params = {
+        "part": "snippet",
+        "q": search_query,
+        "type": "video",
+        "maxResults": results_per_query,
+        "key": YOUTUBE_API_KEY,
+        "relevanceLanguage": "en",
+        "order": "relevance",
+        "videoDefinition": "high",
+        "videoCategoryId": "28",
+        "safeSearch": "moderate"
+    }
 
+    try:
+        with span("youtube_api_search", category="search", query=search_query):
+            response = cached_api_get(search_url, search_params, cache_only=cache_only)
+        if response is None:
+            return []
+        if "error" in response:
+            error_info = response.get("error", {})
+            print(f"YouTube API Error: {error_info}")
+            return []
+    except Exception as e:
+        print(f"YouTube Search API request failed: {str(e)}")
+        return []
+
+    videos = []
+    for item in response.get("items", []):
+        video_id = item["id"]["videoId"]
+        videos.append({
+            "id": video_id,
+            "title": item["snippet"]["title"],
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "search_query": search_query,
+            "published_at": item["snippet"].get("publishedAt", "")
+        })
+    return videos
+
+def fetch_video_details(video_ids, cache_only=False):
     details_url = "https://www.googleapis.com/youtube/v3/videos"
     details_params = {
         "part": "contentDetails,statistics,snippet",
@@ -273,7 +294,10 @@ def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration
     }
 
     try:
-        details_response = requests.get(details_url, params=details_params).json()
+        with span("youtube_api_videos", category="search", ids=len(video_ids)):
+            details_response = cached_api_get(details_url, details_params, cache_only=cache_only)
+        if details_response is None:
+            return None
         if "error" in details_response:
             error_info = details_response.get("error", {})
             print(f"YouTube API Error: {error_info}")
@@ -282,73 +306,62 @@ def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration
         print(f"YouTube Video Details API request failed: {str(e)}")
         return None
 
-    scored_videos = []
-    for item in details_response.get("items", []):
-        duration_str = item["contentDetails"]["duration"]
-        definition = item["contentDetails"].get("definition", "sd")
-
-        hours = int(re.search(r'(\d+)H', duration_str).group(1)) if re.search(r'(\d+)H', duration_str) else 0
-        minutes = int(re.search(r'(\d+)M', duration_str).group(1)) if re.search(r'(\d+)M', duration_str) else 0
-        seconds = int(re.search(r'(\d+)S', duration_str).group(1)) if re.search(r'(\d+)S', duration_str) else 0
-
-        total_seconds = hours * 3600 + minutes * 60 + seconds
-
-        if min_duration_seconds <= total_seconds <= max_duration_seconds:
-            for vr in all_videos:
-                if vr["id"] == item["id"]:
-                    published_at = vr.get("published_at", "")
-                    
-                    try:
-                        if published_at:
-                            publish_str = published_at.replace('Z', '').split('.')[0]
-                            publish_date = datetime.strptime(publish_str, '%Y-%m-%dT%H:%M:%S')
-                            years_ago = (datetime.now() - publish_date).days / 365.25
-                            if years_ago > 5:
-                                continue
-                    except:
-                        pass
-                    
-                    vr["duration_seconds"] = total_seconds
-                    vr["views"] = int(item["statistics"].get("viewCount", 0))
-                    vr["likes"] = int(item["statistics"].get("likeCount", 0))
-                    vr["definition"] = definition
-                    vr["description"] = item["snippet"].get("description", "")
-                    vr["channel"] = item["snippet"].get("channelTitle", "")
-                    
-                    like_to_view_ratio = vr["likes"] / vr["views"] if vr["views"] > 0 else 0
-                    vr["like_to_view_ratio"] = like_to_view_ratio
-                    
-                    scored_videos.append(vr)
-                    break
+    return details_response.get("items", [])
 
-    if not scored_videos:
-        return None
+def apply_video_details(candidate_index, detail_items, min_duration_seconds, max_duration_seconds):
+    scored_videos = []
+    now = datetime.now()
+    for item in detail_items:
+        total_seconds = parse_iso8601_duration(item["contentDetails"]["duration"])
+        if not (min_duration_seconds <= total_seconds <= max_duration_seconds):
+            continue
+        
+        vr = candidate_index.get(item["id"])
+        if vr is None:
+            continue
+        
+        published_at = vr.get("published_at", "")
+        try:
+            if published_at:
+                publish_str = published_at.replace('Z', '').split('.')[0]
+                publish_date = datetime.strptime(publish_str, '%Y-%m-%dT%H:%M:%S')
+                years_ago = (now - publish_date).days / 365.25
+                if years_ago > 5:
+                    continue
+        except:
+            pass
+        
+        vr["duration_seconds"] = total_seconds
+        vr["views"] = int(item["statistics"].get("viewCount", 0))
+        vr["likes"] = int(item["statistics"].get("likeCount", 0))
+        vr["definition"] = item["contentDetails"].get("definition", "sd")
+        vr["description"] = item["snippet"].get("description", "")
+        vr["channel"] = item["snippet"].get("channelTitle", "")
+        vr["like_to_view_ratio"] = vr["likes"] / vr["views"] if vr["views"] > 0 else 0
+        
+        scored_videos.append(vr)
+    return scored_videos
 
+def rank_videos(query, scored_videos):
     query_lower = query.lower()
-    stop_words = {'how', 'to', 'a', 'an', 'the', 'on', 'in', 'at', 'for', 'of', 'with', 'do', 'i', 'you', 'my', 'me'}
     
     query_words = re.sub(r'[^\w\s]', '', query_lower).split()
-    query_key_words = [w for w in query_words if w not in stop_words and len(w) > 1]
+    query_key_words = [w for w in query_words if w not in STOP_WORDS and len(w) > 1]
     keyword_profile = build_keyword_profile(query_key_words)
     
     for video in scored_videos:
+        if "combined_relevance_score" in video:
+            continue
         metrics = compute_keyword_metrics(
             query_lower=query_lower,
             query_key_words=query_key_words,
             keyword_profile=keyword_profile,
             title=video.get("title", ""),
             description=video.get("description", ""),
-            stop_words=stop_words
+            stop_words=STOP_WORDS
         )
         video.update(metrics)
     
-    engagement_strict_min_likes = 10
-    engagement_strict_min_ratio = 0.015
-    engagement_relaxed_min_likes = 3
-    engagement_relaxed_min_ratio = 0.005
-    relevance_threshold = 0.75
-    secondary_relevance_threshold = 0.6
-    
     high_confidence = []
     relevance_only = []
     backup_candidates = []
@@ -369,34 +382,34 @@ def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration
         video["_duration_rank"] = duration_rank
         
         is_relevant = (
-            video.get("keyword_match_ratio", 0.0) >= relevance_threshold
-            or video.get("weighted_keyword_ratio", 0.0) >= relevance_threshold
+            video.get("keyword_match_ratio", 0.0) >= RELEVANCE_THRESHOLD
+            or video.get("weighted_keyword_ratio", 0.0) >= RELEVANCE_THRESHOLD
             or video.get("has_exact_match")
         )
 
         if is_relevant:
-            if likes >= engagement_strict_min_likes and like_ratio >= engagement_strict_min_ratio:
+            if likes >= ENGAGEMENT_STRICT_MIN_LIKES and like_ratio >= ENGAGEMENT_STRICT_MIN_RATIO:
                 high_confidence.append(video)
-            elif likes >= engagement_relaxed_min_likes and like_ratio >= engagement_relaxed_min_ratio:
+            elif likes >= ENGAGEMENT_RELAXED_MIN_LIKES and like_ratio >= ENGAGEMENT_RELAXED_MIN_RATIO:
                 relevance_only.append(video)
             else:
                 relevance_only.append(video)
         else:
             if (
-                video.get("keyword_match_ratio", 0.0) >= secondary_relevance_threshold
-                or video.get("weighted_keyword_ratio", 0.0) >= secondary_relevance_threshold
+                video.get("keyword_match_ratio", 0.0) >= SECONDARY_RELEVANCE_THRESHOLD
+                or video.get("weighted_keyword_ratio", 0.0) >= SECONDARY_RELEVANCE_THRESHOLD
                 or video.get("has_any_keyword_signal")
             ):
                 backup_candidates.append(video)
     
     if high_confidence:
-        candidate_videos = high_confidence
+        candidate_videos, tier = high_confidence, "high_confidence"
     elif relevance_only:
-        candidate_videos = relevance_only
+        candidate_videos, tier = relevance_only, "relevance_only"
     elif backup_candidates:
-        candidate_videos = backup_candidates
+        candidate_videos, tier = backup_candidates, "backup"
     else:
-        candidate_videos = scored_videos
+        candidate_videos, tier = list(scored_videos), "unfiltered"
     
     def sort_key(video):
         return (
@@ -409,7 +422,91 @@ def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration
         )
     
     candidate_videos.sort(key=sort_key)
-    filtered_videos = candidate_videos
+    return candidate_videos, tier
+
+def rank_candidate_sets(candidate_sets):
+    # Offline batch API: {query: [candidates with details applied]} -> {query: (ranked candidates, tier)}
+    return {query: rank_videos(query, videos) for query, videos in candidate_sets.items()}
+
+def exhaustive_search(query, search_queries, results_per_query, min_duration_seconds, max_duration_seconds):
+    all_videos = {}
+    
+    for search_query in search_queries:
+        for video in search_videos(search_query, results_per_query):
+            all_videos.setdefault(video["id"], video)
+
+    if not all_videos:
+        print("No videos found from YouTube search")
+        return [], len(search_queries)
+
+    detail_items = fetch_video_details(list(all_videos))
+    if detail_items is None:
+        return [], len(search_queries)
+
+    scored_videos = apply_video_details(all_videos, detail_items, min_duration_seconds, max_duration_seconds)
+    if not scored_videos:
+        return [], len(search_queries)
+
+    with span("rank_videos", category="search", candidates=len(scored_videos)):
+        candidate_videos, _ = rank_videos(query, scored_videos)
+    return candidate_videos, len(search_queries)
+
+def is_confident_pick(candidate_videos, tier):
+    if tier != "high_confidence" or not candidate_videos:
+        return False
+    best = candidate_videos[0]
+    # Only stop early when the leader also sits in the preferred 15-120s duration buckets
+    return best.get("_duration_rank", 999) <= 5
+
+def incremental_search(query, search_queries, results_per_query, min_duration_seconds, max_duration_seconds):
+    all_videos = {}
+    scored_videos = []
+    candidate_videos = []
+    variants_searched = 0
+    
+    for search_query in rank_search_variants(query, search_queries):
+        # Degrade to cached responses only once the daily quota can no longer cover a search
+        cache_only = quota_remaining() < SEARCH_QUOTA_COST + DETAILS_QUOTA_COST
+        if cache_only and variants_searched == 0:
+            print("YouTube API daily quota budget exhausted - serving cached search results only")
+        
+        new_videos = {}
+        for video in search_videos(search_query, results_per_query, cache_only=cache_only):
+            if video["id"] not in all_videos:
+                all_videos[video["id"]] = video
+                new_videos[video["id"]] = video
+        variants_searched += 1
+        
+        if new_videos:
+            detail_items = fetch_video_details(list(new_videos), cache_only=cache_only)
+            if detail_items:
+                scored_videos.extend(apply_video_details(new_videos, detail_items, min_duration_seconds, max_duration_seconds))
+        
+        if scored_videos:
+            with span("rank_videos", category="search", candidates=len(scored_videos)):
+                candidate_videos, tier = rank_videos(query, scored_videos)
+            if variants_searched >= EARLY_STOP_MIN_VARIANTS and is_confident_pick(candidate_videos, tier):
+                print(f"Stopping search early after {variants_searched}/{len(search_queries)} query variants")
+                break
+    
+    if not all_videos:
+        print("No videos found from YouTube search")
+    
+    record_variant_yield(query, candidate_videos[:SHORTLIST_SIZE])
+    return candidate_videos, variants_searched
+
+def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration_seconds=20, return_shortlist=False, shortlist_size=SHORTLIST_SIZE, search_mode=None):
+    search_queries = create_search_queries(query)
+    results_per_query = max(10, max_results // len(search_queries) + 5)
+    
+    if search_mode is None:
+        search_mode = SEARCH_MODE
+    
+    with span(f"{search_mode}_search", category="search", variants=len(search_queries)):
+        if search_mode == "incremental":
+            filtered_videos, variants_searched = incremental_search(query, search_queries, results_per_query, min_duration_seconds, max_duration_seconds)
+        else:
+            filtered_videos, variants_searched = exhaustive_search(query, search_queries, results_per_query, min_duration_seconds, max_duration_seconds)
 
     if filtered_videos:
         best_video = filtered_videos[0]
@@ -427,13 +524,7 @@ def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration
             like_ratio = video.get('like_to_view_ratio', 0)
             title = video.get('title', '')
             
-            # Calculate quality score for display (same formula as selection)
-            duration_rank = get_duration_rank(duration)
-            duration_score = 1.0 / (duration_rank + 1)
-            view_reliability = min(views / 10000, 1.0)
-            weighted_engagement = like_ratio * 1000 * (0.3 + 0.7 * view_reliability)
-            popularity_score = min(views / 30000, 1.0)
-            quality_score = (duration_score * 2.0) + weighted_engagement + (popularity_score * 2.0)
+            quality_score = video.get('quality_score', 0.0)
             keyword_ratio = video.get('key_word_match_ratio', 0)
             
             video_url = video.get('url', '')
@@ -468,7 +559,13 @@ def get_best_video(query, max_results=30, max_duration_seconds=120, min_duration
         'resolution': best_video.get('definition', 'unknown'),
         'views': best_video.get('views', 0),
         'likes': best_video.get('likes', 0),
-        'like_to_view_ratio': best_video.get('like_to_view_ratio', 0)
+        'like_to_view_ratio': best_video.get('like_to_view_ratio', 0),
+        'search_mode': search_mode,
+        'search_variants_used': variants_searched,
+        'search_variants_available': len(search_queries)
     }
     
+    if return_shortlist:
+        return filtered_videos[:shortlist_size]
+    
     return best_video
@@ -0,0 +1,108 @@
+"""Parse-failure rate and tokens per frame with and without grammar-constrained decoding.
+
+    python -m benchmarks.constrained_decoding --output constrained.json
+    python -m benchmarks.constrained_decoding --video-id VIDEO_ID --query "turn on dark mode"
+
+By default the prompts run through the tiny random models from benchmarks.tiny_models
+on CPU, once per mode (free, constrained, and each with the draft model for assisted
+decoding), with the generation settings run_osatlas_optimized uses. Random weights
+make free-form output a worst case, so the tiny run shows what the grammar
+guarantees rather than OS-Atlas quality. With --video-id, run_osatlas_optimized runs
+on an already extracted video with the real model (GPU required) and the output memo
+off, and the report takes parse_failure_rate_percent and avg_tokens_per_frame from
+its metrics.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+
+MODES = {
+    "free": {"constrained": False, "assisted": False},
+    "constrained": {"constrained": True, "assisted": False},
+    "free_assisted": {"constrained": False, "assisted": True},
+    "constrained_assisted": {"constrained": True, "assisted": True},
+}
+TASKS = ["turn on dark mode", "change the font size", "connect to wi-fi", "turn off bluetooth",
+         "open notification settings", "check battery usage", "reset my password", "make text bigger"]
+
+def run_tiny(modes, frames, seed):
+    import torch
+    from benchmarks.tiny_models import build_tiny_models, EOS_TOKEN
+    from app.utils.osatlas import build_generation_config, generate_step_output
+    from app.utils.step_assembly import parse_osatlas_response
+
+    target, draft, processor = build_tiny_models(seed)
+    eos_token_ids = {processor.tokenizer.convert_tokens_to_ids(EOS_TOKEN)}
+    results = {}
+    for mode in modes:
+        settings = MODES[mode]
+        torch.manual_seed(seed)
+        parse_failures = generated_tokens = 0
+        seconds = 0.0
+        for index in range(frames):
+            inputs = processor.tokenizer([f"Task: {TASKS[index % len(TASKS)]}\n"], return_tensors="pt")
+            generation_config = build_generation_config(processor, inputs, eos_token_ids, settings["constrained"])
+            output_text, stats = generate_step_output(target, processor, inputs, generation_config,
+                                                      draft if settings["assisted"] else None)
+            # parse_osatlas_response prints debug lines for every failure
+            with contextlib.redirect_stdout(io.StringIO()):
+                thought, action = parse_osatlas_response(output_text.replace(EOS_TOKEN, ""))
+            parse_failures += 0 if thought and action else 1
+            generated_tokens += stats["generated_tokens"]
+            seconds += stats["decode_seconds"]
+        results[mode] = {
+            "frames": frames,
+            "parse_failure_rate_percent": round(parse_failures / frames * 100, 2),
+            "avg_tokens_per_frame": round(generated_tokens / frames, 1),
+            "avg_seconds_per_frame": round(seconds / frames, 3)
+        }
+    return results
+
+def run_video(modes, video_id, query):
+    from app.utils.osatlas import run_osatlas_optimized
+
+    results = {}
+    for mode in modes:
+        settings = MODES[mode]
+        start = time.time()
+        _, metrics = run_osatlas_optimized(query, video_id, use_assisted_decoding=settings["assisted"],
+                                           use_constrained_decoding=settings["constrained"], use_output_memo=False)
+        results[mode] = {
+            "frames": metrics["frames_processed"],
+            "parse_failure_rate_percent": metrics["parse_failure_rate_percent"],
+            "avg_tokens_per_frame": metrics["avg_tokens_per_frame"],
+            "avg_seconds_per_frame": round((time.time() - start) / max(1, metrics["frames_processed"]), 3)
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare free and grammar-constrained decoding")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--frames", type=int, default=8, help="Prompts per mode for the tiny models")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--video-id", help="Run OS-Atlas on output/videos/<id>/ui-screens instead of the tiny models")
+    parser.add_argument("--query", default=TASKS[0], help="Task for --video-id")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.video_id:
+        results = run_video(args.modes, args.video_id, args.query)
+    else:
+        results = run_tiny(args.modes, args.frames, args.seed)
+
+    print(f"{'mode':<22} {'frames':>7} {'parse fail %':>13} {'tokens/frame':>13} {'s/frame':>8}")
+    for mode, row in results.items():
+        print(f"{mode:<22} {row['frames']:>7} {row['parse_failure_rate_percent']:>13.1f} "
+              f"{row['avg_tokens_per_frame']:>13.1f} {row['avg_seconds_per_frame']:>8.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "backend": "video" if args.video_id else "tiny",
+                       "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Throughput of concurrent frame extraction + UI cropping, threads vs the shared process pool.
+
+    python -m benchmarks.cpu_pool --concurrency 8 --output cpu_pool.json
+
+A seeded synthetic video is copied under N video ids, then N requests' CPU stages
+(extract_relevant_frames followed by extract_ui_screenshots) start at once. In
+"threads" mode each one runs on its own thread, the way requests used to. In
+"processes" mode they go through CpuPool. While they run, an asyncio heartbeat
+measures how late the event loop wakes up, a stand-in for the API's responsiveness.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+from benchmarks.pipeline import generate_video
+
+HEARTBEAT_SECONDS = 0.05
+SCENARIO = {"name": "cpu_pool", "duration": 60, "orientation": "landscape", "resolution": 720, "changes_per_minute": 12}
+
+def cpu_stages(video_path, video_id):
+    from app.utils.frame_extraction import extract_relevant_frames
+    from app.utils.ui_crop import extract_ui_screenshots
+
+    frame_count, _ = extract_relevant_frames(video_path, output_folder="output/videos", video_id=video_id)
+    extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=video_id)
+    return frame_count
+
+def prepare_videos(source, concurrency):
+    videos = []
+    for index in range(concurrency):
+        video_id = f"cpu_pool_{index:02d}"
+        shutil.rmtree(os.path.join("output/videos", video_id), ignore_errors=True)
+        os.makedirs(os.path.join("output/videos", video_id), exist_ok=True)
+        video_path = os.path.join("output/videos", video_id, f"{video_id}.mp4")
+        shutil.copyfile(source, video_path)
+        videos.append((video_path, video_id))
+    return videos
+
+def run_in_thread(loop, function, *args):
+    future = loop.create_future()
+
+    def target():
+        try:
+            result = function(*args)
+            loop.call_soon_threadsafe(future.set_result, result)
+        except Exception as e:
+            loop.call_soon_threadsafe(future.set_exception, e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+async def heartbeat(stop_event, lags):
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        lags.append(time.perf_counter() - start - HEARTBEAT_SECONDS)
+
+async def run_mode(mode, videos, pool):
+    loop = asyncio.get_running_loop()
+    lags = []
+    stop_event = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop_event, lags))
+    latencies = []
+
+    async def one(video_path, video_id):
+        start = time.perf_counter()
+        if mode == "threads":
+            frame_count = await run_in_thread(loop, cpu_stages, video_path, video_id)
+        else:
+            frame_count, _ = await asyncio.wrap_future(pool.submit(cpu_stages, video_path, video_id))
+        latencies.append(time.perf_counter() - start)
+        return frame_count
+
+    start = time.perf_counter()
+    frame_counts = await asyncio.gather(*(one(path, video_id) for path, video_id in videos))
+    wall_seconds = time.perf_counter() - start
+    stop_event.set()
+    await beat
+
+    return {
+        "mode": mode,
+        "wall_seconds": round(wall_seconds, 2),
+        "videos_per_minute": round(len(videos) / wall_seconds * 60, 2),
+        "frames": int(sum(frame_counts)),
+        "latency_p50": round(float(np.percentile(latencies, 50)), 2),
+        "latency_max": round(float(max(latencies)), 2),
+        "loop_lag_p95_ms": round(float(np.percentile(lags, 95)) * 1000, 1) if lags else None,
+        "loop_lag_max_ms": round(float(max(lags)) * 1000, 1) if lags else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent CPU stages on threads and on the shared process pool")
+    parser.add_argument("--concurrency", type=int, default=8, help="Extractions started at once")
+    parser.add_argument("--modes", nargs="+", default=["threads", "processes"], choices=["threads", "processes"])
+    parser.add_argument("--workers", type=int, help="Process pool size (defaults to CPU_POOL_WORKERS)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="Directory for the synthetic video and output (defaults to a temp dir)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="cpu_pool_bench_")
+    # Pipeline paths are relative to the working directory, which the pool workers inherit
+    os.chdir(workdir)
+    source = os.path.join(workdir, "synthetic.mp4")
+    if not os.path.exists(source):
+        print("Generating synthetic video")
+        generate_video(source, SCENARIO, args.seed)
+
+    from app.utils.cpu_pool import CpuPool, CPU_POOL_WORKERS
+    pool = CpuPool(workers=args.workers or CPU_POOL_WORKERS, max_queued=args.concurrency)
+    results = []
+    try:
+        for mode in args.modes:
+            if mode == "processes":
+                pool.start()
+            videos = prepare_videos(source, args.concurrency)
+            print(f"Running {args.concurrency} concurrent extractions on {mode}...")
+            result = asyncio.run(run_mode(mode, videos, pool))
+            print(json.dumps(result, indent=2))
+            results.append(result)
+    finally:
+        pool.shutdown()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "concurrency": args.concurrency,
+        "pool_workers": pool.workers,
+        "video": SCENARIO,
+        "results": results
+    }
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
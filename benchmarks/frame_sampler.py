@@ -0,0 +1,95 @@
+"""Compare frame samplers on the synthetic benchmark videos.
+
+    python -m benchmarks.frame_sampler --samplers uniform scene changepoint --output samplers.json
+
+Every scenario from benchmarks.pipeline runs through extract_relevant_frames once per
+sampler, with screen-change rates adjusted so cuts do not all fall on keyframes. The
+report has frames kept (each one is a model call later) next to extraction time and
+the part of it spent on the sampler's own analysis, then frames decoded, screen recall,
+transitions detected and the frames the perceptual-hash index dropped. Recall is the
+share of the video's synthetic screens that have at least one kept frame.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.pipeline import SCENARIOS, VIDEO_FPS, generate_video, scenario_key, screen_length
+
+SAMPLERS = ["uniform", "scene", "changepoint"]
+# mp4v writes a keyframe every 12 frames, and the pipeline scenarios' screen lengths (60, 900 and
+# 300 frames) are multiples of 12, so every cut would land on a regular keyframe. These rates move
+# most cuts off the GOP grid, as in real recordings.
+CHANGE_RATE_OVERRIDES = {"fast_portrait": 29, "static_landscape": 2.4, "long_landscape": 7}
+
+def screen_recall(scenario, frame_numbers):
+    length = screen_length(scenario)
+    screens = -(-scenario["duration"] * VIDEO_FPS // length)
+    return round(len({frame // length for frame in frame_numbers}) / screens, 3)
+
+def run_sampler(sampler, scenario, video_path, output_folder):
+    import app.utils.frame_extraction as frame_extraction
+
+    video_id = f"{scenario['name']}_{sampler}"
+    shutil.rmtree(os.path.join(output_folder, video_id), ignore_errors=True)
+    frame_extraction.FRAME_SAMPLER = sampler
+    start = time.perf_counter()
+    frame_count, metrics = frame_extraction.extract_relevant_frames(video_path, output_folder=output_folder, video_id=video_id)
+    seconds = time.perf_counter() - start
+    return {
+        "sampler": metrics["sampler"],
+        "seconds": round(seconds, 3),
+        "frames_decoded": metrics["frames_decoded"],
+        "frames_kept": frame_count,
+        # Packet scan (scene) or change signal (changepoint), included in seconds
+        "analysis_seconds": metrics.get("analysis_seconds", metrics.get("packet_scan_seconds")),
+        "screen_recall": screen_recall(scenario, metrics["saved_frame_numbers"]),
+        "transitions_detected": metrics.get("transitions_detected"),
+        "segments_detected": metrics.get("segments_detected"),
+        "gpu_calls_avoided": metrics.get("gpu_calls_avoided", 0),
+        "non_adjacent_duplicates_dropped": metrics.get("non_adjacent_duplicates_dropped", 0)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare frame samplers on synthetic phone-UI videos")
+    parser.add_argument("--samplers", nargs="+", default=SAMPLERS, choices=SAMPLERS)
+    parser.add_argument("--scenarios", nargs="+", help="Only run these scenarios")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="Directory for synthetic videos and extracted frames (defaults to a temp dir)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="frame_sampler_")
+    output_folder = os.path.join(workdir, "output", "videos")
+    os.makedirs(workdir, exist_ok=True)
+    scenarios = [
+        dict(s, changes_per_minute=CHANGE_RATE_OVERRIDES.get(s["name"], s["changes_per_minute"]))
+        for s in SCENARIOS if not args.scenarios or s["name"] in args.scenarios
+    ]
+
+    results = []
+    for scenario in scenarios:
+        video_path = os.path.join(workdir, f"{scenario['name']}_{scenario_key(scenario, args.seed)}.mp4")
+        if not os.path.exists(video_path):
+            print(f"Generating synthetic video for {scenario['name']}")
+            generate_video(video_path, scenario, args.seed)
+        for sampler in args.samplers:
+            results.append(dict(run_sampler(sampler, scenario, video_path, output_folder), scenario=scenario["name"]))
+
+    print(f"{'scenario':<18} {'sampler':<12} {'kept':>6} {'seconds':>8} {'analysis':>9} {'decoded':>8} {'recall':>7} {'transitions':>12} {'deduped':>8}")
+    for row in results:
+        transitions = "-" if row["transitions_detected"] is None else row["transitions_detected"]
+        analysis = "-" if row["analysis_seconds"] is None else f"{row['analysis_seconds']:.2f}"
+        print(f"{row['scenario']:<18} {row['sampler']:<12} {row['frames_kept']:>6} {row['seconds']:>8.2f} {analysis:>9} {row['frames_decoded']:>8} "
+              f"{row['screen_recall']:>7.2f} {transitions:>12} {row['gpu_calls_avoided']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": args.seed, "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Concurrent load test for the /process-query-stream SSE endpoint.
+
+    python -m benchmarks.load_test --concurrency 5 20 50 --output load_results.json
+    python -m benchmarks.load_test --url http://localhost:4000 --concurrency 5
+
+By default the app is served in-process by uvicorn. YouTube search, the yt-dlp
+download and OS-Atlas are replaced by local stand-ins with fixed latencies, while
+frame extraction and UI cropping run for real on a synthetic video. For every
+concurrency level, all streams open at once while /health is polled. The report
+has time-to-first-event, time-to-first-step (the first frame reaching the model)
+and total latency as p50/p95/p99, plus /health latency under load.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+
+HEALTH_POLL_SECONDS = 0.25
+SYNTHETIC_SCENARIO = {"name": "load_test", "duration": 20, "orientation": "portrait", "resolution": 480, "changes_per_minute": 18}
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values)
+    return {
+        "count": int(values.size),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3)
+    }
+
+def install_stand_ins(main, video_source, search_seconds, download_seconds, frame_seconds):
+    counter = {"next": 0}
+    counter_lock = threading.Lock()
+
+    def fake_get_best_video(query, return_shortlist=False, **kwargs):
+        time.sleep(search_seconds)
+        with counter_lock:
+            counter["next"] += 1
+            number = counter["next"]
+        # A unique video per request keeps every stream on the uncached path
+        video = {"url": f"https://www.youtube.com/watch?v=load{number:07d}", "title": f"Synthetic tutorial {number}",
+                 "duration_seconds": SYNTHETIC_SCENARIO["duration"], "views": 1000}
+        return [video] if return_shortlist else video
+
+    def fake_download_video(video_url, output_folder="output/videos", video_id=None, **kwargs):
+        time.sleep(download_seconds)
+        video_path = os.path.join(output_folder, video_id, f"{video_id}.mp4")
+        os.makedirs(os.path.dirname(video_path), exist_ok=True)
+        shutil.copyfile(video_source, video_path)
+        return video_path, {"profile": "stand-in", "file_size_bytes": os.path.getsize(video_path)}
+
+    def fake_run_osatlas_with_progress(query, video_id, yield_progress=None):
+        frames = sorted(os.listdir(f"output/videos/{video_id}/ui-screens"))
+        result = []
+        for i, frame in enumerate(frames):
+            if yield_progress:
+                yield_progress("osatlas-processing", "active", f"Processing frame {i+1}/{len(frames)}: {frame}")
+            time.sleep(frame_seconds)
+            result.append({"step": i + 1, "thought": "Tap the highlighted option.", "action": "CLICK <point>[500,500]</point>",
+                           "image": f"/api-vnava22/images/{video_id}/step_{i+1:02d}/{frame}"})
+        return result, {"total_steps": len(result), "frames_processed": len(frames)}
+
+    main.get_best_video = fake_get_best_video
+    main.download_video = fake_download_video
+    main.run_osatlas_with_progress = fake_run_osatlas_with_progress
+
+def serve_in_process(port, workdir, search_seconds, download_seconds, frame_seconds):
+    import uvicorn
+    from benchmarks.pipeline import generate_video
+
+    # The app reads and writes output/ and test/ relative to the working directory
+    os.chdir(workdir)
+    video_source = os.path.join(workdir, "synthetic.mp4")
+    generate_video(video_source, SYNTHETIC_SCENARIO, seed=7)
+
+    import app.main as main
+    install_stand_ins(main, video_source, search_seconds, download_seconds, frame_seconds)
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def run_stream(base_url, query, timeout):
+    record = {"query": query, "ttfe": None, "time_to_first_step": None, "total": None, "status": "incomplete"}
+    start = time.perf_counter()
+    try:
+        with requests.get(f"{base_url}/process-query-stream", params={"query": query}, stream=True, timeout=timeout) as response:
+            # chunk_size=1 so each event is timed when it arrives, not when a read buffer fills
+            for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                elapsed = time.perf_counter() - start
+                if record["ttfe"] is None:
+                    record["ttfe"] = elapsed
+                event = json.loads(line[len("data: "):])
+                if (record["time_to_first_step"] is None and event.get("step") == "osatlas-processing"
+                        and event.get("message", "").startswith("Processing frame")):
+                    record["time_to_first_step"] = elapsed
+                if event.get("step") == "complete":
+                    record["status"] = "success"
+                elif event.get("status") == "error":
+                    record["status"] = "error"
+    except requests.RequestException as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["total"] = time.perf_counter() - start
+    return record
+
+def poll_health(base_url, stop_event, latencies):
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        try:
+            requests.get(f"{base_url}/health", timeout=30)
+            latencies.append(time.perf_counter() - start)
+        except requests.RequestException:
+            latencies.append(float("nan"))
+        stop_event.wait(HEALTH_POLL_SECONDS)
+
+def run_level(base_url, concurrency, timeout):
+    records = [None] * concurrency
+    health_latencies = []
+    stop_event = threading.Event()
+    health_thread = threading.Thread(target=poll_health, args=(base_url, stop_event, health_latencies), daemon=True)
+
+    def user(index):
+        records[index] = run_stream(base_url, f"load test query {concurrency}-{index}", timeout)
+
+    users = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    health_thread.start()
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    stop_event.set()
+    health_thread.join()
+    wall_seconds = time.perf_counter() - start
+
+    completed = [r for r in records if r["status"] == "success"]
+    health_ok = [latency for latency in health_latencies if latency == latency]
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 2),
+        "streams_completed": len(completed),
+        "streams_failed": concurrency - len(completed),
+        "time_to_first_event": percentiles([r["ttfe"] for r in records if r["ttfe"] is not None]),
+        "time_to_first_step": percentiles([r["time_to_first_step"] for r in records if r["time_to_first_step"] is not None]),
+        "total_latency": percentiles([r["total"] for r in completed]),
+        "health_latency": percentiles(health_ok),
+        "health_failures": len(health_latencies) - len(health_ok)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SSE query endpoint with concurrent streams")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5, 20, 50], help="Simultaneous streams per level")
+    parser.add_argument("--url", help="Test an already running server instead of serving the app with stand-ins")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--search-seconds", type=float, default=0.3, help="Stand-in YouTube search latency")
+    parser.add_argument("--download-seconds", type=float, default=1.0, help="Stand-in download latency")
+    parser.add_argument("--frame-seconds", type=float, default=0.2, help="Stand-in model latency per frame")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-stream read timeout in seconds")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    server = None
+    if not args.url:
+        workdir = tempfile.mkdtemp(prefix="load_test_")
+        server = serve_in_process(args.port, workdir, args.search_seconds, args.download_seconds, args.frame_seconds)
+
+    levels = []
+    for concurrency in args.concurrency:
+        print(f"Running {concurrency} concurrent streams...")
+        level = run_level(base_url, concurrency, args.timeout)
+        print(json.dumps(level, indent=2))
+        levels.append(level)
+
+    if server:
+        server.should_exit = True
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": args.url or "in-process with stand-ins",
+        "stand_ins": None if args.url else {
+            "search_seconds": args.search_seconds,
+            "download_seconds": args.download_seconds,
+            "frame_seconds": args.frame_seconds,
+            "video": SYNTHETIC_SCENARIO
+        },
+        "levels": levels
+    }
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if all(level["streams_failed"] == 0 for level in levels) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""Reproducible end-to-end benchmark of the media and inference stages on synthetic videos.
+
+    python -m benchmarks.pipeline --output pipeline_baseline.json
+    python -m benchmarks.pipeline --compare pipeline_baseline.json --threshold 20
+
+Generates seeded phone-UI tutorial videos (duration, orientation, resolution and
+screen-change rate vary per scenario). Each one runs through extract_relevant_frames,
+extract_ui_screenshots and run_osatlas_optimized, with the model replaced by a fake
+backend that answers in the OS-Atlas format at a fixed decode speed. Reports follow
+the performance_metrics.json schema. In compare mode the exit status is 1 when any
+stage is slower than the baseline by more than the threshold.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+
+SCENARIOS = [
+    {"name": "short_portrait", "duration": 30, "orientation": "portrait", "resolution": 720, "changes_per_minute": 12},
+    {"name": "fast_portrait", "duration": 45, "orientation": "portrait", "resolution": 1080, "changes_per_minute": 30},
+    {"name": "medium_landscape", "duration": 60, "orientation": "landscape", "resolution": 720, "changes_per_minute": 8},
+    {"name": "static_landscape", "duration": 60, "orientation": "landscape", "resolution": 480, "changes_per_minute": 2},
+    {"name": "long_landscape", "duration": 120, "orientation": "landscape", "resolution": 1080, "changes_per_minute": 6},
+]
+
+STAGES = ["frame-extraction", "ui-screens", "osatlas-processing"]
+VIDEO_FPS = 30
+FAKE_TOKENS_PER_STEP = 48
+FAKE_PROMPT_TOKENS = 900
+FAKE_VISION_TOKENS = 1200
+UI_LABELS = ["Settings", "Display", "Wi-Fi", "Bluetooth", "Accessibility", "Text size", "Dark mode",
+             "Notifications", "Privacy", "Battery", "Sounds", "General", "About", "Passwords"]
+QUERY = "How do I make the text bigger on my phone?"
+
+def scenario_key(scenario, seed):
+    raw = json.dumps(dict(scenario, seed=seed, fps=VIDEO_FPS), sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()[:10]
+
+def draw_screen(width, height, screen_index, rng):
+    screen = np.full((height, width, 3), 245, dtype=np.uint8)
+    accent = tuple(int(c) for c in rng.integers(40, 200, size=3))
+    row_height = max(24, height // 12)
+    font_scale = max(0.4, width / 700)
+
+    cv2.rectangle(screen, (0, 0), (width, row_height // 2), (30, 30, 30), -1)
+    cv2.rectangle(screen, (0, row_height // 2), (width, row_height * 2), accent, -1)
+    title = UI_LABELS[screen_index % len(UI_LABELS)]
+    cv2.putText(screen, title, (width // 20, int(row_height * 1.5)), cv2.FONT_HERSHEY_SIMPLEX, font_scale * 1.2, (255, 255, 255), 2)
+
+    labels = rng.choice(UI_LABELS, size=8)
+    for row, label in enumerate(labels):
+        top = row_height * (2 + row)
+        cv2.line(screen, (width // 20, top + row_height), (width - width // 20, top + row_height), (210, 210, 210), 1)
+        cv2.circle(screen, (width // 10, top + row_height // 2), row_height // 4, accent, -1)
+        cv2.putText(screen, str(label), (width // 5, top + int(row_height * 0.65)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (40, 40, 40), 1)
+
+    button_top = height - row_height * 2
+    cv2.rectangle(screen, (width // 5, button_top), (width - width // 5, button_top + row_height), accent, -1)
+    return screen
+
+def screen_length(scenario):
+    # Frames each synthetic screen stays up, screen i covers frames [i * length, (i + 1) * length)
+    total_frames = scenario["duration"] * VIDEO_FPS
+    return max(1, int(total_frames / max(1, scenario["duration"] * scenario["changes_per_minute"] / 60)))
+
+def generate_video(path, scenario, seed):
+    rng = np.random.default_rng(seed)
+    short_side = scenario["resolution"]
+    long_side = int(round(short_side * 16 / 9)) // 2 * 2
+    if scenario["orientation"] == "portrait":
+        width, height = short_side, long_side
+        phone_w, phone_h = int(width * 0.96), int(height * 0.96)
+    else:
+        width, height = long_side, short_side
+        phone_h = int(height * 0.92)
+        phone_w = int(phone_h * 9 / 19.5)
+    phone_x, phone_y = (width - phone_w) // 2, (height - phone_h) // 2
+
+    background = np.full((height, width, 3), (96, 112, 128), dtype=np.uint8)
+    total_frames = scenario["duration"] * VIDEO_FPS
+    frames_per_screen = screen_length(scenario)
+    # A few fixed noise fields stand in for camera and compression noise between screen changes
+    noise = [rng.integers(-6, 7, size=(height, width, 3), dtype=np.int16) for _ in range(4)]
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), VIDEO_FPS, (width, height))
+    screen = None
+    for frame_number in range(total_frames):
+        if frame_number % frames_per_screen == 0:
+            screen = draw_screen(phone_w - 16, phone_h - 16, frame_number // frames_per_screen, rng)
+            frame_base = background.copy()
+            cv2.rectangle(frame_base, (phone_x, phone_y), (phone_x + phone_w, phone_y + phone_h), (20, 20, 20), -1)
+            frame_base[phone_y + 8:phone_y + phone_h - 8, phone_x + 8:phone_x + phone_w - 8] = screen
+            tap = (int(phone_x + phone_w * rng.uniform(0.2, 0.8)), int(phone_y + phone_h * rng.uniform(0.2, 0.9)))
+
+        frame = frame_base.copy()
+        # Tap indicator grows while the presenter "presses" the next element
+        progress = (frame_number % frames_per_screen) / frames_per_screen
+        if progress > 0.6:
+            cv2.circle(frame, tap, int(6 + 20 * (progress - 0.6)), (0, 0, 255), 2)
+        frame = np.clip(frame.astype(np.int16) + noise[frame_number % len(noise)], 0, 255).astype(np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+class FakeTokenizer:
+    eos_token_id = 0
+
+    def convert_tokens_to_ids(self, token):
+        return 1
+
+class FakeInputs:
+    def __init__(self, image_path):
+        self.image_path = image_path
+        # FakeTokenizer maps every special token to 1, so these ids stand in for the vision tokens
+        self.input_ids = np.array([[1] * FAKE_VISION_TOKENS + [2] * FAKE_PROMPT_TOKENS])
+
+    def to(self, device):
+        return self
+
+class FakeProcessor:
+    tokenizer = FakeTokenizer()
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return ""
+
+    def __call__(self, text=None, images=None, padding=True, return_tensors="pt"):
+        return FakeInputs(images[0] if images else None)
+
+class FakeBackend:
+    """Stands in for Qwen2-VL: answers from the screenshot content at a fixed decode speed."""
+
+    def __init__(self, tokens_per_second):
+        self.tokens_per_second = tokens_per_second
+
+    def process_vision_info(self, messages):
+        images = [part["image"] for message in messages for part in message["content"] if part["type"] == "image"]
+        return images, None
+
+    def generate_step_output(self, model, processor, inputs, generation_config, assistant_model=None):
+        start = time.time()
+        image = cv2.imread(inputs.image_path, cv2.IMREAD_GRAYSCALE)
+        digest = hashlib.sha1(cv2.resize(image, (16, 16)).tobytes()).digest()
+        label = UI_LABELS[digest[0] % len(UI_LABELS)]
+        x, y = 100 + digest[1] * 3, 150 + digest[2] * 3
+        output_text = (
+            f"Thought: Tap the '{label}' option to open its settings page and continue with the task.\n"
+            f"Action: CLICK <point>[{x},{y}]</point>"
+        )
+        if self.tokens_per_second > 0:
+            time.sleep(max(0.0, FAKE_TOKENS_PER_STEP / self.tokens_per_second - (time.time() - start)))
+        decode_seconds = time.time() - start
+        return output_text, {
+            "generated_tokens": FAKE_TOKENS_PER_STEP,
+            "decode_seconds": round(decode_seconds, 3),
+            "tokens_per_second": round(FAKE_TOKENS_PER_STEP / decode_seconds, 2) if decode_seconds > 0 else 0,
+            "prefill_seconds": 0,
+            "decode_tokens_per_second": round((FAKE_TOKENS_PER_STEP - 1) / decode_seconds, 2) if decode_seconds > 0 else 0
+        }
+
+def install_fake_backend(osatlas, tokens_per_second):
+    backend = FakeBackend(tokens_per_second)
+    osatlas.model = object()
+    osatlas.processor = FakeProcessor()
+    osatlas.process_vision_info = backend.process_vision_info
+    osatlas.generate_step_output = backend.generate_step_output
+    osatlas.cleanup_gpu_memory = gc.collect
+
+def run_scenario(scenario, video_path, repeats, run_inference):
+    from app.utils.frame_extraction import extract_relevant_frames
+    from app.utils.ui_crop import extract_ui_screenshots
+
+    durations = {stage: [] for stage in STAGES}
+    frame_metrics, osatlas_metrics = {}, {}
+    video_id = scenario["name"]
+
+    for _ in range(repeats):
+        start = time.time()
+        frame_count, frame_metrics = extract_relevant_frames(video_path, output_folder="output/videos", video_id=video_id)
+        durations["frame-extraction"].append(time.time() - start)
+
+        start = time.time()
+        extract_ui_screenshots(input_folder="output/videos", output_folder="output/videos", video_id=video_id)
+        durations["ui-screens"].append(time.time() - start)
+
+        if run_inference:
+            from app.utils.osatlas import run_osatlas_optimized
+            start = time.time()
+            # Memo off: repeats after the first would otherwise replay stored outputs instead of running the model
+            _, osatlas_metrics = run_osatlas_optimized(QUERY, video_id, use_assisted_decoding=False,
+                                                       use_constrained_decoding=False, use_output_memo=False)
+            durations["osatlas-processing"].append(time.time() - start)
+
+    timing = {stage: {"duration": round(statistics.median(values), 3)} for stage, values in durations.items() if values}
+    timing["total"] = {"duration": round(sum(entry["duration"] for entry in timing.values()), 3)}
+    return {
+        "video_id": video_id,
+        "query": QUERY,
+        "timing": timing,
+        "video_metadata": {
+            "duration_seconds": scenario["duration"],
+            "orientation": scenario["orientation"],
+            "resolution": scenario["resolution"],
+            "changes_per_minute": scenario["changes_per_minute"]
+        },
+        "frame_extraction": frame_metrics,
+        "osatlas_processing": osatlas_metrics,
+        "frame_count": frame_metrics.get("frame_count", 0),
+        "total_steps_generated": osatlas_metrics.get("total_steps", 0)
+    }
+
+def run_suite(scenarios, workdir, repeats, seed, tokens_per_second, run_inference):
+    videos_dir = os.path.join(workdir, "synthetic")
+    os.makedirs(videos_dir, exist_ok=True)
+    # run_osatlas_optimized reads and writes relative to output/, keep that inside the work directory
+    os.chdir(workdir)
+
+    if run_inference:
+        import app.utils.osatlas as osatlas
+        install_fake_backend(osatlas, tokens_per_second)
+
+    results = []
+    for scenario in scenarios:
+        video_path = os.path.join(videos_dir, f"{scenario['name']}_{scenario_key(scenario, seed)}.mp4")
+        if not os.path.exists(video_path):
+            print(f"Generating synthetic video for {scenario['name']}")
+            generate_video(video_path, scenario, seed)
+        results.append(run_scenario(scenario, video_path, repeats, run_inference))
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "settings": {
+            "seed": seed,
+            "repeats": repeats,
+            "fake_tokens_per_second": tokens_per_second,
+            "osatlas": run_inference
+        },
+        "scenarios": results
+    }
+
+def compare_reports(current, baseline, threshold_percent, min_seconds):
+    baseline_by_name = {entry["video_id"]: entry for entry in baseline["scenarios"]}
+    rows, regressions = [], []
+    for entry in current["scenarios"]:
+        previous = baseline_by_name.get(entry["video_id"])
+        if not previous:
+            continue
+        for stage in STAGES + ["total"]:
+            if stage not in entry["timing"] or stage not in previous["timing"]:
+                continue
+            now = entry["timing"][stage]["duration"]
+            before = previous["timing"][stage]["duration"]
+            change = (now - before) / before * 100 if before > 0 else 0
+            row = {"scenario": entry["video_id"], "stage": stage, "baseline": before, "current": now, "change_percent": round(change, 1)}
+            rows.append(row)
+            # Tiny stages jitter by more than any sensible percentage, require an absolute slowdown as well
+            if change > threshold_percent and now - before > min_seconds:
+                regressions.append(row)
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic phone-UI videos")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against a previous report and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed slowdown per stage in percent (default 20)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--scenarios", nargs="+", help="Only run these scenarios")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per scenario, the median is reported")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--fake-tokens-per-second", type=float, default=0, help="Simulated decode speed of the fake model (0 = no delay)")
+    parser.add_argument("--skip-osatlas", action="store_true", help="Only benchmark frame extraction and UI cropping")
+    parser.add_argument("--workdir", help="Directory for synthetic videos and pipeline output (defaults to a temp dir)")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.scenarios or s["name"] in args.scenarios]
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="pipeline_bench_")
+
+    report = run_suite(scenarios, workdir, args.repeats, args.seed, args.fake_tokens_per_second, not args.skip_osatlas)
+
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps([{"scenario": entry["video_id"], **{stage: value["duration"] for stage, value in entry["timing"].items()}}
+                      for entry in report["scenarios"]], indent=2))
+
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+        rows, regressions = compare_reports(report, baseline, args.threshold, args.min_seconds)
+        for row in rows:
+            flag = "REGRESSION" if row in regressions else "ok"
+            print(f"{row['scenario']:<18} {row['stage']:<20} {row['baseline']:>8.3f}s -> {row['current']:>8.3f}s ({row['change_percent']:+.1f}%) {flag}")
+        if regressions:
+            print(f"{len(regressions)} stage(s) slowed down by more than {args.threshold}%")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
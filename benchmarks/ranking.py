@@ -0,0 +1,122 @@
+"""Micro-benchmark for candidate deduplication and ranking in youtube_search.
+
+    python -m benchmarks.ranking --queries 1000 --candidates 60 --variants 6
+
+For every synthetic query, each search variant returns an overlapping page of
+candidates. The benchmark merges the pages and matches video details back to
+the candidates twice: with the dict index used by exhaustive_search and
+apply_video_details, and with the list scans they replaced. Both must produce
+the same candidates. The merged sets are then ranked with rank_candidate_sets.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from app.utils.youtube_search import apply_video_details, rank_candidate_sets
+
+WORDS = ["change", "font", "size", "iphone", "android", "settings", "wifi", "bluetooth",
+         "password", "reset", "whatsapp", "uber", "schedule", "ride", "volume", "turn", "on"]
+
+def synthetic_search_pages(query_count, candidates_per_query, variants, seed=7):
+    rng = random.Random(seed)
+    searches = {}
+    for q in range(query_count):
+        query = " ".join(rng.sample(WORDS, 3)) + f" {q}"
+        pool = [{
+            "id": f"q{q}v{c}",
+            "title": " ".join(rng.sample(WORDS, 5)),
+        } for c in range(candidates_per_query)]
+        page_size = max(1, candidates_per_query // 2)
+        pages = [[dict(video) for video in rng.sample(pool, page_size)] for _ in range(variants)]
+        details = []
+        for video in pool:
+            views = rng.randint(0, 200000)
+            details.append({
+                "id": video["id"],
+                "contentDetails": {"duration": f"PT{rng.randint(20, 120)}S", "definition": "hd"},
+                "statistics": {"viewCount": str(views), "likeCount": str(rng.randint(0, max(1, views // 20)))},
+                "snippet": {"description": " ".join(rng.sample(WORDS, 8)), "channelTitle": "bench"},
+            })
+        rng.shuffle(details)
+        searches[query] = (pages, details)
+    return searches
+
+def indexed_merge(pages, details):
+    all_videos = {}
+    for page in pages:
+        for video in page:
+            all_videos.setdefault(video["id"], video)
+    return apply_video_details(all_videos, details, 0, 10 ** 6)
+
+def legacy_merge(pages, details):
+    all_videos = []
+    for page in pages:
+        for video in page:
+            if not any(v["id"] == video["id"] for v in all_videos):
+                all_videos.append(video)
+    # Verbatim copy of the previous apply_video_details loop
+    scored_videos = []
+    for item in details:
+        duration_str = item["contentDetails"]["duration"]
+        definition = item["contentDetails"].get("definition", "sd")
+        hours = int(re.search(r'(\d+)H', duration_str).group(1)) if re.search(r'(\d+)H', duration_str) else 0
+        minutes = int(re.search(r'(\d+)M', duration_str).group(1)) if re.search(r'(\d+)M', duration_str) else 0
+        seconds = int(re.search(r'(\d+)S', duration_str).group(1)) if re.search(r'(\d+)S', duration_str) else 0
+        total_seconds = hours * 3600 + minutes * 60 + seconds
+        for vr in all_videos:
+            if vr["id"] == item["id"]:
+                vr["duration_seconds"] = total_seconds
+                vr["views"] = int(item["statistics"].get("viewCount", 0))
+                vr["likes"] = int(item["statistics"].get("likeCount", 0))
+                vr["definition"] = definition
+                vr["description"] = item["snippet"].get("description", "")
+                vr["channel"] = item["snippet"].get("channelTitle", "")
+                vr["like_to_view_ratio"] = vr["likes"] / vr["views"] if vr["views"] > 0 else 0
+                scored_videos.append(vr)
+                break
+    return scored_videos
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candidate deduplication and ranking")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--candidates", type=int, default=60)
+    parser.add_argument("--variants", type=int, default=6, help="Search variants whose pages overlap per query")
+    args = parser.parse_args()
+
+    searches = synthetic_search_pages(args.queries, args.candidates, args.variants)
+
+    start = time.perf_counter()
+    legacy = {query: legacy_merge(pages, details) for query, (pages, details) in searches.items()}
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate_sets = {query: indexed_merge(pages, details) for query, (pages, details) in searches.items()}
+    indexed_seconds = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for query in searches
+        if [v["id"] for v in candidate_sets[query]] != [v["id"] for v in legacy[query]]
+    )
+
+    start = time.perf_counter()
+    rank_candidate_sets(candidate_sets)
+    ranking_seconds = time.perf_counter() - start
+    ranked = sum(len(videos) for videos in candidate_sets.values())
+
+    print(json.dumps({
+        "queries": args.queries,
+        "candidates_per_query": args.candidates,
+        "variants_per_query": args.variants,
+        "legacy_merge_seconds": round(legacy_seconds, 4),
+        "indexed_merge_seconds": round(indexed_seconds, 4),
+        "merge_speedup": round(legacy_seconds / indexed_seconds, 2) if indexed_seconds > 0 else None,
+        "ranking_seconds": round(ranking_seconds, 4),
+        "ranked_candidates_per_second": round(ranked / ranking_seconds) if ranking_seconds > 0 else 0,
+        "candidate_mismatches": mismatches
+    }, indent=2))
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
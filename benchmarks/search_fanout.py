@@ -0,0 +1,130 @@
+"""Replay benchmark for the incremental YouTube search fan-out.
+
+Record fixtures once against the live API (needs YOUTUBE_API_KEY set in youtube_search):
+
+    python -m benchmarks.search_fanout --record queries.txt --fixtures search_fixtures.json
+
+Then compare exhaustive and incremental search offline:
+
+    python -m benchmarks.search_fanout --fixtures search_fixtures.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import app.utils.youtube_search as youtube_search
+import app.utils.search_variants as search_variants
+from app.utils.api_cache import normalize_params, cached_api_get
+
+QUOTA_COSTS = {"search": 100, "videos": 1}
+
+def load_queries(path):
+    with open(path, 'r') as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line).get("query") or json.loads(line).get("title") for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+def search_key(params):
+    return json.dumps(normalize_params(params), sort_keys=True)
+
+def record_fixtures(queries, fixtures_path):
+    fixtures = {"queries": queries, "search": {}, "videos": {}}
+
+    def recording_get(url, params, cache_only=False):
+        response = cached_api_get(url, params, cache_only=cache_only)
+        endpoint = url.rsplit("/", 1)[-1]
+        if response and "error" not in response:
+            if endpoint == "search":
+                fixtures["search"][search_key(params)] = response
+            else:
+                for item in response.get("items", []):
+                    fixtures["videos"][item["id"]] = item
+        return response
+
+    youtube_search.cached_api_get = recording_get
+    for query in queries:
+        youtube_search.get_best_video(query, search_mode="exhaustive")
+
+    with open(fixtures_path, 'w') as f:
+        json.dump(fixtures, f)
+    print(f"Recorded {len(fixtures['search'])} search and {len(fixtures['videos'])} video fixtures to {fixtures_path}")
+
+class ReplayApi:
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.calls = {"search": 0, "videos": 0}
+
+    def __call__(self, url, params, cache_only=False):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if endpoint == "search":
+            return self.fixtures["search"].get(search_key(params), {"items": []})
+        ids = params["id"].split(",")
+        return {"items": [self.fixtures["videos"][video_id] for video_id in ids if video_id in self.fixtures["videos"]]}
+
+    def quota_units(self):
+        return sum(QUOTA_COSTS[endpoint] * count for endpoint, count in self.calls.items())
+
+def run_mode(fixtures, query, search_mode):
+    replay = ReplayApi(fixtures)
+    youtube_search.cached_api_get = replay
+    shortlist = youtube_search.get_best_video(query, search_mode=search_mode, return_shortlist=True) or []
+    return [video["id"] for video in shortlist], replay
+
+def replay_benchmark(fixtures_path, output_path=None):
+    with open(fixtures_path, 'r') as f:
+        fixtures = json.load(f)
+
+    # Keep the benchmark from touching the live quota ledger and variant statistics
+    youtube_search.quota_remaining = lambda: youtube_search.SEARCH_QUOTA_COST * 1000
+    search_variants.VARIANT_YIELD_FILE = os.path.join(tempfile.mkdtemp(), "variant_yield.json")
+
+    rows = []
+    for query in fixtures["queries"]:
+        exhaustive_ids, exhaustive_api = run_mode(fixtures, query, "exhaustive")
+        incremental_ids, incremental_api = run_mode(fixtures, query, "incremental")
+        rows.append({
+            "query": query,
+            "exhaustive_calls": sum(exhaustive_api.calls.values()),
+            "incremental_calls": sum(incremental_api.calls.values()),
+            "exhaustive_quota_units": exhaustive_api.quota_units(),
+            "incremental_quota_units": incremental_api.quota_units(),
+            "top1_agreement": bool(exhaustive_ids) and exhaustive_ids[:1] == incremental_ids[:1],
+            "top3_overlap": len(set(exhaustive_ids[:3]) & set(incremental_ids[:3])) / 3 if exhaustive_ids else 0
+        })
+
+    count = len(rows) or 1
+    summary = {
+        "queries": len(rows),
+        "exhaustive_calls_per_query": round(sum(r["exhaustive_calls"] for r in rows) / count, 2),
+        "incremental_calls_per_query": round(sum(r["incremental_calls"] for r in rows) / count, 2),
+        "exhaustive_quota_per_query": round(sum(r["exhaustive_quota_units"] for r in rows) / count, 1),
+        "incremental_quota_per_query": round(sum(r["incremental_quota_units"] for r in rows) / count, 1),
+        "top1_agreement_percent": round(sum(r["top1_agreement"] for r in rows) / count * 100, 2),
+        "top3_overlap_percent": round(sum(r["top3_overlap"] for r in rows) / count * 100, 2)
+    }
+
+    report = {"summary": summary, "queries": rows}
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exhaustive and incremental YouTube search on recorded API fixtures")
+    parser.add_argument("--fixtures", required=True, help="Fixture file to record into or replay from")
+    parser.add_argument("--record", metavar="QUERIES", help="Record fixtures for the queries in this file (.txt or .jsonl)")
+    parser.add_argument("--output", help="Write the per-query report as JSON")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(load_queries(args.record), args.fixtures)
+        return 0
+
+    replay_benchmark(args.fixtures, args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
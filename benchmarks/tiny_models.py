@@ -0,0 +1,62 @@
+"""Tiny random causal LMs for exercising the decoding code paths on CPU.
+
+    python -m benchmarks.tiny_models output/tiny_models
+
+Builds a character-level tokenizer and two GPT-2 models that share it: a target
+and a smaller draft for assisted decoding. The weights are random, so outputs are
+meaningless, but generation, logits processors and the forward-call accounting in
+generate_step_output run exactly as they do with OS-Atlas. Passing a directory
+saves both models there so they can be loaded from a local path.
+"""
+import os
+import string
+import sys
+from types import SimpleNamespace
+
+EOS_TOKEN = "<|im_end|>"
+PAD_TOKEN = "<|endoftext|>"
+VOCAB_CHARS = string.ascii_letters + string.digits + string.punctuation + " \n"
+
+def build_tokenizer():
+    from tokenizers import Tokenizer, Regex, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {token: index for index, token in enumerate([PAD_TOKEN, EOS_TOKEN] + list(VOCAB_CHARS))}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token=PAD_TOKEN))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split(Regex(r"[\s\S]"), behavior="isolated")
+    tokenizer.decoder = decoders.Fuse()
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token=EOS_TOKEN, pad_token=PAD_TOKEN,
+                                   additional_special_tokens=[EOS_TOKEN, PAD_TOKEN])
+
+def build_model(tokenizer, layers, seed):
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(tokenizer), n_embd=32, n_layer=layers, n_head=2, n_positions=1024,
+                        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id,
+                        pad_token_id=tokenizer.pad_token_id)
+    return GPT2LMHeadModel(config).eval()
+
+def build_tiny_models(seed=0):
+    """Returns (target, draft, processor); processor mimics the parts of AutoProcessor the pipeline uses."""
+    tokenizer = build_tokenizer()
+    target = build_model(tokenizer, layers=2, seed=seed)
+    draft = build_model(tokenizer, layers=1, seed=seed + 1)
+    processor = SimpleNamespace(tokenizer=tokenizer, batch_decode=tokenizer.batch_decode)
+    return target, draft, processor
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        return 1
+    target, draft, processor = build_tiny_models()
+    for name, model in (("target", target), ("draft", draft)):
+        path = os.path.join(sys.argv[1], name)
+        model.save_pretrained(path)
+        processor.tokenizer.save_pretrained(path)
+        print(f"Saved tiny {name} model to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Scaling benchmark of the UI cropping stage over thread-pool sizes.
+
+    python -m benchmarks.ui_crop_scaling --workers 1 2 4 8 16 --output ui_crop_scaling.json
+    python -m benchmarks.ui_crop_scaling --fixture output/videos --video-id <id>
+
+Without --fixture a seeded synthetic phone-UI video is rendered and sampled into a
+frames/ directory, the same layout extract_relevant_frames produces. For every
+worker count extract_ui_screenshots runs with a dedicated pool of that size. The
+report has the median wall time, frames per second and the speedup over one worker.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import cv2
+
+from benchmarks.pipeline import generate_video
+
+FIXTURE_VIDEO_ID = "ui_crop_fixture"
+FIXTURE_SCENARIO = {"name": "ui_crop_fixture", "duration": 60, "orientation": "landscape", "resolution": 1080, "changes_per_minute": 30}
+
+def build_fixture(videos_dir, frame_count, seed):
+    frames_dir = os.path.join(videos_dir, FIXTURE_VIDEO_ID, "frames")
+    if os.path.isdir(frames_dir) and len(os.listdir(frames_dir)) >= frame_count:
+        return frames_dir
+    os.makedirs(frames_dir, exist_ok=True)
+    video_path = os.path.join(videos_dir, FIXTURE_VIDEO_ID, f"{FIXTURE_VIDEO_ID}.mp4")
+    print(f"Generating a {frame_count}-frame fixture")
+    generate_video(video_path, FIXTURE_SCENARIO, seed)
+
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    stride = max(1, total // frame_count)
+    for index in range(frame_count):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index * stride)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        cv2.imwrite(os.path.join(frames_dir, f"frame_{index:03d}.jpg"), frame)
+    cap.release()
+    return frames_dir
+
+def run_workers(videos_dir, video_id, workers, repeats):
+    from app.utils.ui_crop import extract_ui_screenshots
+
+    output_dir = os.path.join(videos_dir, video_id, "ui-screens")
+    durations = []
+    metrics = None
+    for _ in range(repeats):
+        shutil.rmtree(output_dir, ignore_errors=True)
+        start = time.perf_counter()
+        metrics = extract_ui_screenshots(input_folder=videos_dir, output_folder=videos_dir, video_id=video_id, workers=workers)
+        durations.append(time.perf_counter() - start)
+    seconds = statistics.median(durations)
+    frames = metrics["successful"] if metrics else 0
+    return {
+        "workers": workers,
+        "seconds": round(seconds, 3),
+        "frames": frames,
+        "frames_per_second": round(frames / seconds, 1) if seconds > 0 else 0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark UI cropping throughput across thread-pool sizes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Pool sizes to measure")
+    parser.add_argument("--fixture", help="Videos directory holding <video-id>/frames (defaults to a synthetic fixture)")
+    parser.add_argument("--video-id", default=FIXTURE_VIDEO_ID)
+    parser.add_argument("--frames", type=int, default=120, help="Frames in the synthetic fixture")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per pool size, the median is reported")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.fixture:
+        videos_dir = os.path.abspath(args.fixture)
+    else:
+        videos_dir = os.path.join(tempfile.gettempdir(), "ui_crop_bench")
+        build_fixture(videos_dir, args.frames, args.seed)
+
+    results = []
+    for workers in args.workers:
+        result = run_workers(videos_dir, args.video_id, workers, args.repeats)
+        results.append(result)
+    baseline = results[0]["seconds"]
+    for result in results:
+        result["speedup"] = round(baseline / result["seconds"], 2) if result["seconds"] > 0 else 0
+        print(f"{result['workers']:>3} workers: {result['seconds']:>7.3f}s {result['frames_per_second']:>8.1f} frames/s x{result['speedup']}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "fixture": os.path.join(videos_dir, args.video_id, "frames"),
+        "repeats": args.repeats,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("transformers")
+
+import torch
+from transformers import LogitsProcessorList
+from benchmarks.tiny_models import build_tiny_models, EOS_TOKEN
+from app.utils.action_grammar import ActionGrammarLogitsProcessor, INITIAL_STATES, advance, matches_grammar
+
+@pytest.fixture(scope="module")
+def tiny_models():
+    return build_tiny_models()
+
+def token_ids(processor, text):
+    return processor.tokenizer(text).input_ids
+
+def test_matches_grammar():
+    assert matches_grammar("Thought: Tap the gear icon\nAction: CLICK <point>[120, 455]</point>")
+    assert not matches_grammar("The screen shows settings")
+
+def test_row_state_follows_rolled_back_tokens(tiny_models):
+    _, _, processor = tiny_models
+    eos = processor.tokenizer.convert_tokens_to_ids(EOS_TOKEN)
+    grammar = ActionGrammarLogitsProcessor(processor.tokenizer, 0, {eos})
+
+    grammar.row_state(0, token_ids(processor, "Thought: Tap Wi-Fi\nAction: CLICK <point>[1"))
+    # A rejected draft continuation is rolled back and a different one takes its place
+    rolled_back = grammar.row_state(0, token_ids(processor, "Thought: Tap Wi-Fi\nAction: SCROLL"))
+
+    assert rolled_back == advance(INITIAL_STATES, "Thought: Tap Wi-Fi\nAction: SCROLL")
+    assert grammar.row_state(0, token_ids(processor, "Thought: Tap")) == advance(INITIAL_STATES, "Thought: Tap")
+
+@pytest.mark.parametrize("assisted", [False, True])
+def test_constrained_output_follows_grammar(tiny_models, assisted):
+    target, draft, processor = tiny_models
+    tokenizer = processor.tokenizer
+    eos = tokenizer.convert_tokens_to_ids(EOS_TOKEN)
+    inputs = tokenizer(["Task: turn on dark mode\n"], return_tensors="pt")
+    prompt_length = inputs.input_ids.shape[1]
+
+    for seed in range(3):
+        torch.manual_seed(seed)
+        grammar = ActionGrammarLogitsProcessor(tokenizer, prompt_length, {eos})
+        output = target.generate(**inputs, max_new_tokens=120, do_sample=True, temperature=1.0,
+                                 logits_processor=LogitsProcessorList([grammar]), pad_token_id=eos,
+                                 assistant_model=draft if assisted else None)
+        text = tokenizer.decode(output[0, prompt_length:]).replace(EOS_TOKEN, "")
+        # Generation may stop at max_new_tokens, but never outside the grammar
+        assert advance(INITIAL_STATES, text), text
@@ -0,0 +1,55 @@
+import copy
+import pytest
+
+pytest.importorskip("transformers")
+pytest.importorskip("qwen_vl_utils")
+
+from transformers import AutoModelForCausalLM
+from benchmarks.tiny_models import build_tiny_models
+from app.utils.osatlas import generate_step_output
+
+GENERATION_CONFIG = dict(max_new_tokens=40, do_sample=False)
+
+@pytest.fixture(scope="module")
+def tiny_models(tmp_path_factory):
+    # Load both models back from local paths, the way OSATLAS_MODEL_ID/OSATLAS_DRAFT_MODEL_ID would
+    target, draft, processor = build_tiny_models()
+    root = tmp_path_factory.mktemp("tiny_models")
+    loaded = []
+    for name, model in (("target", target), ("draft", draft)):
+        model.save_pretrained(root / name)
+        loaded.append(AutoModelForCausalLM.from_pretrained(root / name).eval())
+    return loaded[0], loaded[1], processor
+
+def prompt(processor):
+    return processor.tokenizer(["Task: turn on dark mode\n"], return_tensors="pt")
+
+def test_standard_decoding_stats(tiny_models):
+    target, _, processor = tiny_models
+    output_text, stats = generate_step_output(target, processor, prompt(processor), GENERATION_CONFIG)
+
+    assert stats["generated_tokens"] == GENERATION_CONFIG["max_new_tokens"]
+    assert len(processor.tokenizer(output_text).input_ids) == stats["generated_tokens"]
+    assert 0 < stats["prefill_seconds"] <= stats["decode_seconds"]
+    assert stats["tokens_per_second"] > 0
+    assert stats["decode_tokens_per_second"] > 0
+    assert "acceptance_rate" not in stats
+
+def test_assisted_decoding_matches_greedy_output(tiny_models):
+    target, draft, processor = tiny_models
+    baseline, _ = generate_step_output(target, processor, prompt(processor), GENERATION_CONFIG)
+    output_text, stats = generate_step_output(target, processor, prompt(processor), GENERATION_CONFIG, assistant_model=draft)
+
+    # Greedy assisted decoding only changes the speed, never the tokens
+    assert output_text == baseline
+    assert stats["draft_tokens_proposed"] > 0
+    assert 0 <= stats["draft_tokens_accepted"] <= stats["draft_tokens_proposed"]
+    assert stats["acceptance_rate"] == round(stats["draft_tokens_accepted"] / stats["draft_tokens_proposed"], 3)
+
+def test_identical_draft_is_always_accepted(tiny_models):
+    target, _, processor = tiny_models
+    _, stats = generate_step_output(target, processor, prompt(processor), GENERATION_CONFIG,
+                                    assistant_model=copy.deepcopy(target))
+
+    assert stats["acceptance_rate"] == 1.0
+    assert stats["draft_tokens_accepted"] == stats["draft_tokens_proposed"]
@@ -0,0 +1,45 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import app.batch as batch
+
+class InlinePool(ThreadPoolExecutor):
+    # Threads stand in for the spawned media workers so the stages can be patched
+    def __init__(self, max_workers, mp_context=None):
+        super().__init__(max_workers=max_workers)
+
+def test_media_work_is_dispatched_while_inference_runs(tmp_path, monkeypatch):
+    media_started_during_inference = threading.Event()
+    inference_running = threading.Event()
+
+    def search_stage(query):
+        if query == "second":
+            # This search finishes only once the first video is already in inference
+            inference_running.wait(5)
+        return {"query": query, "candidates": [{"url": f"https://www.youtube.com/watch?v={query}"}], "search_seconds": 0}
+
+    def media_stage(query, candidates):
+        if inference_running.is_set():
+            media_started_during_inference.set()
+        return {"query": query, "video_id": query, "status": "ready", "frame_count": 1, "timings": {}}
+
+    def inference_stage(query, video_id):
+        if video_id == "first":
+            inference_running.set()
+            # Holds the inference thread until the dispatch loop has sent the other video to the pool
+            assert media_started_during_inference.wait(5)
+        return [{"step": 1}], 0.0
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(batch, "search_stage", search_stage)
+    monkeypatch.setattr(batch, "media_stage", media_stage)
+    monkeypatch.setattr(batch, "inference_stage", inference_stage)
+    monkeypatch.setattr(batch, "is_video_cached", lambda video_id: False)
+    monkeypatch.setattr(batch, "extract_video_id", lambda url: url.rsplit("=", 1)[1])
+
+    checkpoint = tmp_path / "batch.checkpoint.jsonl"
+    batch.run_batch(["first", "second"], str(checkpoint), workers=2)
+
+    records = [json.loads(line) for line in checkpoint.read_text().splitlines()]
+    assert media_started_during_inference.is_set()
+    assert {record["query"]: record["status"] for record in records} == {"first": "done", "second": "done"}
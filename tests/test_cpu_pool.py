@@ -0,0 +1,45 @@
+import os
+import pytest
+
+pytest.importorskip("skimage")
+
+from concurrent.futures.process import BrokenProcessPool
+from app.utils.cpu_pool import CpuPool
+from app.utils.tracing import span, start_trace, end_trace
+
+def traced_work(size):
+    with span("fill_buffer", size=size):
+        buffer = bytearray(size)
+    return len(buffer)
+
+def crash_worker():
+    os._exit(1)
+
+@pytest.fixture
+def pool():
+    pool = CpuPool(workers=1, max_queued=2)
+    yield pool
+    pool.shutdown()
+
+def test_worker_spans_and_usage_reach_the_parent(pool):
+    trace = start_trace("cpu pool test", sample_rate=1.0)
+    try:
+        result, usage = pool.run(traced_work, 1 << 20)
+    finally:
+        end_trace()
+
+    assert result == 1 << 20
+    assert usage["worker_pid"] != os.getpid()
+    for key in ("worker_cpu_seconds", "worker_peak_rss_mb", "worker_bytes_read", "worker_bytes_written"):
+        assert key in usage
+    worker_events = {event["name"]: event for event in trace.events if event["pid"] == usage["worker_pid"]}
+    assert set(worker_events) == {"traced_work", "fill_buffer"}
+    assert worker_events["fill_buffer"]["args"] == {"size": 1 << 20}
+
+def test_broken_pool_is_replaced(pool):
+    with pytest.raises(BrokenProcessPool):
+        pool.run(crash_worker)
+
+    result, usage = pool.run(traced_work, 16)
+    assert result == 16
+    assert pool.status()["in_flight"] == 0
@@ -0,0 +1,31 @@
+from app.utils.metrics_store import RequestMetrics
+
+def test_fallback_candidate_keeps_only_winner_stages():
+    run_metrics = RequestMetrics("turn on wifi")
+    stage_resources = {"video-search": {"cpu_seconds": 0.1}}
+    run_metrics.record("failed", "video-search", 1.0, {
+        "video_metadata": {"title": "first", "candidate_rank": 1},
+        "system_efficiency": {"stage_resources": stage_resources}
+    })
+    run_metrics.record("failed", "video-download", 4.0, {"video_download": {"format_id": "22"}})
+    stage_resources["frame-extraction"] = {"cpu_seconds": 3.0}
+    run_metrics.record("failed", "frame-extraction", 3.0, {"frame_count": 0, "frame_extraction": {"decoded_frames": 900}})
+
+    run_metrics.start_candidate("winner")
+    run_metrics.record("winner", "video-search", 1.0, {"video_metadata": {"title": "second", "candidate_rank": 2}})
+    run_metrics.record("winner", "video-download", 2.0, {"video_download": {"resumed_bytes": 0}})
+
+    data = run_metrics.data
+    assert data["video_id"] == "winner"
+    assert set(data["timing"]) == {"video-search", "video-download"}
+    assert data["timing"]["video-download"]["duration"] == 2.0
+    assert data["video_download"] == {"resumed_bytes": 0}
+    assert data["frame_extraction"] == {}
+    assert data["video_metadata"]["title"] == "second"
+    assert "frame-extraction" not in data["system_efficiency"]["stage_resources"]
+
+    [failed] = data["failed_candidates"]
+    assert failed["video_id"] == "failed"
+    assert failed["timing"] == {"video-download": {"duration": 4.0}, "frame-extraction": {"duration": 3.0}}
+    assert failed["frame_extraction"] == {"decoded_frames": 900}
+    assert failed["stage_resources"] == {"frame-extraction": {"cpu_seconds": 3.0}}
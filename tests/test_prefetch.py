@@ -0,0 +1,39 @@
+from app.utils.cache import video_claims
+from app.utils.prefetch import VideoPrefetcher
+
+class RecordingDownloader:
+    def __init__(self):
+        self.calls = []
+        self.claimed_during_download = []
+
+    def download(self, video_url, video_folder):
+        self.calls.append(video_url)
+        self.claimed_during_download.append(video_claims.is_claimed(video_folder.rsplit("/", 1)[-1]))
+        return f"{video_folder}/video.mp4", {"downloaded_bytes": 1}
+
+def make_prefetcher(tmp_path):
+    prefetcher = VideoPrefetcher(output_folder=str(tmp_path))
+    prefetcher.downloader = RecordingDownloader()
+    return prefetcher
+
+def test_prefetch_skips_claimed_video(tmp_path):
+    prefetcher = make_prefetcher(tmp_path)
+    assert video_claims.try_acquire("claimedvid01")
+    try:
+        prefetcher.prefetch([{"url": "https://www.youtube.com/watch?v=claimedvid01"}])
+        video_path, _ = prefetcher.get("claimedvid01", timeout=5)
+    finally:
+        video_claims.release("claimedvid01")
+
+    assert video_path is None
+    assert prefetcher.downloader.calls == []
+    assert not (tmp_path / "claimedvid01").exists()
+
+def test_prefetch_holds_claim_while_downloading(tmp_path):
+    prefetcher = make_prefetcher(tmp_path)
+    prefetcher.prefetch([{"url": "https://www.youtube.com/watch?v=freevideo01"}])
+    video_path, _ = prefetcher.get("freevideo01", timeout=5)
+
+    assert video_path.endswith("freevideo01/video.mp4")
+    assert prefetcher.downloader.claimed_during_download == [True]
+    assert not video_claims.is_claimed("freevideo01")
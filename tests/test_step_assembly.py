@@ -0,0 +1,57 @@
+import os
+import json
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from app.utils.step_assembly import reprocess_video, reprocess_videos, save_raw_outputs
+
+VIDEO_ID = "reprocess_test"
+FRAMES = ["frame_0001.jpg", "frame_0002.jpg"]
+OUTPUTS = {
+    "frame_0001.jpg": "Thought: Open the settings\nAction: CLICK <point>[500, 500]</point>",
+    "frame_0002.jpg": "Thought: Turn on Wi-Fi\nAction: CLICK <point>[200, 300]</point>",
+}
+
+@pytest.fixture
+def video_folders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    screens = os.path.join("output/videos", VIDEO_ID, "ui-screens")
+    steps = os.path.join("output/videos", VIDEO_ID, "os_atlas_steps")
+    os.makedirs(screens)
+    os.makedirs(os.path.join(steps, "step_01"))
+    with open(os.path.join(steps, "step_01", "step_details.json"), 'w') as f:
+        json.dump({"step_number": 1, "thought": "previous"}, f)
+    for frame in FRAMES:
+        cv2.imwrite(os.path.join(screens, frame), np.full((200, 100, 3), 255, np.uint8))
+    save_raw_outputs(steps, {
+        "video_id": VIDEO_ID,
+        "frames": FRAMES,
+        "outputs": {frame: {"output_text": text, "width": 100, "height": 200} for frame, text in OUTPUTS.items()}
+    })
+    return screens, steps
+
+def test_reprocess_swaps_in_new_steps(video_folders):
+    _, steps = video_folders
+    result, metrics = reprocess_video(VIDEO_ID)
+
+    assert metrics["total_steps"] == 2
+    assert sorted(name for name in os.listdir(steps) if name.startswith("step_")) == ["step_01", "step_02"]
+    assert os.path.exists(os.path.join(steps, "raw_outputs.json"))
+    assert not [name for name in os.listdir(os.path.dirname(steps)) if name.startswith(".os_atlas_steps")]
+    with open(f"output/video_cache/{VIDEO_ID}.json") as f:
+        assert json.load(f) == result
+
+def test_missing_screen_keeps_previous_steps(video_folders):
+    screens, steps = video_folders
+    os.remove(os.path.join(screens, FRAMES[1]))
+
+    report = reprocess_videos([VIDEO_ID])
+
+    assert VIDEO_ID in report["errors"]
+    assert report["reprocessed"] == {}
+    assert sorted(name for name in os.listdir(steps) if name.startswith("step_")) == ["step_01"]
+    with open(os.path.join(steps, "step_01", "step_details.json")) as f:
+        assert json.load(f)["thought"] == "previous"
+    assert not os.path.exists(f"output/video_cache/{VIDEO_ID}.json")
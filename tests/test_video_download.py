@@ -0,0 +1,189 @@
+import os
+import sys
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.video_download import VideoDownloader
+
+# Video-only DASH representations at three sizes plus one muxed stream, all served by the local server
+RESOLUTIONS = {"v360": (640, 360), "v720": (1280, 720), "v1080": (1920, 1080), "muxed": (854, 480)}
+
+MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT1S" minBufferTime="PT1S"
+     profiles="urn:mpeg:dash:profile:isoff-on-demand:2011">
+  <Period>
+    <AdaptationSet mimeType="video/mp4">
+      <Representation id="v360" codecs="avc1.4d401e" width="640" height="360" bandwidth="200000"><BaseURL>v360.mp4</BaseURL></Representation>
+      <Representation id="v720" codecs="avc1.4d401f" width="1280" height="720" bandwidth="800000"><BaseURL>v720.mp4</BaseURL></Representation>
+      <Representation id="v1080" codecs="avc1.640028" width="1920" height="1080" bandwidth="2000000"><BaseURL>v1080.mp4</BaseURL></Representation>
+    </AdaptationSet>
+    <AdaptationSet mimeType="video/mp4">
+      <Representation id="muxed" codecs="avc1.4d401e,mp4a.40.2" width="854" height="480" bandwidth="500000"><BaseURL>muxed.mp4</BaseURL></Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static files with single-range support, so yt-dlp can resume .part files."""
+
+    broken_paths = set()
+    slow_paths = set()
+    # Bytes sent in 206 responses; the generic extractor's probe GET is a plain request
+    ranged_bytes = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        if self.path.lstrip("/") in self.slow_paths:
+            time.sleep(1.5)
+        if self.path.lstrip("/") in self.broken_paths:
+            self.send_error(404)
+            return None
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start, _, end = range_header.replace("bytes=", "").partition("-")
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            self.send_error(416)
+            return None
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return LimitedReader(f, end - start + 1)
+
+    def copyfile(self, source, outputfile):
+        data = source.read()
+        outputfile.write(data)
+        if isinstance(source, LimitedReader):
+            path = self.path.lstrip("/")
+            self.ranged_bytes[path] = self.ranged_bytes.get(path, 0) + len(data)
+
+class LimitedReader:
+    def __init__(self, f, length):
+        self.f = f
+        self.length = length
+
+    def read(self):
+        return self.f.read(self.length)
+
+    def close(self):
+        self.f.close()
+
+def write_fixture_video(path, width, height):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (width, height))
+    for i in range(10):
+        writer.write(np.full((height, width, 3), i * 20, np.uint8))
+    writer.release()
+
+@pytest.fixture(scope="module")
+def media_server(tmp_path_factory):
+    root = tmp_path_factory.mktemp("media")
+    for name, (width, height) in RESOLUTIONS.items():
+        write_fixture_video(str(root / f"{name}.mp4"), width, height)
+    (root / "tutorial.mpd").write_text(MANIFEST)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeRequestHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", root
+    server.shutdown()
+    RangeRequestHandler.broken_paths.clear()
+
+@pytest.fixture
+def downloader():
+    return VideoDownloader(cookies_browser="")
+
+def test_minimal_profile_picks_smallest_stream_meeting_target(media_server, downloader, tmp_path):
+    base_url, root = media_server
+    video_path, metrics = downloader.download(f"{base_url}/tutorial.mpd", str(tmp_path), profile="minimal")
+
+    assert video_path is not None
+    assert metrics["profile"] == "minimal"
+    assert metrics["format_id"].endswith("v720")
+    assert metrics["resolution"] == "1280x720"
+    assert metrics["has_audio"] is False
+    assert metrics["attempts"] == 1
+    assert os.path.getsize(video_path) == os.path.getsize(root / "v720.mp4")
+
+def test_full_profile_prefers_best_muxed_stream(media_server, downloader, tmp_path):
+    base_url, root = media_server
+    video_path, metrics = downloader.download(f"{base_url}/tutorial.mpd", str(tmp_path), profile="full")
+
+    assert metrics["profile"] == "full"
+    assert metrics["format_id"].endswith("muxed")
+    assert metrics["has_audio"] is True
+    assert os.path.getsize(video_path) == os.path.getsize(root / "muxed.mp4")
+
+def test_fallback_profile_after_failed_attempts(media_server, downloader, tmp_path):
+    base_url, root = media_server
+    RangeRequestHandler.broken_paths.add("v720.mp4")
+    try:
+        video_path, metrics = downloader.download(f"{base_url}/tutorial.mpd", str(tmp_path), profile="minimal")
+    finally:
+        RangeRequestHandler.broken_paths.discard("v720.mp4")
+
+    assert video_path is not None
+    assert metrics["profile"] == "fallback"
+    assert metrics["attempts"] == 3
+    assert os.path.getsize(video_path) == os.path.getsize(root / "muxed.mp4")
+
+def test_download_metrics_count_resumed_bytes(media_server, downloader, tmp_path):
+    base_url, root = media_server
+    source = root / "v720.mp4"
+    resumed = os.path.getsize(source) // 3
+    part_file = tmp_path / "v720.mp4.part"
+    part_file.write_bytes(source.read_bytes()[:resumed])
+
+    RangeRequestHandler.ranged_bytes.clear()
+    video_path, metrics = downloader.download(f"{base_url}/v720.mp4", str(tmp_path), profile="minimal")
+
+    assert video_path is not None
+    assert open(video_path, "rb").read() == source.read_bytes()
+    assert metrics["resumed_bytes"] == resumed
+    assert metrics["downloaded_bytes"] == os.path.getsize(source) - resumed
+    assert metrics["file_size_bytes"] == os.path.getsize(source)
+    # The download itself only requested the missing tail
+    assert RangeRequestHandler.ranged_bytes["v720.mp4"] == os.path.getsize(source) - resumed
+
+def test_concurrent_downloads_do_not_queue(media_server, downloader, tmp_path):
+    base_url, _ = media_server
+    finished = {}
+
+    def fetch(name):
+        folder = tmp_path / name
+        folder.mkdir()
+        video_path, _ = downloader.download(f"{base_url}/{name}.mp4", str(folder), profile="minimal")
+        finished[name] = (time.time(), video_path)
+
+    # A background download of a slow file must not hold up a request on the same downloader
+    RangeRequestHandler.slow_paths.add("v1080.mp4")
+    try:
+        slow = threading.Thread(target=fetch, args=("v1080",))
+        stdout = sys.stdout
+        slow.start()
+        time.sleep(0.2)
+        # The rest of the server keeps its output while a background download runs
+        assert sys.stdout is stdout
+        fetch("v360")
+        slow.join()
+    finally:
+        RangeRequestHandler.slow_paths.discard("v1080.mp4")
+
+    assert finished["v360"][1] is not None and finished["v1080"][1] is not None
+    assert finished["v360"][0] < finished["v1080"][0]